@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""
+End-to-end benchmark of the emulator on a private D-Bus.
+
+Starts a private session dbus-daemon, spawns fake com.victronenergy.system, grid and acload
+producers (see producer.py), then starts the emulator with DBUS_SESSION_BUS_ADDRESS pointing to
+the private bus and reports:
+
+- startup_time_to_register_s: time from spawning the emulator until its service name is owned
+- cpu_time_per_tick_ms: user + system CPU time of the emulator divided by the ticks in the window
+- signals_per_second: PropertiesChanged/ItemsChanged signals emitted by the emulator
+- rss_kb / rss_peak_kb: resident memory of the emulator at the end of the window
+
+Requires dbus-daemon, dbus-python and PyGObject and runs on any Linux box.
+
+Example:
+    python bench_dbus.py --phases 3 --grid-meters 1 --acload-meters 1 --rate 5 --duration 30
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import monotonic, sleep
+
+import dbus
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+from driverload import BENCH_DIR, DRIVER, write_config
+
+PRODUCER = os.path.join(BENCH_DIR, "producer.py")
+
+EMULATOR_SERVICE = "com.victronenergy.vebus.ttyS3"
+
+
+def start_dbus_daemon() -> tuple:
+    """
+    Start a private session bus and return the process and its address.
+    """
+    process = subprocess.Popen(
+        ["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    address = process.stdout.readline().strip()
+    if not address:
+        process.kill()
+        raise RuntimeError("dbus-daemon did not print an address")
+    return process, address
+
+
+def cpu_seconds(pid: int) -> float:
+    """
+    Returns user + system CPU time of the process in seconds.
+    """
+    with open(f"/proc/{pid}/stat", "r") as file:
+        # the command name can contain spaces, so split after the closing bracket
+        fields = file.read().rsplit(")", 1)[1].split()
+    # utime and stime are field 14 and 15, the remainder starts at field 3
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_kb(pid: int) -> dict:
+    """
+    Returns the current and peak resident set size of the process in kB.
+    """
+    result = {}
+    with open(f"/proc/{pid}/status", "r") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                result["rss_kb"] = int(line.split()[1])
+            elif line.startswith("VmHWM:"):
+                result["rss_peak_kb"] = int(line.split()[1])
+    return result
+
+
+def wait_for_name(bus, name: str, timeout: float) -> float:
+    """
+    Poll until `name` is owned on the bus, returns the elapsed time in seconds.
+    """
+    start = monotonic()
+    while monotonic() - start < timeout:
+        if bus.name_has_owner(name):
+            return monotonic() - start
+        sleep(0.002)
+    raise TimeoutError(f"{name} did not appear on the bus within {timeout} seconds")
+
+
+class SignalCounter:
+    """
+    Counts the BusItem signals emitted by one service.
+    """
+
+    def __init__(self, bus, servicename: str):
+        self.signals = 0
+        self.ticks = 0
+        self._counting = False
+        self._match = bus.add_signal_receiver(
+            self._handler,
+            dbus_interface="com.victronenergy.BusItem",
+            bus_name=servicename,
+            path_keyword="path",
+            member_keyword="member",
+        )
+
+    def start(self):
+        self.signals = 0
+        self.ticks = 0
+        self._counting = True
+
+    def stop(self):
+        self._counting = False
+        self._match.remove()
+
+    def _handler(self, *args, path=None, member=None):
+        if not self._counting:
+            return
+        self.signals += 1
+        # /UpdateIndex changes exactly once per tick
+        if member == "PropertiesChanged" and path == "/UpdateIndex":
+            self.ticks += 1
+        elif member == "ItemsChanged" and isinstance(args[0], dict) and "/UpdateIndex" in args[0]:
+            self.ticks += 1
+
+
+def run_mainloop(seconds: float):
+    mainloop = GLib.MainLoop()
+    GLib.timeout_add(int(seconds * 1000), mainloop.quit)
+    mainloop.run()
+
+
+def run(args) -> dict:
+    processes = []
+    tmpdir = tempfile.TemporaryDirectory(prefix="dbus-multiplus-emulator-bench-")
+
+    daemon, address = start_dbus_daemon()
+    processes.append(daemon)
+
+    env = dict(os.environ)
+    env["DBUS_SESSION_BUS_ADDRESS"] = address
+    # more than one meter of a role is aggregated
+    options = {}
+    if args.grid_meters > 1:
+        options["dbus_service_name_grid"] = "com.victronenergy.grid.bench_*"
+    if args.acload_meters > 1:
+        options["dbus_service_name_ac_load"] = "com.victronenergy.acload.bench_*"
+    env["DBUS_MULTIPLUS_EMULATOR_CONFIG"] = write_config(tmpdir.name, args.phases, **options)
+
+    try:
+        DBusGMainLoop(set_as_default=True)
+        bus = dbus.bus.BusConnection(address)
+
+        # ----- PRODUCERS -----
+        producers = [("system", "com.victronenergy.system")]
+        producers += [("grid", f"com.victronenergy.grid.bench_{i}") for i in range(args.grid_meters)]
+        producers += [("acload", f"com.victronenergy.acload.bench_{i}") for i in range(args.acload_meters)]
+
+        for seed, (role, servicename) in enumerate(producers):
+            processes.append(
+                subprocess.Popen(
+                    [sys.executable, PRODUCER, "--role", role, "--service", servicename, "--rate", str(args.rate), "--phases", str(args.phases), "--seed", str(seed)],
+                    env=env,
+                )
+            )
+        for role, servicename in producers:
+            wait_for_name(bus, servicename, 30)
+
+        # ----- EMULATOR -----
+        emulator = subprocess.Popen([sys.executable, DRIVER], env=env)
+        processes.append(emulator)
+        time_to_register = wait_for_name(bus, EMULATOR_SERVICE, 60)
+
+        counter = SignalCounter(bus, EMULATOR_SERVICE)
+        run_mainloop(args.warmup)
+
+        counter.start()
+        cpu_start = cpu_seconds(emulator.pid)
+        window_start = monotonic()
+        run_mainloop(args.duration)
+        window = monotonic() - window_start
+        cpu = cpu_seconds(emulator.pid) - cpu_start
+        counter.stop()
+
+        result = {
+            "phases": args.phases,
+            "grid_meters": args.grid_meters,
+            "acload_meters": args.acload_meters,
+            "rate_hz": args.rate,
+            "window_s": round(window, 3),
+            "ticks": counter.ticks,
+            "startup_time_to_register_s": round(time_to_register, 4),
+            "cpu_time_per_tick_ms": round(cpu * 1000 / counter.ticks, 3) if counter.ticks else None,
+            "cpu_percent": round(cpu * 100 / window, 2),
+            "signals_per_second": round(counter.signals / window, 2),
+        }
+        result.update(rss_kb(emulator.pid))
+        return result
+
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        tmpdir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the emulator on a private D-Bus")
+    parser.add_argument("--phases", type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument("--grid-meters", type=int, default=1, help="number of fake com.victronenergy.grid.* producers")
+    parser.add_argument("--acload-meters", type=int, default=0, help="number of fake com.victronenergy.acload.* producers")
+    parser.add_argument("--rate", type=float, default=1.0, help="updates per second of every producer")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds to wait before measuring")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to measure")
+    args = parser.parse_args()
+
+    if args.warmup + args.duration >= 60:
+        # after 60 seconds the driver writes the energy counters to /var/volatile/tmp
+        print("WARNING: runs longer than 60 seconds need a writable /var/volatile/tmp", file=sys.stderr)
+
+    print(json.dumps(run(args), indent=4))
+
+
+if __name__ == "__main__":
+    main()
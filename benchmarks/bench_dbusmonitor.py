@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of the vendored DbusMonitor with a simulated busy bus.
+
+dispatch: a producer changes every monitored path --updates times per main loop iteration, like a
+    battery service which sends several ItemsChanged between two iterations of a loaded GX. The
+    changes are fed into DbusMonitor.handler_item_changes() and the main loop is iterated until
+    all callbacks ran. The per-path idle source of the previous implementation is measured as
+    reference.
+
+scan: --services grid producers (see producer.py) and --others acload producers, which are not in
+    the monitored tree, are started on the bus. The DbusMonitor constructor is measured with the
+    blocking scan and with the asynchronous scan: blocked_ms is the time the main loop is blocked
+    by the constructor, ready_ms the time until all services are scanned.
+
+signals: --services grid producers and --others acload producers publish at --rate. The signals
+    received by the monitor and the ones which carry a monitored path are counted with the bus
+    wide subscription and with one subscription per tracked service (scopedSignals).
+
+memory: bytes per tracked path of the records, measured with tracemalloc. "dict" are copies of the
+    classes without __slots__ and without interned paths, like before, "slots" the current ones:
+    - monitor: dbusmonitor.Service and MonitoredValue of --services services, the paths are
+      separate strings per service, like the keys of the GetItems replies
+    - imports: VeDbusItemImport of all paths of --services grid producers
+    - path_table: the exported paths of the emulator for 3 phases and --units-per-phase units
+
+The monitor runs on a private session dbus-daemon. In the dispatch scenario the signals are
+injected directly, so only the dispatch inside the process is measured.
+
+Example:
+    python bench_dbusmonitor.py dispatch --paths 100 --updates 5 --iterations 2000
+    python bench_dbusmonitor.py scan --services 40 --others 10 --concurrency 8
+    python bench_dbusmonitor.py signals --services 5 --others 20 --rate 5 --duration 10
+    python bench_dbusmonitor.py memory --services 20 --units-per-phase 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+from driverload import DRIVER_DIR
+
+sys.path.insert(1, os.path.join(DRIVER_DIR, "ext", "velib_python"))
+
+
+def create_changes(paths: list, count: int) -> list:
+    """
+    Returns `count` ItemsChanged payloads, where every path has a different value than in the payload before.
+    """
+    import dbus
+    from ve_utils import wrap_dbus_value
+
+    return [
+        dbus.Dictionary({path: {"Value": wrap_dbus_value(index + offset * 0.5), "Text": dbus.String(str(index + offset * 0.5))} for index, path in enumerate(paths)}, signature="sa{sv}") for offset in range(count)
+    ]
+
+
+def create_monitor(monitor_class, paths: list, **callbacks):
+    """
+    Returns a DbusMonitor of `monitor_class` with one injected service which monitors `paths`.
+    """
+    from dbusmonitor import MonitoredValue, Service
+
+    # no tree, so the constructor does not scan anything, the service is injected afterwards
+    monitor = monitor_class({}, **callbacks)
+    service = Service(":1.bench", "com.victronenergy.battery.bench", 0)
+    for path in paths:
+        service.paths[path] = MonitoredValue(None, None, {})
+    monitor.servicesById[service.id] = service
+    monitor.servicesByName[service.name] = service
+    return monitor, service
+
+
+def legacy_monitor_class():
+    """
+    DbusMonitor with the previous dispatch: one GLib.idle_add and one dictionary per changed value.
+    """
+    from gi.repository import GLib
+
+    from dbusmonitor import DbusMonitor
+    from ve_utils import exit_on_error
+
+    class LegacyDbusMonitor(DbusMonitor):
+        def _handler_value_changes(self, service, path, value, text):
+            try:
+                a = service.paths[path]
+            except KeyError:
+                return
+            service.set_seen(path)
+            if a.value == value:
+                return
+            a.value = value
+            a.text = text
+            if self.valueChangedCallback is not None:
+                GLib.idle_add(exit_on_error, self._execute_legacy_value_changes, service.name, path, {"Value": value, "Text": text}, a.options)
+
+        def _execute_legacy_value_changes(self, serviceName, objectPath, changes, options):
+            if serviceName not in self.servicesByName:
+                return
+            self.valueChangedCallback(serviceName, objectPath, options, changes, self.get_device_instance(serviceName))
+
+    return LegacyDbusMonitor
+
+
+def bench_dispatch(path_count: int, updates: int, iterations: int) -> dict:
+    from gi.repository import GLib
+
+    from dbusmonitor import DbusMonitor
+
+    paths = [f"/Group{i // 10}/Item{i % 10}" for i in range(path_count)]
+    changes = create_changes(paths, updates + 1)
+    context = GLib.MainContext.default()
+
+    results = {}
+    for name, monitor_class, batch in (
+        ("legacy", legacy_monitor_class(), False),
+        ("batched", DbusMonitor, False),
+        ("batched_callback", DbusMonitor, True),
+    ):
+        counters = {"callbacks": 0, "batches": 0}
+
+        def value_changed(serviceName, path, options, changes, deviceInstance):
+            counters["callbacks"] += 1
+
+        def values_changed(changes):
+            counters["batches"] += 1
+            counters["callbacks"] += len(changes)
+
+        callbacks = {"batchValueChangedCallback": values_changed} if batch else {"valueChangedCallback": value_changed}
+        monitor, service = create_monitor(monitor_class, paths, **callbacks)
+
+        received = 0
+        start = perf_counter()
+        for iteration in range(iterations):
+            # the producer is faster than the main loop
+            for update in range(updates):
+                monitor.handler_item_changes(changes[(iteration * updates + update) % len(changes)], service.id)
+                received += path_count
+            while context.pending():
+                context.iteration(False)
+        elapsed = perf_counter() - start
+
+        results[name] = {
+            "changes_received": received,
+            "callbacks": counters["callbacks"],
+            "idle_sources": counters["callbacks"] if name == "legacy" else iterations,
+            "total_s": round(elapsed, 4),
+            "us_per_change": round(elapsed * 1e6 / received, 3),
+            "us_per_iteration": round(elapsed * 1e6 / iterations, 3),
+        }
+
+    return results
+
+
+def monitored_tree() -> dict:
+    """
+    Returns the tree of the benchmarks: all paths of the grid producers, the acload producers are not monitored.
+    """
+    from producer import role_paths
+
+    options = {"code": None, "whenToLog": "configChange", "accessLevel": None}
+    return {"com.victronenergy.grid": {path: options for path in ["/DeviceInstance", "/ProductName", "/Connected"] + list(role_paths("grid", 3))}}
+
+
+def start_producers(services: int, others: int, rate: float = 1.0) -> list:
+    """
+    Start `services` grid and `others` acload producers and wait until they are on the bus.
+    """
+    import dbus
+
+    from bench_dbus import PRODUCER, wait_for_name
+
+    producers = [("grid", f"com.victronenergy.grid.bench_{i}") for i in range(services)]
+    producers += [("acload", f"com.victronenergy.acload.bench_{i}") for i in range(others)]
+    processes = [
+        subprocess.Popen([sys.executable, PRODUCER, "--role", role, "--service", servicename, "--rate", str(rate), "--phases", "3", "--seed", str(seed)]) for seed, (role, servicename) in enumerate(producers)
+    ]
+
+    bus = dbus.SessionBus()
+    for role, servicename in producers:
+        wait_for_name(bus, servicename, 30)
+    return processes
+
+
+def stop_processes(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+
+def bench_scan(services: int, others: int, concurrency: int, repeat: int) -> dict:
+    from gi.repository import GLib
+
+    from dbusmonitor import DbusMonitor
+
+    tree = monitored_tree()
+    processes = start_producers(services, others)
+
+    try:
+        results = {}
+        for name in ("blocking", "async"):
+            blocked = []
+            ready = []
+            for _ in range(repeat):
+                mainloop = GLib.MainLoop()
+                start = perf_counter()
+                if name == "blocking":
+                    monitor = DbusMonitor(tree)
+                else:
+                    monitor = DbusMonitor(tree, asyncScan=True, scanReadyCallback=mainloop.quit, maxPendingScans=concurrency)
+                blocked.append(perf_counter() - start)
+                if monitor.scanning:
+                    mainloop.run()
+                ready.append(perf_counter() - start)
+                # the next monitor must not share the work of receiving the signals
+                monitor.dbusConn.close()
+
+            results[name] = {
+                "services_monitored": len(monitor.servicesByName),
+                "blocked_ms": round(min(blocked) * 1000, 3),
+                "ready_ms": round(min(ready) * 1000, 3),
+            }
+
+        return results
+    finally:
+        stop_processes(processes)
+
+
+def counting_monitor_class():
+    """
+    DbusMonitor which counts the received signals and the ones with at least one monitored path.
+    """
+    from dbusmonitor import DbusMonitor
+
+    class CountingDbusMonitor(DbusMonitor):
+        received = 0
+        used = 0
+
+        def handler_value_changes(self, changes, path, senderId):
+            self.received += 1
+            service = self.servicesById.get(senderId)
+            if service is not None and path in service.paths:
+                self.used += 1
+            super().handler_value_changes(changes, path, senderId)
+
+        def handler_item_changes(self, items, senderId):
+            self.received += 1
+            service = self.servicesById.get(senderId)
+            if service is not None and isinstance(items, dict) and any(path in service.paths for path in items):
+                self.used += 1
+            super().handler_item_changes(items, senderId)
+
+    return CountingDbusMonitor
+
+
+def bench_signals(services: int, others: int, rate: float, duration: float) -> dict:
+    from time import process_time
+
+    from bench_dbus import run_mainloop
+
+    tree = monitored_tree()
+    processes = start_producers(services, others, rate)
+
+    try:
+        results = {}
+        for name, scoped in (("bus_wide", False), ("scoped", True)):
+            monitor = counting_monitor_class()(tree, valueChangedCallback=lambda *args: None, scopedSignals=scoped)
+            # let the matches settle before counting
+            run_mainloop(1)
+            monitor.received = monitor.used = 0
+
+            cpu_start = process_time()
+            run_mainloop(duration)
+            cpu = process_time() - cpu_start
+
+            results[name] = {
+                "services_monitored": len(monitor.servicesByName),
+                "signals_received": monitor.received,
+                "signals_used": monitor.used,
+                "used_percent": round(monitor.used * 100 / monitor.received, 2) if monitor.received else None,
+                "cpu_ms_per_s": round(cpu * 1000 / duration, 3),
+            }
+            monitor.dbusConn.close()
+
+        return results
+    finally:
+        stop_processes(processes)
+
+
+def without_slots(cls):
+    """
+    Returns a copy of `cls` with a __dict__ instead of __slots__, as reference for the memory scenario.
+    The copy has to replace the class in its module, since the methods use super(cls, self).
+    """
+    slots = set(cls.__dict__.get("__slots__", ())) | {"__slots__", "__dict__", "__weakref__"}
+    return type(cls.__name__, cls.__bases__, {name: value for name, value in cls.__dict__.items() if name not in slots})
+
+
+def measure_allocation(function) -> int:
+    """
+    Returns the bytes still allocated by `function` when it returns.
+    """
+    import gc
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = function()  # noqa: F841, kept alive until measured
+        return tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(services: int, units_per_phase: int) -> dict:
+    from sys import intern
+
+    import dbus
+    import dbusmonitor
+    import vedbus
+    from vedbus import VeDbusItemImport
+
+    from driverload import load_driver
+
+    paths = list(monitored_tree()["com.victronenergy.grid"])
+    results = {}
+
+    # ----- monitor -----
+    def monitor_records(service_class, value_class, interned):
+        records = []
+        for index in range(services):
+            service = service_class(f":1.{index}", f"com.victronenergy.grid.bench_{index}", index)
+            for path in paths:
+                # a new string per service
+                path = "/".join(path.split("/"))
+                service.paths[intern(path) if interned else path] = value_class(float(index), f"{index}W", {})
+            records.append(service)
+        return records
+
+    classes = (dbusmonitor.Service, dbusmonitor.MonitoredValue)
+    for name, (service_class, value_class), interned in (("dict", [without_slots(cls) for cls in classes], False), ("slots", classes, True)):
+        dbusmonitor.Service, dbusmonitor.MonitoredValue = service_class, value_class
+        allocated = measure_allocation(lambda: monitor_records(service_class, value_class, interned))
+        results.setdefault("monitor", {})[name] = {"paths": services * len(paths), "bytes_per_path": round(allocated / (services * len(paths)), 1)}
+    dbusmonitor.Service, dbusmonitor.MonitoredValue = classes
+
+    # ----- imports -----
+    processes = start_producers(services, 0)
+    try:
+        bus = dbus.SessionBus()
+        for name, item_class in (("dict", without_slots(VeDbusItemImport)), ("slots", VeDbusItemImport)):
+            vedbus.VeDbusItemImport = item_class
+            allocated = measure_allocation(lambda: [item_class(bus, f"com.victronenergy.grid.bench_{index}", path) for index in range(services) for path in paths])
+            results.setdefault("imports", {})[name] = {"paths": services * len(paths), "bytes_per_path": round(allocated / (services * len(paths)), 1)}
+    finally:
+        vedbus.VeDbusItemImport = VeDbusItemImport
+        stop_processes(processes)
+
+    # ----- path table -----
+    driver = load_driver(3, units_per_phase=units_per_phase)
+    device_phases = driver.get_device_phases(driver.device_configs[0])
+    compact_dbus_paths = driver.compact_dbus_paths
+    for name, compact in (("dict", lambda paths: paths), ("slots", compact_dbus_paths)):
+        # the uncached function, so every run builds its own table
+        driver.compact_dbus_paths = compact
+        table = driver.create_multiplus_dbus_paths.__wrapped__(3, device_phases)
+        allocated = measure_allocation(lambda: driver.create_multiplus_dbus_paths.__wrapped__(3, device_phases))
+        results.setdefault("path_table", {})[name] = {"paths": len(table), "bytes_per_path": round(allocated / len(table), 1)}
+    driver.compact_dbus_paths = compact_dbus_paths
+
+    return results
+
+
+def run(scenario: str, args) -> dict:
+    from dbus.mainloop.glib import DBusGMainLoop
+
+    from bench_dbus import start_dbus_daemon
+
+    daemon, address = start_dbus_daemon()
+    # DbusMonitor connects through the environment
+    os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+    try:
+        DBusGMainLoop(set_as_default=True)
+
+        result = {"scenario": scenario}
+        if scenario == "dispatch":
+            result.update({"paths": args.paths, "updates": args.updates, "iterations": args.iterations})
+            result["results"] = bench_dispatch(args.paths, args.updates, args.iterations)
+        elif scenario == "scan":
+            result.update({"services": args.services, "others": args.others, "concurrency": args.concurrency})
+            result["results"] = bench_scan(args.services, args.others, args.concurrency, args.repeat)
+        elif scenario == "signals":
+            result.update({"services": args.services, "others": args.others, "rate_hz": args.rate, "duration_s": args.duration})
+            result["results"] = bench_signals(args.services, args.others, args.rate, args.duration)
+        elif scenario == "memory":
+            result.update({"services": args.services, "units_per_phase": args.units_per_phase})
+            result["results"] = bench_memory(args.services, args.units_per_phase)
+        return result
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the vendored DbusMonitor with a simulated busy bus")
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+
+    dispatch = subparsers.add_parser("dispatch", help="dispatch of value changes to the callbacks")
+    dispatch.add_argument("--paths", type=int, default=100, help="monitored paths of the producer")
+    dispatch.add_argument("--updates", type=int, default=5, help="changes of every path per main loop iteration")
+    dispatch.add_argument("--iterations", type=int, default=2000, help="main loop iterations")
+
+    scan = subparsers.add_parser("scan", help="scan of the services on startup")
+    scan.add_argument("--services", type=int, default=40, help="monitored services on the bus")
+    scan.add_argument("--others", type=int, default=10, help="services on the bus which are not monitored")
+    scan.add_argument("--concurrency", type=int, default=8, help="maximum number of pending asynchronous scans")
+    scan.add_argument("--repeat", type=int, default=5, help="number of runs per mode, the fastest is reported")
+
+    signals = subparsers.add_parser("signals", help="signals received and used on a busy bus")
+    signals.add_argument("--services", type=int, default=5, help="monitored services on the bus")
+    signals.add_argument("--others", type=int, default=20, help="services on the bus which are not monitored")
+    signals.add_argument("--rate", type=float, default=5.0, help="updates per second of every producer")
+    signals.add_argument("--duration", type=float, default=10.0, help="seconds to measure per mode")
+
+    memory = subparsers.add_parser("memory", help="bytes per tracked path")
+    memory.add_argument("--services", type=int, default=20, help="monitored and imported services")
+    memory.add_argument("--units-per-phase", type=int, default=1, help="parallel units per phase of the exported path table")
+
+    args = parser.parse_args()
+    print(json.dumps(run(args.scenario, args), indent=4))
+
+
+if __name__ == "__main__":
+    main()
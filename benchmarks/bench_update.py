@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Benchmark of the compute path of DbusMultiPlusEmulator._update() without D-Bus.
+
+The emulator is driven with memorybus.MemoryService as output sink, memorybus.MemoryItemImport
+as inputs and a memorybus.ManualClock that advances one second per tick, so the phase ratio,
+acload and energy logic runs deterministically and as fast as possible.
+
+With --units-per-phase the emulator exports several parallel units per phase, e.g. 3 phases with
+3 or 6 units per phase emulate 9 or 18 devices (/Devices/N). startup_ms is the time to create the
+paths and the emulator including all add_path() calls.
+
+Example:
+    python bench_update.py --phases 3 --mode acload --ticks 1000000
+    python bench_update.py --phases 3 --units-per-phase 6 --ticks 100000
+    python bench_update.py --phases 3 --inverter-efficiency "5:85, 10:91, 25:95, 50:95.5, 100:94"
+    python bench_update.py --phases 3 --mode acload --smoothing "mean:60, ema:0.3"
+"""
+
+import argparse
+import json
+import random
+from time import perf_counter
+
+from driverload import load_driver
+
+START_VALUES = {
+    "Power": 500.0,
+    "Current": 2.2,
+    "Voltage": 230.0,
+    "Frequency": 50.0,
+    "Temperature": 21.0,
+    "Soc": 60.0,
+    "BatteryService": "com.victronenergy.battery.bench",
+}
+
+
+def create_items(memorybus, servicename: str, paths: tuple, phases: int) -> dict:
+    """
+    Create the input items like setup_dbus_external_items() does: paths of unused phases are None.
+    """
+    items = {}
+    for path in paths:
+        phase = next((f"L{i}" for i in range(1, 4) if f"/L{i}/" in path), None)
+        if phase is not None and int(phase[1]) > phases:
+            items[path] = None
+        else:
+            items[path] = memorybus.MemoryItemImport(servicename, path, START_VALUES.get(path.rsplit("/", 1)[1], 52.0))
+    return items
+
+
+def create_emulator(phases: int = 1, mode: str = "ratio", units_per_phase: int = 1, inverter_efficiency: str = "", smoothing: str = ""):
+    """
+    Returns the driver module, the emulator and its clock wired to in-memory inputs and outputs.
+    `smoothing` is used for the system, grid and ac load values.
+
+    The time needed to create the paths and the emulator is stored as attribute `startup_s` of the emulator.
+    """
+    driver = load_driver(phases, units_per_phase=units_per_phase, inverter_efficiency=inverter_efficiency, smoothing_system=smoothing, smoothing_grid=smoothing, smoothing_ac_load=smoothing)
+    import memorybus
+
+    clock = memorybus.ManualClock()
+    device_config = driver.device_configs[0]
+
+    start = perf_counter()
+    emulator = driver.DbusMultiPlusEmulator(
+        servicename="com.victronenergy.vebus.bench",
+        deviceinstance=275,
+        paths=driver.create_multiplus_dbus_paths(phases, driver.get_device_phases(device_config)),
+        dbusservice=memorybus.MemoryService("com.victronenergy.vebus.bench"),
+        clock=clock,
+        device_config=device_config,
+    )
+    emulator.startup_s = perf_counter() - start
+    emulator.system_items = create_items(memorybus, "com.victronenergy.system", driver.dbus_paths_system, phases)
+    emulator.grid_items = create_items(memorybus, "com.victronenergy.grid.bench", driver.dbus_paths_meter, phases)
+    emulator.ac_load_items = create_items(memorybus, "com.victronenergy.acload.bench", driver.dbus_paths_meter, phases) if mode == "acload" else {}
+    emulator.track_input_age(clock)
+
+    return driver, emulator, clock
+
+
+def run(ticks: int, phases: int, mode: str, seed: int, units_per_phase: int = 1, inverter_efficiency: str = "", smoothing: str = "") -> dict:
+    driver, emulator, clock = create_emulator(phases, mode, units_per_phase, inverter_efficiency, smoothing)
+    rng = random.Random(seed)
+
+    inputs = [item for items in (emulator.system_items, emulator.grid_items, emulator.ac_load_items) for item in items.values() if item is not None and isinstance(item.get_value(), float)]
+
+    elapsed = 0.0
+    for _ in range(ticks):
+        # change all inputs like the producers would do, not measured
+        for item in inputs:
+            item.publish(round(item.get_value() + rng.uniform(-5, 5), 2))
+        clock.advance(1)
+
+        start = perf_counter()
+        emulator._update()
+        elapsed += perf_counter() - start
+
+    return {
+        "phases": phases,
+        "mode": mode,
+        "devices": phases * units_per_phase,
+        "paths": len(emulator._dbusservice._values),
+        "startup_ms": round(emulator.startup_s * 1000, 3),
+        "ticks": ticks,
+        "total_s": round(elapsed, 4),
+        "us_per_tick": round(elapsed * 1e6 / ticks, 3),
+        "signals_per_tick": round(emulator._dbusservice.signals / ticks, 2),
+        "reads_per_tick": round(emulator._dbusservice.reads / ticks, 2),
+        "writes_per_tick": round(emulator._dbusservice.writes / ticks, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DbusMultiPlusEmulator._update() without D-Bus")
+    parser.add_argument("--phases", type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument("--mode", choices=("ratio", "acload"), default="ratio", help="ratio = split DC power by phase ratio, acload = use an AC load meter")
+    parser.add_argument("--units-per-phase", type=int, default=1, help="parallel units per phase, emulated as separate /Devices/N")
+    parser.add_argument("--inverter-efficiency", default="", help="efficiency curve like in the config.ini, e.g. '5:85, 10:91, 25:95, 50:95.5, 100:94', default lossless")
+    parser.add_argument("--smoothing", default="", help="smoothing stages of the system, grid and ac load values like in the config.ini, e.g. 'mean:60, ema:0.3', default none")
+    parser.add_argument("--ticks", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.ticks, args.phases, args.mode, args.seed, args.units_per_phase, args.inverter_efficiency, args.smoothing), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+Microbenchmarks of the vendored velib_python primitives which are on the hot paths of the driver.
+
+Every primitive is measured at 300, 1000 and 5000 exported/monitored paths on a private session
+dbus-daemon, so signals are really sent but nobody has to listen to them.
+
+The output is stable JSON (sorted keys, one entry per primitive and path count). With --save the
+result is stored as baseline, with --compare the run fails (exit code 1) if a primitive got slower
+than the baseline by more than --threshold.
+
+Example:
+    python bench_velib.py --save baseline_velib.json
+    python bench_velib.py --compare baseline_velib.json --threshold 0.15
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+
+from driverload import DRIVER_DIR
+
+sys.path.insert(1, os.path.join(DRIVER_DIR, "ext", "velib_python"))
+
+PATH_COUNTS = (300, 1000, 5000)
+
+
+def create_paths(count: int) -> dict:
+    """
+    Returns `count` paths in groups of 100 with a realistic mix of value types.
+    """
+    paths = {}
+    for i in range(count):
+        path = f"/Group{i // 100}/Sub{(i // 10) % 10}/Item{i % 10}"
+        kind = i % 10
+        if kind < 6:
+            paths[path] = float(i) + 0.5
+        elif kind < 8:
+            paths[path] = i
+        elif kind < 9:
+            paths[path] = f"text {i}"
+        else:
+            paths[path] = None
+    return paths
+
+
+def measure(function, number: int, repeat: int) -> dict:
+    """
+    Returns the minimum and median time per call in microseconds.
+    """
+    timings = [t / number * 1e6 for t in timeit.Timer(function).repeat(repeat=repeat, number=number)]
+    return {"min_us": round(min(timings), 3), "median_us": round(statistics.median(timings), 3)}
+
+
+def bench_primitives(bus, count: int, repeat: int) -> dict:
+    import dbus
+    from dbusmonitor import DbusMonitor, MonitoredValue, Service
+    from ve_utils import unwrap_dbus_value, wrap_dbus_value
+    from vedbus import VeDbusService
+
+    paths = create_paths(count)
+    results = {}
+
+    # ----- VeDbusService -----
+    service = VeDbusService(f"com.victronenergy.bench.velib_{count}", bus=bus, register=False)
+    for path, value in paths.items():
+        service.add_path(path, value, gettextcallback=lambda p, v: str(v) + "W" if isinstance(v, float) else str(v))
+    service.register()
+
+    numeric_paths = [path for path, value in paths.items() if isinstance(value, float)]
+    items = [service._dbusobjects[path] for path in numeric_paths]
+    toggle = [0]
+
+    def setitem():
+        # every call changes all numeric paths, so a signal is sent for each of them
+        toggle[0] ^= 1
+        offset = toggle[0]
+        for path in numeric_paths:
+            service[path] = offset
+
+    results["VeDbusService.__setitem__"] = measure(setitem, 1, repeat)
+    results["VeDbusService.__setitem__"]["calls_per_run"] = len(numeric_paths)
+
+    def local_set_value():
+        toggle[0] ^= 1
+        offset = toggle[0]
+        for item in items:
+            item._local_set_value(offset)
+
+    results["VeDbusItemExport._local_set_value"] = measure(local_set_value, 1, repeat)
+    results["VeDbusItemExport._local_set_value"]["calls_per_run"] = len(items)
+
+    def get_text():
+        for item in items:
+            item.GetText()
+
+    results["VeDbusItemExport.GetText"] = measure(get_text, 1, repeat)
+    results["VeDbusItemExport.GetText"]["calls_per_run"] = len(items)
+
+    root = service._dbusnodes["/"]
+    results["VeDbusRootExport.GetItems"] = measure(root.GetItems, 1, repeat)
+    results["VeDbusRootExport.GetItems"]["calls_per_run"] = 1
+
+    tree = service._dbusnodes["/Group0"]
+    results["VeDbusTreeExport._get_value_handler"] = measure(lambda: tree._get_value_handler("/Group0"), 1, repeat)
+    results["VeDbusTreeExport._get_value_handler"]["calls_per_run"] = 1
+
+    # ----- ve_utils -----
+    values = list(paths.values())
+    wrapped = [wrap_dbus_value(value) for value in values]
+
+    def wrap():
+        for value in values:
+            wrap_dbus_value(value)
+
+    def unwrap():
+        for value in wrapped:
+            unwrap_dbus_value(value)
+
+    results["wrap_dbus_value"] = measure(wrap, 1, repeat)
+    results["wrap_dbus_value"]["calls_per_run"] = len(values)
+    results["unwrap_dbus_value"] = measure(unwrap, 1, repeat)
+    results["unwrap_dbus_value"]["calls_per_run"] = len(values)
+
+    # ----- DbusMonitor -----
+    # no tree, so the constructor does not scan anything, the service is injected afterwards
+    monitor = DbusMonitor({})
+    monitored = Service(":1.bench", "com.victronenergy.bench.monitor", 0)
+    for path, value in paths.items():
+        monitored.paths[path] = MonitoredValue(value, str(value), {})
+    monitor.servicesById[monitored.id] = monitored
+    monitor.servicesByName[monitored.name] = monitored
+
+    changes = []
+    for offset in (1.0, 2.0):
+        changes.append(
+            dbus.Dictionary(
+                {path: {"Value": wrap_dbus_value(value + offset if isinstance(value, float) else value), "Text": dbus.String(str(value))} for path, value in paths.items()},
+                signature="sa{sv}",
+            )
+        )
+
+    def handler_item_changes():
+        toggle[0] ^= 1
+        monitor.handler_item_changes(changes[toggle[0]], monitored.id)
+
+    results["DbusMonitor.handler_item_changes"] = measure(handler_item_changes, 1, repeat)
+    results["DbusMonitor.handler_item_changes"]["calls_per_run"] = 1
+
+    service.__del__()
+    return results
+
+
+def run(repeat: int) -> dict:
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+
+    from bench_dbus import start_dbus_daemon
+
+    daemon, address = start_dbus_daemon()
+    # DbusMonitor connects through the environment
+    os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+    try:
+        DBusGMainLoop(set_as_default=True)
+        bus = dbus.bus.BusConnection(address)
+
+        results = {}
+        for count in PATH_COUNTS:
+            for name, result in bench_primitives(bus, count, repeat).items():
+                results[f"{name}[{count}]"] = result
+
+        return {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+            "results": results,
+        }
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list:
+    """
+    Returns the list of regressions, compared on the minimum time which is the least noisy value.
+    """
+    regressions = []
+    for name, values in sorted(result["results"].items()):
+        if name not in baseline.get("results", {}):
+            continue
+        reference = baseline["results"][name]["min_us"]
+        if reference > 0 and values["min_us"] > reference * (1 + threshold):
+            regressions.append(f"{name}: {values['min_us']} us > {reference} us (+{(values['min_us'] / reference - 1) * 100:.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the vendored velib_python primitives")
+    parser.add_argument("--repeat", type=int, default=20, help="number of runs per primitive")
+    parser.add_argument("--save", metavar="FILE", help="store the result as baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a stored baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown against the baseline, default 0.15 = 15%%")
+    args = parser.parse_args()
+
+    result = run(args.repeat)
+    output = json.dumps(result, indent=4, sort_keys=True)
+    print(output)
+
+    if args.save:
+        with open(args.save, "w") as file:
+            file.write(output + "\n")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            baseline = json.load(file)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print("REGRESSIONS against " + args.compare + ":", file=sys.stderr)
+            for regression in regressions:
+                print("  " + regression, file=sys.stderr)
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (threshold {args.threshold * 100:.0f}%)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
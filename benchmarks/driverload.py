@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+"""
+Helpers to load the driver in-process for the benchmarks.
+"""
+
+import configparser
+import importlib.util
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+DRIVER_DIR = os.path.realpath(os.path.join(BENCH_DIR, "..", "dbus-multiplus-emulator"))
+DRIVER = os.path.join(DRIVER_DIR, "dbus-multiplus-emulator.py")
+
+
+def write_config(directory: str, phases: int = 1, **options) -> str:
+    """
+    Write a config.ini based on config.sample.ini for the requested number of phases.
+    """
+    config = configparser.ConfigParser()
+    config.read(os.path.join(DRIVER_DIR, "config.sample.ini"))
+    config["DEFAULT"]["logging"] = "WARNING"
+    config["DEFAULT"]["phase_used"] = ", ".join(f"L{phase}" for phase in range(1, phases + 1))
+    for key, value in options.items():
+        config["DEFAULT"][key] = str(value)
+    config_file = os.path.join(directory, "config.ini")
+    with open(config_file, "w") as file:
+        config.write(file)
+    return config_file
+
+
+def load_driver(phases: int = 1, **options):
+    """
+    Import dbus-multiplus-emulator.py as module with a generated config file.
+
+    The energy counter and settings files are redirected to a temporary directory, which is kept as attribute
+    `bench_tmpdir` of the returned module.
+    """
+    tmpdir = tempfile.TemporaryDirectory(prefix="dbus-multiplus-emulator-bench-")
+    os.environ["DBUS_MULTIPLUS_EMULATOR_CONFIG"] = write_config(tmpdir.name, phases, **options)
+
+    if DRIVER_DIR not in sys.path:
+        sys.path.insert(0, DRIVER_DIR)
+
+    spec = importlib.util.spec_from_file_location(f"dbus_multiplus_emulator_{phases}", DRIVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.load_config()
+
+    for device_config in module.device_configs:
+        device_config["data_watt_hours_storage_file"] = os.path.join(tmpdir.name, f"data_watt_hours{device_config['name']}.json")
+        device_config["data_watt_hours_working_file"] = os.path.join(tmpdir.name, f"data_watt_hours_working{device_config['name']}.json")
+        device_config["settings_file"] = os.path.join(tmpdir.name, f"settings{device_config['name']}.json")
+    module.bench_tmpdir = tmpdir
+    return module
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+Fake Venus OS producer for the benchmarks.
+
+Publishes the paths the emulator imports for one of the roles system, grid or acload with a
+random walk at a configurable rate. Only the phases up to --phases exist on the bus.
+
+Example:
+    python producer.py --role grid --service com.victronenergy.grid.bench_0 --rate 5 --phases 3
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+
+from dbus.mainloop.glib import DBusGMainLoop
+from gi.repository import GLib
+
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "..", "dbus-multiplus-emulator", "ext", "velib_python"))
+from vedbus import VeDbusService
+
+
+def role_paths(role: str, phases: int) -> dict:
+    """
+    Returns the paths with their start values for the role.
+    """
+    paths = {}
+
+    if role == "system":
+        for phase in range(1, phases + 1):
+            paths[f"/Ac/ActiveIn/L{phase}/Power"] = 500.0
+            paths[f"/Ac/PvOnGrid/L{phase}/Power"] = 300.0
+        paths["/Dc/Battery/BatteryService"] = "com.victronenergy.battery.bench"
+        paths["/Dc/Battery/Current"] = 10.0
+        paths["/Dc/Battery/Power"] = 520.0
+        paths["/Dc/Battery/Temperature"] = 21.0
+        paths["/Dc/Battery/Voltage"] = 52.0
+        paths["/Dc/Battery/Soc"] = 60.0
+
+    elif role in ("grid", "acload"):
+        for phase in range(1, phases + 1):
+            paths[f"/Ac/L{phase}/Power"] = 500.0
+            paths[f"/Ac/L{phase}/Current"] = 2.2
+            paths[f"/Ac/L{phase}/Voltage"] = 230.0
+            paths[f"/Ac/L{phase}/Frequency"] = 50.0
+        paths["/Ac/Power"] = 500.0 * phases
+        paths["/Ac/Current"] = 2.2 * phases
+        paths["/Ac/Voltage"] = 230.0
+
+    else:
+        raise ValueError(f"Unknown role {role}")
+
+    return paths
+
+
+class Producer:
+    def __init__(self, role: str, servicename: str, phases: int, seed: int):
+        self._random = random.Random(seed)
+        self._paths = role_paths(role, phases)
+        self._service = VeDbusService(servicename, register=False)
+
+        self._service.add_path("/Mgmt/ProcessName", __file__)
+        self._service.add_path("/Mgmt/ProcessVersion", "benchmark")
+        self._service.add_path("/Mgmt/Connection", "benchmark")
+        self._service.add_path("/DeviceInstance", self._random.randint(30, 99))
+        self._service.add_path("/ProductId", 0xFFFF)
+        self._service.add_path("/ProductName", f"Benchmark {role}")
+        self._service.add_path("/Connected", 1)
+
+        for path, value in self._paths.items():
+            self._service.add_path(path, value)
+
+        self._service.register()
+
+    def publish(self):
+        """
+        Change every numeric path a little, like a real meter does.
+        """
+        for path, value in self._paths.items():
+            if isinstance(value, float):
+                value = round(value + self._random.uniform(-5, 5), 2)
+                self._paths[path] = value
+                self._service[path] = value
+
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Venus OS producer for the benchmarks")
+    parser.add_argument("--role", choices=("system", "grid", "acload"), required=True)
+    parser.add_argument("--service", required=True, help="dbus service name, e.g. com.victronenergy.grid.bench_0")
+    parser.add_argument("--rate", type=float, default=1.0, help="updates per second")
+    parser.add_argument("--phases", type=int, choices=(1, 2, 3), default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    DBusGMainLoop(set_as_default=True)
+
+    producer = Producer(args.role, args.service, args.phases, args.seed)
+
+    GLib.timeout_add(max(1, int(1000 / args.rate)), producer.publish)
+    GLib.MainLoop().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""
+Watches the config.ini for changes, so they can be applied without restarting the driver.
+
+inotify is not available in the Python of all Venus OS versions, so the modification time and the
+size of the file are polled from the GLib main loop. A stat() every few seconds costs nothing
+compared to the D-Bus traffic of the driver.
+"""
+
+import logging
+import os
+
+
+class ConfigWatcher:
+    """
+    Calls `callback` without arguments, when the modification time or the size of `filename` changed.
+
+    The file is checked every `interval` seconds after start() was called. A missing file is not a
+    change, so an editor which replaces the file does not trigger a reload of a half written file.
+    """
+
+    def __init__(self, filename: str, callback, interval: int = 5):
+        self.filename = filename
+        self.callback = callback
+        self.interval = interval
+        self.reloads = 0
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def start(self):
+        # imported here, so the module can be used without GLib, e.g. by the benchmarks
+        from gi.repository import GLib
+
+        GLib.timeout_add_seconds(self.interval, self.check)
+        logging.info(f"Watching {self.filename} for changes every {self.interval} seconds")
+
+    def check(self) -> bool:
+        """
+        Call the callback if the file changed since the last check. Has the signature of a GLib source callback.
+        """
+        signature = self._stat()
+        if signature is not None and signature != self._signature:
+            self._signature = signature
+            self.reloads += 1
+            logging.warning(f"{self.filename} changed, applying the new config")
+            try:
+                self.callback()
+            except Exception:
+                # a broken reload must not stop the watcher or the main loop
+                logging.exception("Applying the changed config failed")
+        return True
@@ -1,115 +1,267 @@
 #!/usr/bin/env python
 
-import platform
+from time import perf_counter
+
+# for --startup-profile
+time_import_started = perf_counter()
+
 import logging
 import sys
 import os
+import argparse
+import signal
 import _thread
-from time import sleep, time
-from typing import Union
+from time import monotonic, time
 import json
 import configparser  # for config/ini file
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from typing import Union
+
+# Victron Energy packages, dbus and GLib are imported when needed, so the module can be imported
+# without side effects and without dbus, e.g. by --replay and the benchmarks
+sys.path.insert(1, os.path.join(os.path.dirname(__file__), "ext", "velib_python"))
 
-import dbus
-from gi.repository import GLib
-from dbus.mainloop.glib import DBusGMainLoop
+# import driver modules
+from ringlog import LazyCall, LazyJson, TickRingBuffer
+from inputtrace import TraceRecorder
+from meteraggregate import AggregatedItem, MeterAggregator, import_sources
+from inputage import InputAge
+from supervisor import StartupError, Supervisor
+from configwatch import ConfigWatcher
+from layoutcache import layout_signature, load_layout, save_layout
+from powerflow import PowerFlow
+from efficiency import get_efficiency_curve, parse_efficiency_points
+from energycounter import EnergyCounters
+from smoothing import InputSmoothing, parse_smoothing
+from setpointforward import FORWARDED_PATHS, SetpointForwarder, parse_forward_routes
+from settingsstore import SettingsStore, is_persisted
+from tickscheduler import TickScheduler
+from tickframe import TickFrame
+
+# fields of the tick records
+tick_log_fields = (
+    "service",
+    "dc_power",
+    "dc_voltage",
+    "dc_current",
+    "source",
+    "ac_active_in_L1_power",
+    "ac_active_in_L2_power",
+    "ac_active_in_L3_power",
+    "ac_active_in_power",
+    "soc",
+)
+
+# settings, set by load_config()
+config = None
+tick_log_size = 300
+tick_log_file = "/var/volatile/tmp/dbus-multiplus-emulator_ticks.jsonl"
+trace_file = ""
+layout_cache_file = ""
+device_configs = []
+# disabled until the config is loaded
+tick_log = TickRingBuffer(fields=tick_log_fields, size=0)
+
+# service with the state of the startup, also present if the emulated devices are not (yet)
+status_service_name = "com.victronenergy.multiplusemulator"
+
+# save watthours after every x seconds
+data_watt_hours_timespan = 60
+# save file to non volatile storage after x seconds
+data_watt_hours_save = 900
 
 
-# import Victron Energy packages
-sys.path.insert(1, os.path.join(os.path.dirname(__file__), "ext", "velib_python"))
-from vedbus import VeDbusService
-from vedbus import VeDbusItemImport
+def get_device_config(section: configparser.SectionProxy, name: str = "", index: int = 0) -> dict:
+    """
+    Returns the settings of one emulated device. Values missing in a [device.*] section are taken from [DEFAULT].
+    """
+    phase_used = section["phase_used"].replace(" ", "").split(",")
+
+    # check if the phase_used list is valid
+    valid_phases = {"L1", "L2", "L3"}
+    for phase in phase_used:
+        if phase not in valid_phases:
+            raise StartupError(f"Invalid phase {phase} in phase_used list of [{section.name}]. Valid phases are {valid_phases}.")
+
+    # number of parallel units per phase, e.g. 3 for 3 MultiPlus in parallel on each phase
+    units_per_phase = int(section.get("units_per_phase", 1))
+    if units_per_phase < 1:
+        raise StartupError(f"Invalid units_per_phase {units_per_phase} in [{section.name}]. Has to be 1 or more.")
+
+    # efficiency curve of the inverter/charger, lossless if not set
+    try:
+        inverter_efficiency = parse_efficiency_points(section.get("inverter_efficiency", ""))
+    except ValueError as error:
+        raise StartupError(f"Invalid inverter_efficiency in [{section.name}]: {error}.")
+
+    # smoothing stages of the power and current values per role, not smoothed if not set
+    smoothing = {}
+    for key in ("smoothing_system", "smoothing_grid", "smoothing_ac_load"):
+        try:
+            smoothing[key] = parse_smoothing(section.get(key, ""))
+        except ValueError as error:
+            raise StartupError(f"Invalid {key} in [{section.name}]: {error}.")
+
+    # targets of the ESS setpoints written by hub4control, not forwarded if not set
+    try:
+        hub4_forward = parse_forward_routes(section.get("hub4_forward_service", ""), section.get("hub4_forward_paths", ""))
+    except ValueError as error:
+        raise StartupError(f"Invalid hub4_forward_paths in [{section.name}]: {error}.")
+    hub4_forward_interval = float(section.get("hub4_forward_interval", 0.5))
+    if hub4_forward_interval < 0:
+        raise StartupError(f"Invalid hub4_forward_interval {hub4_forward_interval} in [{section.name}]. Has to be 0 or more.")
+
+    # the files of the first device keep their names for backwards compatibility
+    suffix = "" if name == "" else "_" + name
+
+    return {
+        "name": name,
+        "servicename": section.get("service_name", "com.victronenergy.vebus.ttyS3" if name == "" else f"com.victronenergy.vebus.{name}"),
+        "deviceinstance": int(section.get("device_instance", 275 + index)),
+        "productname": section["device_name"],
+        "phase_used": phase_used,
+        "units_per_phase": units_per_phase,
+        "inverter_max_power": int(section["inverter_max_power"]),
+        "inverter_efficiency": inverter_efficiency,
+        "dbus_service_name_grid": section["dbus_service_name_grid"],
+        "dbus_service_name_ac_load": section["dbus_service_name_ac_load"],
+        "grid_frequency": int(section["grid_frequency"]),
+        "grid_nominal_voltage": int(section["grid_nominal_voltage"]),
+        # seconds without a value change after which a meter is stale, 0 to disable
+        "max_age_grid": float(section.get("max_age_grid", 60)),
+        "max_age_ac_load": float(section.get("max_age_ac_load", 60)),
+        **smoothing,
+        "hub4_forward": hub4_forward,
+        # minimum seconds between two writes to the same target service
+        "hub4_forward_interval": hub4_forward_interval,
+        # file to save watt hours on persistent storage
+        "data_watt_hours_storage_file": f"/data/etc/dbus-multiplus-emulator/data_watt_hours{suffix}.json",
+        # file to save many writing operations (best on ramdisk to not wear SD card)
+        "data_watt_hours_working_file": f"/var/volatile/tmp/dbus-multiplus-emulator_data_watt_hours{suffix}.json",
+        # file to save the settings written by the GUI or VRM, e.g. /Mode
+        "settings_file": f"/data/etc/dbus-multiplus-emulator/settings{suffix}.json",
+        # seconds without a change of the settings before they are saved
+        "settings_save_delay": float(section.get("settings_save_delay", 5)),
+    }
+
+
+def get_device_configs(config: configparser.ConfigParser) -> list:
+    """
+    Returns the settings of all emulated devices, one per [device.<name>] section or a single one from [DEFAULT].
+    """
+    sections = [section for section in config.sections() if section.startswith("device.")]
+
+    if sections == []:
+        return [get_device_config(config["DEFAULT"])]
+
+    device_configs = [get_device_config(config[section], section[len("device.") :], index) for index, section in enumerate(sections)]
+
+    # check that the devices do not collide on dbus
+    for key in ("servicename", "deviceinstance"):
+        values = [device_config[key] for device_config in device_configs]
+        if len(values) != len(set(values)):
+            raise StartupError(f"The {key} of the [device.*] sections have to be unique, got {values}.")
 
+    return device_configs
 
-# get values from config.ini file
-try:
-    config_file = (os.path.dirname(os.path.realpath(__file__))) + "/config.ini"
-    if os.path.exists(config_file):
+
+def load_data_watt_hours(data_watt_hours_working_file: str, data_watt_hours_storage_file: str) -> dict:
+    """
+    Load the energy counters to continue counting where the driver stopped, see energycounter.py.
+    """
+    # check if file in volatile storage exists
+    if os.path.isfile(data_watt_hours_working_file):
+        with open(data_watt_hours_working_file, "r") as file:
+            json_data = json.load(file)
+            logging.info("Loaded JSON of the energy counters once")
+            logging.debug("%s", LazyJson(json_data))
+    # if not, check if file in persistent storage exists
+    elif os.path.isfile(data_watt_hours_storage_file):
+        with open(data_watt_hours_storage_file, "r") as file:
+            json_data = json.load(file)
+            logging.info("Loaded JSON of the energy counters once from persistent storage")
+            logging.debug("%s", LazyJson(json_data))
+    else:
+        json_data = {}
+
+    return json_data
+
+
+def get_device_phases(device_config: dict) -> tuple:
+    """
+    Returns the phase of each VE.Bus device (/Devices/N), the units of a phase are numbered one after the other.
+    """
+    return tuple(phase for phase in device_config["phase_used"] for _ in range(device_config["units_per_phase"]))
+
+
+def get_config_file() -> str:
+    # the config file can be overridden with an environment variable, e.g. for the benchmarks
+    return os.environ.get("DBUS_MULTIPLUS_EMULATOR_CONFIG", (os.path.dirname(os.path.realpath(__file__))) + "/config.ini")
+
+
+def read_config() -> tuple:
+    """
+    Read and check the config.ini. Returns the config and the settings of all emulated devices.
+    """
+    config_file = get_config_file()
+    if not os.path.exists(config_file):
+        raise StartupError(f'The "{config_file}" is not found. Did you copy or rename the "config.sample.ini" to "config.ini"?')
+
+    try:
         config = configparser.ConfigParser()
         config.read(config_file)
-    else:
-        print('ERROR:The "' + config_file + '" is not found. Did you copy or rename the "config.sample.ini" to "config.ini"? The driver restarts in 60 seconds.')
-        sleep(60)
-        sys.exit()
-
-except Exception:
-    exception_type, exception_object, exception_traceback = sys.exc_info()
-    file = exception_traceback.tb_frame.f_code.co_filename
-    line = exception_traceback.tb_lineno
-    print(f"Exception occurred: {repr(exception_object)} of type {exception_type} in {file} line #{line}")
-    print("ERROR:The driver restarts in 60 seconds.")
-    sleep(60)
-    sys.exit()
-
-
-# Get logging level from config.ini
-# ERROR = shows errors only
-# WARNING = shows ERROR and warnings
-# INFO = shows WARNING and running functions
-# DEBUG = shows INFO and data/values
-if "DEFAULT" in config and "logging" in config["DEFAULT"]:
-    if config["DEFAULT"]["logging"] == "DEBUG":
-        logging.basicConfig(level=logging.DEBUG)
-    elif config["DEFAULT"]["logging"] == "INFO":
-        logging.basicConfig(level=logging.INFO)
-    elif config["DEFAULT"]["logging"] == "ERROR":
-        logging.basicConfig(level=logging.ERROR)
-    else:
-        logging.basicConfig(level=logging.WARNING)
-else:
-    logging.basicConfig(level=logging.WARNING)
-
-# get values from config.ini file
-phase_used = config["DEFAULT"]["phase_used"].replace(" ", "").split(",")
-
-inverter_max_power = int(config["DEFAULT"]["inverter_max_power"])
-dbus_service_name_grid = config["DEFAULT"]["dbus_service_name_grid"]
-dbus_service_name_ac_load = config["DEFAULT"]["dbus_service_name_ac_load"]
-grid_frequency = int(config["DEFAULT"]["grid_frequency"])
-grid_nominal_voltage = int(config["DEFAULT"]["grid_nominal_voltage"])
-
-
-# check if the phase_used list is valid
-valid_phases = {"L1", "L2", "L3"}
-for phase in phase_used:
-    if phase not in valid_phases:
-        logging.error(f"Invalid phase {phase} in phase_used list. Valid phases are {valid_phases}.")
-        sleep(60)
-        sys.exit()
-
-
-# specify how many phases are connected
-phase_count = len(phase_used)
-# create dictionary for later to count watt hours
-data_watt_hours = {"time_creation": int(time()), "count": 0}
-# calculate and save watthours after every x seconds
-data_watt_hours_timespan = 60
-# save file to non volatile storage after x seconds
-data_watt_hours_save = 900
-# file to save watt hours on persistent storage
-data_watt_hours_storage_file = "/data/etc/dbus-multiplus-emulator/data_watt_hours.json"
-# file to save many writing operations (best on ramdisk to not wear SD card)
-data_watt_hours_working_file = "/var/volatile/tmp/dbus-multiplus-emulator_data_watt_hours.json"
-# get last modification timestamp
-timestamp_storage_file = os.path.getmtime(data_watt_hours_storage_file) if os.path.isfile(data_watt_hours_storage_file) else 0
-
-# load data to prevent sending 0 watthours for OutToInverter (charging)/InverterToOut (discharging) before the first loop
-# check if file in volatile storage exists
-if os.path.isfile(data_watt_hours_working_file):
-    with open(data_watt_hours_working_file, "r") as file:
-        file = open(data_watt_hours_working_file, "r")
-        json_data = json.load(file)
-        logging.info("Loaded JSON for OutToInverter (charging)/InverterToOut (discharging) once")
-        logging.debug(json.dumps(json_data))
-# if not, check if file in persistent storage exists
-elif os.path.isfile(data_watt_hours_storage_file):
-    with open(data_watt_hours_storage_file, "r") as file:
-        file = open(data_watt_hours_storage_file, "r")
-        json_data = json.load(file)
-        logging.info("Loaded JSON for OutToInverter (charging)/InverterToOut (discharging) once from persistent storage")
-        logging.debug(json.dumps(json_data))
-else:
-    json_data = {}
+    except Exception:
+        exception_type, exception_object, exception_traceback = sys.exc_info()
+        file = exception_traceback.tb_frame.f_code.co_filename
+        line = exception_traceback.tb_lineno
+        raise StartupError(f"Exception occurred: {repr(exception_object)} of type {exception_type} in {file} line #{line}")
+
+    # settings of all emulated devices
+    try:
+        device_configs = get_device_configs(config)
+    except (KeyError, ValueError) as error:
+        raise StartupError(f"Invalid config.ini: {repr(error)}")
+
+    return config, device_configs
+
+
+def get_logging_level(config: configparser.ConfigParser) -> int:
+    """
+    Get logging level from config.ini
+    ERROR = shows errors only
+    WARNING = shows ERROR and warnings
+    INFO = shows WARNING and running functions
+    DEBUG = shows INFO and data/values
+    """
+    levels = {"DEBUG": logging.DEBUG, "INFO": logging.INFO, "ERROR": logging.ERROR}
+    return levels.get(config["DEFAULT"].get("logging", "WARNING"), logging.WARNING)
+
+
+def load_config():
+    """
+    Read the config.ini and set the settings of the module. Called by main() and not on import.
+    """
+    global config, tick_log_size, tick_log_file, trace_file, layout_cache_file, device_configs, tick_log
+
+    config, device_configs = read_config()
+
+    # a stage may already have logged before the config is read and so installed the default handler
+    # at WARNING, which makes basicConfig() a no-op; set the level on the root logger like reload_config()
+    logging.basicConfig()
+    logging.getLogger().setLevel(get_logging_level(config))
+
+    # number of ticks kept in RAM for forensics, 0 = disabled
+    tick_log_size = int(config["DEFAULT"]["tick_log_size"]) if "tick_log_size" in config["DEFAULT"] else 300
+    # file the tick records are dumped to on SIGUSR1 (best on ramdisk to not wear SD card)
+    tick_log_file = config["DEFAULT"]["tick_log_file"] if "tick_log_file" in config["DEFAULT"] else "/var/volatile/tmp/dbus-multiplus-emulator_ticks.jsonl"
+    # record all imported values to this file to replay them later with --replay, empty = disabled
+    trace_file = config["DEFAULT"]["trace_file"] if "trace_file" in config["DEFAULT"] else ""
+    # discovered imports for a faster restart, empty = disabled
+    layout_cache_file = config["DEFAULT"].get("layout_cache_file", "/var/volatile/tmp/dbus-multiplus-emulator_layout.json")
+
+    # in RAM ring buffer of the last ticks, can be dumped with "kill -USR1 <pid>"
+    tick_log = TickRingBuffer(fields=tick_log_fields, size=tick_log_size)
 
 
 class DbusMultiPlusEmulator:
@@ -118,11 +270,41 @@ class DbusMultiPlusEmulator:
         servicename,
         deviceinstance,
         paths,
-        productname=(config["DEFAULT"]["device_name"]),
+        productname=None,
         connection="VE.Bus",
+        dbusservice=None,
+        clock=None,
+        device_config=None,
+        bus=None,
     ):
-        self._dbusservice = VeDbusService(servicename, register=False)
+        # the service and the clock can be replaced, e.g. by memorybus.MemoryService and memorybus.ManualClock
+        if dbusservice is None:
+            from vedbus import VeDbusService
+
+            dbusservice = VeDbusService(servicename, bus=bus, register=False)
+        self._dbusservice = dbusservice
+        self._clock = clock if clock is not None else time
+        # the energy is integrated over the monotonic time, a jump of the wall clock would add or lose energy
+        self._monotonic = clock if clock is not None else monotonic
+        self._time_started = int(self._clock())
         self._paths = paths
+        self._servicename = servicename
+
+        # settings of this device
+        device_config = device_config if device_config is not None else device_configs[0]
+        productname = productname if productname is not None else device_config["productname"]
+        self._set_device_config(device_config)
+
+        # energy counters of the flows, saved every data_watt_hours_timespan seconds
+        self._data_watt_hours_storage_file = device_config["data_watt_hours_storage_file"]
+        self._data_watt_hours_working_file = device_config["data_watt_hours_working_file"]
+        # get last modification timestamp
+        self._timestamp_storage_file = os.path.getmtime(self._data_watt_hours_storage_file) if os.path.isfile(self._data_watt_hours_storage_file) else 0
+        self._timestamp_working_file = int(self._clock())
+        self._energy = EnergyCounters(load_data_watt_hours(self._data_watt_hours_working_file, self._data_watt_hours_storage_file), self._monotonic())
+
+        # settings written by the GUI or VRM, restored as initial values of the paths
+        self._settings = SettingsStore(device_config["settings_file"], self._clock, device_config["settings_save_delay"])
 
         logging.debug("%s /DeviceInstance = %d" % (servicename, deviceinstance))
 
@@ -130,7 +312,7 @@ class DbusMultiPlusEmulator:
         self._dbusservice.add_path("/Mgmt/ProcessName", __file__)
         self._dbusservice.add_path(
             "/Mgmt/ProcessVersion",
-            "Unkown version, and running on Python " + platform.python_version(),
+            "Unkown version, and running on Python " + "%d.%d.%d" % sys.version_info[:3],
         )
         self._dbusservice.add_path("/Mgmt/Connection", connection)
 
@@ -148,28 +330,186 @@ class DbusMultiPlusEmulator:
         # self._dbusservice.add_path('/Position', 0)
         # self._dbusservice.add_path('/StatusCode', 0)
 
-        self._dbusservice.add_path("/Ac/ActiveIn/CurrentLimit", 50.0, writeable=True)
+        self._dbusservice.add_path("/Ac/ActiveIn/CurrentLimit", self._settings.values.get("/Ac/ActiveIn/CurrentLimit", 50.0), writeable=True, onchangecallback=self._handlechangedvalue)
 
-        for path, settings in self._paths.items():
-            self._dbusservice.add_path(
-                path,
-                settings["initial"],
-                gettextcallback=settings["textformat"],
-                writeable=True,
-                # onchangecallback=self._handlechangedvalue,
-            )
+        self._add_paths(self._dbusservice, self._paths)
+
+        # counted in _update() instead of reading it back from the service
+        self._update_index = self._dbusservice["/UpdateIndex"]
 
         # create empty dictionaries for later use
         self.system_items = {}
         self.grid_items = {}
         self.ac_load_items = {}
 
+        # age of the grid and ac load values, see track_input_age()
+        self._grid_age = None
+        self._ac_load_age = None
+        self._input_age_clock = monotonic
+
+        # smoothed system, grid and ac load values and the stages and items they were created with, see track_input_age()
+        self._smoothing = None
+        self._smoothing_inputs = None
+
+        # forwarding of the ESS setpoints, see forward_setpoints()
+        self._forwarder = None
+        self._forward_io = None
+
         logging.info("-- Initializing completed, starting the main loop")
 
         # register VeDbusService after all paths where added
         self._dbusservice.register()
 
-        GLib.timeout_add(1000, self._update)  # pause 1000ms before the next request
+    def _set_device_config(self, device_config: dict):
+        """
+        Take over the settings of this device, used on start and when the config.ini changed.
+        """
+        self._device_config = device_config
+        self._phase_used = device_config["phase_used"]
+        self._phase_count = len(self._phase_used)
+        self._units_per_phase = device_config["units_per_phase"]
+        self._grid_frequency = device_config["grid_frequency"]
+        self._grid_nominal_voltage = device_config["grid_nominal_voltage"]
+        self._max_age_grid = device_config["max_age_grid"]
+        self._max_age_ac_load = device_config["max_age_ac_load"]
+
+        # index in the power flow of the phase of each device and of L1, L2 and L3 for the tick log, None if not used
+        device_phases = get_device_phases(device_config)
+        self._device_phase_index = tuple(self._phase_used.index(phase) for phase in device_phases)
+        self._tick_log_phase_index = tuple(self._phase_used.index(phase) if phase in self._phase_used else None for phase in ("L1", "L2", "L3"))
+
+        # paths which are updated on every tick apart from the power flow, in the order of the values in _update()
+        # the paths are built once to not format strings in _update()
+        frame_paths = [
+            "/Ac/NumberOfPhases",
+            "/Dc/0/Current",
+            "/Dc/0/Power",
+            "/Dc/0/Temperature",
+            "/Dc/0/Voltage",
+            "/Soc",
+            "/Emulator/Stale/Grid",
+            "/Emulator/Stale/AcLoad",
+            "/Emulator/Forward/Latency",
+            "/Emulator/Forward/LatencyMax",
+            "/Emulator/Forward/Sent",
+            "/Emulator/Forward/Coalesced",
+            "/Emulator/Forward/Errors",
+            "/UpdateIndex",
+        ]
+        for device_number, phase in enumerate(device_phases):
+            frame_paths += (
+                f"/Devices/{device_number}/UpTime",
+                f"/Devices/{device_number}/Ac/In/P",
+                f"/Devices/{device_number}/Ac/In/{phase}/P",
+                f"/Devices/{device_number}/Ac/Out/P",
+                f"/Devices/{device_number}/Ac/Out/{phase}/P",
+                f"/Devices/{device_number}/Ac/Inverter/P",
+            )
+        self._frame = TickFrame(frame_paths)
+
+        # lookup table of the conversion losses of one unit
+        self._efficiency = get_efficiency_curve(device_config["inverter_efficiency"], device_config["inverter_max_power"])
+
+        # per phase flows, created again when the phases or the fallback values changed
+        self._powerflow = PowerFlow(self._phase_used, self._grid_frequency, self._grid_nominal_voltage, self._efficiency, self._units_per_phase)
+
+    def _add_paths(self, dbusservice, paths: dict):
+        restored = self._settings.values
+        for path, settings in paths.items():
+            dbusservice.add_path(
+                path,
+                restored.get(path, settings.initial),
+                gettextcallback=settings.textformat,
+                writeable=True,
+                # the setpoints of hub4control can be forwarded and the settings are saved, the other writes are only accepted
+                onchangecallback=self._handlechangedvalue if path in FORWARDED_PATHS or is_persisted(path) else None,
+            )
+
+    def apply_device_config(self, device_config: dict) -> dict:
+        """
+        Apply changed settings of this device in place, the service stays registered.
+        Returns the changed settings as {key: (old value, new value)}.
+        """
+        changes = {key: (self._device_config.get(key), value) for key, value in device_config.items() if self._device_config.get(key) != value}
+        for key, (old, new) in changes.items():
+            logging.warning(f"{self._servicename}: {key} changed from {old} to {new}")
+
+        # add and remove the paths of phases and devices, the clients get one ItemsChanged signal
+        if "phase_used" in changes or "units_per_phase" in changes:
+            paths = create_multiplus_dbus_paths(len(device_config["phase_used"]), get_device_phases(device_config))
+            removed = [path for path in self._paths if path not in paths]
+            added = {path: settings for path, settings in paths.items() if path not in self._paths}
+            # the paths of all phases stay, the values of the phases which are not used anymore are cleared
+            dropped = tuple(prefix for phase in self._phase_used if phase not in device_config["phase_used"] for prefix in (f"/Ac/ActiveIn/{phase}/", f"/Ac/Out/{phase}/"))
+            with self._dbusservice as dbusservice:
+                for path in self._paths:
+                    if path.startswith(dropped) and path in paths:
+                        dbusservice[path] = None
+                for path in removed:
+                    dbusservice.del_tree(path)
+                self._add_paths(dbusservice, added)
+                dbusservice["/Devices/NumberOfMultis"] = paths["/Devices/NumberOfMultis"].initial
+            self._paths = paths
+            logging.warning(f"{self._servicename}: added {len(added)} and removed {len(removed)} paths")
+
+        if "productname" in changes:
+            self._dbusservice["/ProductName"] = device_config["productname"]
+
+        if "settings_save_delay" in changes:
+            self._settings.delay = device_config["settings_save_delay"]
+
+        if "deviceinstance" in changes:
+            logging.warning(f"{self._servicename}: the device instance is only changed after a restart")
+
+        self._set_device_config(device_config)
+
+        if ("hub4_forward" in changes or "hub4_forward_interval" in changes) and self._forward_io is not None:
+            self.forward_setpoints(*self._forward_io)
+
+        # the trackers and the filters are updated in place
+        if any(key in changes for key in ("max_age_grid", "max_age_ac_load", "smoothing_system", "smoothing_grid", "smoothing_ac_load")) and self._grid_age is not None:
+            self.track_input_age()
+
+        return changes
+
+    def track_input_age(self, clock=None):
+        """
+        Track the age of the grid and ac load values and set up their smoothing, has to be called after the items are set
+        and again after the items or their settings changed. The clock is taken on the first call.
+        """
+        if self._grid_age is None:
+            if clock is not None:
+                self._input_age_clock = clock
+            self._grid_age = InputAge("grid", self.grid_items, self._max_age_grid, self._input_age_clock)
+            self._ac_load_age = InputAge("ac load", self.ac_load_items, self._max_age_ac_load, self._input_age_clock)
+        else:
+            # the items stay hooked, only new items are hooked
+            self._grid_age.track(self.grid_items, self._max_age_grid)
+            self._ac_load_age.track(self.ac_load_items, self._max_age_ac_load)
+
+        # the filters keep their values as long as the items and stages are the same, else they start empty
+        stages = (self._device_config["smoothing_system"], self._device_config["smoothing_grid"], self._device_config["smoothing_ac_load"])
+        # copies, the item dictionaries can be changed in place
+        inputs = (stages, dict(self.system_items), dict(self.grid_items), dict(self.ac_load_items))
+        if inputs == self._smoothing_inputs:
+            return
+        self._smoothing_inputs = inputs
+        if any(stages):
+            self._smoothing = tuple(InputSmoothing(items, role_stages) for items, role_stages in zip((self.system_items, self.grid_items, self.ac_load_items), stages))
+        else:
+            # without any stages the items are used directly
+            self._smoothing = None
+
+    def forward_setpoints(self, send, schedule, clock=monotonic):
+        """
+        Forward the writes of hub4control to the configured targets, see setpointforward.SetpointForwarder
+        for `send` and `schedule`. Without configured targets the writes are only accepted.
+        """
+        self._forward_io = (send, schedule, clock)
+        routes = self._device_config["hub4_forward"]
+        self._forwarder = SetpointForwarder(routes, self._device_config["hub4_forward_interval"], send, schedule, clock) if routes != () else None
+        if routes != ():
+            logging.info(f"{self._servicename}: forwarding " + ", ".join(f"{path} to {service}{target}" for path, service, target in routes))
 
     def zeroIfNone(self, value: Union[int, float, None]) -> float:
         """
@@ -178,9 +518,6 @@ class DbusMultiPlusEmulator:
         return value if value is not None else 0
 
     def _update(self):
-        global data_watt_hours, data_watt_hours_timespan, data_watt_hours_save
-        global data_watt_hours_storage_file, data_watt_hours_working_file, json_data, timestamp_storage_file
-
         # ##################################################################################################################
 
         # check for changes in the dbus service list
@@ -189,831 +526,321 @@ class DbusMultiPlusEmulator:
         #     self.system_items, self.grid_items, self.ac_load_items = setup_dbus_external_items()
         #     logging.info("Time to setup external dbus items: %s seconds" % (time() - start))
 
-        # get DC values
-        dc_power = self.zeroIfNone(self.system_items["/Dc/Battery/Power"].get_value())
-        dc_voltage = self.zeroIfNone(self.system_items["/Dc/Battery/Voltage"].get_value())
-        dc_current = self.zeroIfNone(self.system_items["/Dc/Battery/Current"].get_value())
-
-        # # # calculate watthours
-        # measure power and calculate watthours, since it provides only watthours for production/import/consumption and no export
-        # divide charging and discharging from dc
-        # charging (+)
-        dc_power_charging = dc_power if dc_power > 0 else 0
-        # discharging (-)
-        dc_power_discharging = dc_power * -1 if dc_power < 0 else 0
-
-        # timestamp
-        timestamp = int(time())
-
-        # sum up values for consumption calculation
-        data_watt_hours_dc = {
-            "charging": round(
-                (data_watt_hours["dc"]["charging"] + dc_power_charging if "dc" in data_watt_hours else dc_power_charging),
-                3,
-            ),
-            "discharging": round(
-                (data_watt_hours["dc"]["discharging"] + dc_power_discharging if "dc" in data_watt_hours else dc_power_discharging),
-                3,
-            ),
-        }
+        # smoothed values, sampled once per tick
+        smoothing = self._smoothing
+        if smoothing is None:
+            system_items, grid_items, ac_load_items = self.system_items, self.grid_items, self.ac_load_items
+        else:
+            for role in smoothing:
+                role.sample()
+            system_items, grid_items, ac_load_items = (role.items for role in smoothing)
 
-        data_watt_hours.update(
-            {
-                "dc": data_watt_hours_dc,
-                "count": data_watt_hours["count"] + 1,
-            }
-        )
+        # get DC values
+        dc_power = self.zeroIfNone(system_items["/Dc/Battery/Power"].get_value())
+        dc_voltage = self.zeroIfNone(system_items["/Dc/Battery/Voltage"].get_value())
+        dc_current = self.zeroIfNone(system_items["/Dc/Battery/Current"].get_value())
+        soc = system_items["/Dc/Battery/Soc"].get_value()
+
+        # if a meter stopped publishing, fall back to the next source: ac load -> grid -> config
+        grid_stale = self._grid_age is not None and self._grid_age.is_stale()
+        ac_load_stale = self._ac_load_age is not None and self._ac_load_age.is_stale()
+        grid_items = grid_items if not grid_stale else {}
+        ac_load_items = ac_load_items if not ac_load_stale else {}
+
+        # timestamp, read once per tick
+        now = self._clock()
+        timestamp = int(now)
+
+        # AC input, inverter and AC output of all phases
+        powerflow = self._powerflow
+        powerflow.solve(dc_power, system_items, grid_items, ac_load_items)
+        self._energy.add(powerflow, dc_power, self._monotonic())
+
+        # increment UpdateIndex - to show that new data is available, overflow from 255 to 0
+        self._update_index = update_index = (self._update_index + 1) % 256
+
+        # values of the frame, in the order of its paths
+        forwarder = self._forwarder
+        values = [
+            # for bubble flow in chart and load visualization
+            self._phase_count,
+            # values from BMS for bubble flow in GUI
+            dc_current,
+            dc_power,
+            system_items["/Dc/Battery/Temperature"].get_value(),
+            dc_voltage,
+            soc,
+            # stale flags of the meters, None if the meter is not used
+            int(grid_stale) if self.grid_items != {} else None,
+            int(ac_load_stale) if self.ac_load_items != {} else None,
+            # statistics of the forwarded setpoints, in milliseconds
+            round(forwarder.latency * 1000, 1) if forwarder is not None and forwarder.latency is not None else None,
+            round(forwarder.latency_max * 1000, 1) if forwarder is not None and forwarder.latency_max is not None else None,
+            forwarder.sent if forwarder is not None else None,
+            forwarder.coalesced if forwarder is not None else None,
+            forwarder.errors if forwarder is not None else None,
+            update_index,
+        ]
+
+        # the power of a phase is split equally between its parallel units, the units of a phase have the same values
+        uptime = timestamp - self._time_started
+        units_per_phase = self._units_per_phase
+        phases = []
+        for phase_in, phase_out, phase_inverter in zip(powerflow.in_p, powerflow.out_p, powerflow.inverter_p):
+            device_in = round(phase_in / units_per_phase, 0) if phase_in is not None else None
+            device_out = round(phase_out / units_per_phase, 0) if phase_out is not None else None
+            device_inverter = round(phase_inverter / units_per_phase, 0) if phase_inverter is not None else None
+            phases.append((uptime, device_in, device_in, device_out, device_out, device_inverter))
+        for phase_index in self._device_phase_index:
+            values += phases[phase_index]
+
+        # the power flow, the energy counters and all other values are sent in one ItemsChanged signal
+        with self._dbusservice as dbusservice:
+            powerflow.publish(dbusservice)
+            self._energy.publish(dbusservice)
+            self._frame.publish(dbusservice, values)
+
+        # save the settings once the GUI stopped changing them
+        self._settings.save_if_due()
+
+        # save the energy counters to volatile storage and from time to time to persistent storage
+        if self._timestamp_working_file + data_watt_hours_timespan < timestamp:
+            self._save_energy(timestamp)
 
-        logging.debug("--> data_watt_hours(): %s" % json.dumps(data_watt_hours))
-
-        # build mean, calculate time diff and Wh and write to file
-        # check if at least x seconds are passed
-        if data_watt_hours["time_creation"] + data_watt_hours_timespan < timestamp:
-            # check if file in volatile storage exists
-            if os.path.isfile(data_watt_hours_working_file):
-                with open(data_watt_hours_working_file, "r") as file:
-                    file = open(data_watt_hours_working_file, "r")
-                    data_watt_hours_old = json.load(file)
-                    logging.debug("Loaded JSON")
-                    logging.debug(json.dumps(data_watt_hours_old))
-
-            # if not, check if file in persistent storage exists
-            elif os.path.isfile(data_watt_hours_storage_file):
-                with open(data_watt_hours_storage_file, "r") as file:
-                    file = open(data_watt_hours_storage_file, "r")
-                    data_watt_hours_old = json.load(file)
-                    logging.debug("Loaded JSON from persistent storage")
-                    logging.debug(json.dumps(data_watt_hours_old))
-
-            # if not, generate data
-            else:
-                data_watt_hours_old_dc = {
-                    "charging": 0,
-                    "discharging": 0,
-                }
-                data_watt_hours_old = {"dc": data_watt_hours_old_dc}
-                logging.debug("Generated JSON")
-                logging.debug(json.dumps(data_watt_hours_old))
-
-            # factor to calculate Watthours: mean power * measuuring period / 3600 seconds (1 hour)
-            factor = (timestamp - data_watt_hours["time_creation"]) / 3600
-
-            dc_charging = round(
-                data_watt_hours_old["dc"]["charging"] + (data_watt_hours["dc"]["charging"] / data_watt_hours["count"] * factor) / 1000,
-                3,
-            )
-            dc_discharging = round(
-                data_watt_hours_old["dc"]["discharging"] + (data_watt_hours["dc"]["discharging"] / data_watt_hours["count"] * factor) / 1000,
-                3,
-            )
+        # self._dbusservice["/Hub/ChargeVoltage"] = self.system_items["/Info/MaxChargeVoltage"]
 
-            # update previously set data
-            json_data = {
-                "dc": {
-                    "charging": dc_charging,
-                    "discharging": dc_discharging,
-                }
-            }
+        # self._dbusservice["/Leds/Absorption"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Absorption") else 0
+        # self._dbusservice["/Leds/Bulk"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Bulk") else 0
+        # self._dbusservice["/Leds/Float"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Float") else 0
 
-            # save data to volatile storage
-            with open(data_watt_hours_working_file, "w") as file:
-                file.write(json.dumps(json_data))
-
-            # save data to persistent storage if time is passed
-            if timestamp_storage_file + data_watt_hours_save < timestamp:
-                with open(data_watt_hours_storage_file, "w") as file:
-                    file.write(json.dumps(json_data))
-                timestamp_storage_file = timestamp
-                logging.info("Written JSON for OutToInverter (charging)/InverterToOut (discharging) to persistent storage.")
-
-            # begin a new cycle
-            data_watt_hours_dc = {
-                "charging": round(dc_power_charging, 3),
-                "discharging": round(dc_power_discharging, 3),
-            }
+        # store the tick in the ring buffer, serialized only when dumped
+        if tick_log.enabled:
+            in_p = powerflow.in_p
+            tick_log.append(
+                self._servicename,
+                dc_power,
+                dc_voltage,
+                dc_current,
+                "acload" if ac_load_items != {} else "ratio",
+                *(in_p[index] if index is not None else None for index in self._tick_log_phase_index),
+                powerflow.totals[0],
+                soc,
+            )
 
-            data_watt_hours = {
-                "time_creation": timestamp,
-                "dc": data_watt_hours_dc,
-                "count": 1,
-            }
+        return True
 
-            logging.debug("--> data_watt_hours(): %s" % json.dumps(data_watt_hours))
-
-        # update values in dbus
-        # for bubble flow in chart and load visualization
-
-        if self.ac_load_items != {}:
-            # L1 ----
-            if "L1" in phase_used and self.ac_load_items["/Ac/L1/Power"] is not None:
-                # power
-                self._dbusservice["/Ac/ActiveIn/L1/P"] = self.ac_load_items["/Ac/L1/Power"].get_value()
-                self._dbusservice["/Ac/ActiveIn/L1/S"] = self._dbusservice["/Ac/ActiveIn/L1/P"]
-
-                # frequency
-                if self.ac_load_items["/Ac/L1/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/F"] = self.ac_load_items["/Ac/L1/Frequency"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L1/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/F"] = self.ac_load_items["/Ac/L1/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/F"] = grid_frequency
-
-                # voltage
-                if self.ac_load_items["/Ac/L1/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/V"] = self.ac_load_items["/Ac/L1/Voltage"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L1/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/V"] = self.grid_items["/Ac/L1/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/V"] = grid_nominal_voltage
-
-                # current
-                if self.ac_load_items["/Ac/L1/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/I"] = self.ac_load_items["/Ac/L1/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/I"] = round(self._dbusservice["/Ac/ActiveIn/L1/P"] / self._dbusservice["/Ac/ActiveIn/L1/V"], 2)
-
-            # L2 ----
-            if "L2" in phase_used and self.ac_load_items["/Ac/L2/Power"] is not None:
-                # power
-                self._dbusservice["/Ac/ActiveIn/L2/P"] = self.ac_load_items["/Ac/L2/Power"].get_value()
-                self._dbusservice["/Ac/ActiveIn/L2/S"] = self._dbusservice["/Ac/ActiveIn/L2/P"]
-
-                # frequency
-                if self.ac_load_items["/Ac/L2/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/F"] = self.ac_load_items["/Ac/L2/Frequency"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L2/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/F"] = self.ac_load_items["/Ac/L2/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/F"] = grid_frequency
-
-                # voltage
-                if self.ac_load_items["/Ac/L2/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/V"] = self.ac_load_items["/Ac/L2/Voltage"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L2/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/V"] = self.grid_items["/Ac/L2/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/V"] = grid_nominal_voltage
-
-                # current
-                if self.ac_load_items["/Ac/L2/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/I"] = self.ac_load_items["/Ac/L2/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/I"] = round(self._dbusservice["/Ac/ActiveIn/L2/P"] / self._dbusservice["/Ac/ActiveIn/L2/V"], 2)
-
-            # L3 ----
-            if "L3" in phase_used and self.ac_load_items["/Ac/L3/Power"] is not None:
-                # power
-                self._dbusservice["/Ac/ActiveIn/L3/P"] = self.ac_load_items["/Ac/L3/Power"].get_value()
-                self._dbusservice["/Ac/ActiveIn/L3/S"] = self._dbusservice["/Ac/ActiveIn/L3/P"]
-
-                # frequency
-                if self.ac_load_items["/Ac/L3/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/F"] = self.ac_load_items["/Ac/L3/Frequency"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L3/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/F"] = self.ac_load_items["/Ac/L3/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/F"] = grid_frequency
-
-                # voltage
-                if self.ac_load_items["/Ac/L3/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/V"] = self.ac_load_items["/Ac/L3/Voltage"].get_value()
-                elif self.grid_items != {} and self.grid_items["/Ac/L3/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/V"] = self.grid_items["/Ac/L3/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/V"] = grid_nominal_voltage
-
-                # current
-                if self.ac_load_items["/Ac/L3/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/I"] = self.ac_load_items["/Ac/L3/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/I"] = round(self._dbusservice["/Ac/ActiveIn/L3/P"] / self._dbusservice["/Ac/ActiveIn/L3/V"], 2)
+    def _save_energy(self, timestamp: int, persistent: bool = False):
+        json_data = json.dumps(self._energy.to_json())
 
-        else:
-            # calculate ratio of power between each phases
-            active_in_L1_power = self.system_items["/Ac/ActiveIn/L1/Power"].get_value() if self.system_items["/Ac/ActiveIn/L1/Power"] is not None else 0
-            active_in_L2_power = self.system_items["/Ac/ActiveIn/L2/Power"].get_value() if self.system_items["/Ac/ActiveIn/L2/Power"] is not None else 0
-            active_in_L3_power = self.system_items["/Ac/ActiveIn/L3/Power"].get_value() if self.system_items["/Ac/ActiveIn/L3/Power"] is not None else 0
-
-            pv_on_grid_L1_power = self.system_items["/Ac/PvOnGrid/L1/Power"].get_value() if self.system_items["/Ac/PvOnGrid/L1/Power"] is not None else 0
-            pv_on_grid_L2_power = self.system_items["/Ac/PvOnGrid/L2/Power"].get_value() if self.system_items["/Ac/PvOnGrid/L2/Power"] is not None else 0
-            pv_on_grid_L3_power = self.system_items["/Ac/PvOnGrid/L3/Power"].get_value() if self.system_items["/Ac/PvOnGrid/L3/Power"] is not None else 0
-
-            ac_total_L1_power = self.zeroIfNone(active_in_L1_power) + self.zeroIfNone(pv_on_grid_L1_power)
-            ac_total_L2_power = self.zeroIfNone(active_in_L2_power) + self.zeroIfNone(pv_on_grid_L2_power)
-            ac_total_L3_power = self.zeroIfNone(active_in_L3_power) + self.zeroIfNone(pv_on_grid_L3_power)
-            ac_total_power = ac_total_L1_power + ac_total_L2_power + ac_total_L3_power
-
-            # calculate the ratio of power between each phases
-            ratio_L1 = round((ac_total_L1_power / ac_total_power) if ac_total_power != 0 else 0, 4)
-            ratio_L2 = round((ac_total_L2_power / ac_total_power) if ac_total_power != 0 else 0, 4)
-            ratio_L3 = round((ac_total_L3_power / ac_total_power) if ac_total_power != 0 else 0, 4)
-
-            logging.debug(f"ratio_L1: {ratio_L1}, ratio_L2: {ratio_L2}, ratio_L3: {ratio_L3}")
-
-            # L1 -----
-            if "L1" in phase_used:
-                # since the MultiPlus emulator is only integrating the power flowing from AC to DC and vice versa, the power is divided by the number of phases
-                self._dbusservice["/Ac/ActiveIn/L1/P"] = round((dc_power * ratio_L1 if dc_power != 0 else 0), 0)
-                self._dbusservice["/Ac/ActiveIn/L1/S"] = self._dbusservice["/Ac/ActiveIn/L1/P"]
-
-                if self.grid_items != {} and self.grid_items["/Ac/L1/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/F"] = self.grid_items["/Ac/L1/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/F"] = grid_frequency
-
-                # voltage
-                if self.grid_items != {} and self.grid_items["/Ac/L1/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/V"] = self.grid_items["/Ac/L1/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/V"] = grid_nominal_voltage
-
-                # current
-                if self.grid_items != {} and self.grid_items["/Ac/L1/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L1/I"] = self.grid_items["/Ac/L1/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L1/I"] = round(self._dbusservice["/Ac/ActiveIn/L1/P"] / self._dbusservice["/Ac/ActiveIn/L1/V"], 2)
-
-            # L2 -----
-            if "L2" in phase_used:
-                # since the MultiPlus emulator is only integrating the power flowing from AC to DC and vice versa, the power is divided by the number of phases
-                self._dbusservice["/Ac/ActiveIn/L2/P"] = round((dc_power * ratio_L2 if dc_power != 0 else 0), 0)
-                self._dbusservice["/Ac/ActiveIn/L2/S"] = self._dbusservice["/Ac/ActiveIn/L2/P"]
-
-                if self.grid_items != {} and self.grid_items["/Ac/L2/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/F"] = self.grid_items["/Ac/L2/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/F"] = grid_frequency
-
-                # voltage
-                if self.grid_items != {} and self.grid_items["/Ac/L2/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/V"] = self.grid_items["/Ac/L2/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/V"] = grid_nominal_voltage
-
-                # current
-                if self.grid_items != {} and self.grid_items["/Ac/L2/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L2/I"] = self.grid_items["/Ac/L2/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L2/I"] = round(self._dbusservice["/Ac/ActiveIn/L2/P"] / self._dbusservice["/Ac/ActiveIn/L2/V"], 2)
-
-            # L3 -----
-            if "L3" in phase_used:
-                # since the MultiPlus emulator is only integrating the power flowing from AC to DC and vice versa, the power is divided by the number of phases
-                self._dbusservice["/Ac/ActiveIn/L3/P"] = round((dc_power * ratio_L3 if dc_power != 0 else 0), 0)
-                self._dbusservice["/Ac/ActiveIn/L3/S"] = self._dbusservice["/Ac/ActiveIn/L3/P"]
-
-                if self.grid_items != {} and self.grid_items["/Ac/L3/Frequency"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/F"] = self.grid_items["/Ac/L3/Frequency"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/F"] = grid_frequency
-
-                # voltage
-                if self.grid_items != {} and self.grid_items["/Ac/L3/Voltage"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/V"] = self.grid_items["/Ac/L3/Voltage"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/V"] = grid_nominal_voltage
-
-                # current
-                if self.grid_items != {} and self.grid_items["/Ac/L3/Current"] is not None:
-                    self._dbusservice["/Ac/ActiveIn/L3/I"] = self.grid_items["/Ac/L3/Current"].get_value()
-                else:
-                    self._dbusservice["/Ac/ActiveIn/L3/I"] = round(self._dbusservice["/Ac/ActiveIn/L3/P"] / self._dbusservice["/Ac/ActiveIn/L3/V"], 2)
-
-        # calculate total values
-        self._dbusservice["/Ac/ActiveIn/P"] = (
-            self.zeroIfNone(self._dbusservice["/Ac/ActiveIn/L1/P"]) + self.zeroIfNone(self._dbusservice["/Ac/ActiveIn/L2/P"]) + self.zeroIfNone(self._dbusservice["/Ac/ActiveIn/L3/P"])
-        )
-        self._dbusservice["/Ac/ActiveIn/S"] = self._dbusservice["/Ac/ActiveIn/P"]
+        # save data to volatile storage
+        with open(self._data_watt_hours_working_file, "w") as file:
+            file.write(json_data)
+        self._timestamp_working_file = timestamp
 
-        # get values from BMS
-        # for bubble flow in chart and load visualization
-        self._dbusservice["/Ac/NumberOfPhases"] = phase_count
+        # save data to persistent storage if time is passed
+        if persistent or self._timestamp_storage_file + data_watt_hours_save < timestamp:
+            with open(self._data_watt_hours_storage_file, "w") as file:
+                file.write(json_data)
+            self._timestamp_storage_file = timestamp
+            logging.info("Written JSON of the energy counters to persistent storage.")
 
-        # get values from BMS
-        # for bubble flow in GUI
-        self._dbusservice["/Dc/0/Current"] = dc_current
-        # self._dbusservice["/Dc/0/MaxChargeCurrent"] = self.system_items["/Info/MaxChargeCurrent"]
-        self._dbusservice["/Dc/0/Power"] = dc_power
-        self._dbusservice["/Dc/0/Temperature"] = self.system_items["/Dc/Battery/Temperature"].get_value()
-        self._dbusservice["/Dc/0/Voltage"] = dc_voltage
+    def save_state(self):
+        """
+        Write the pending settings and the energy counters to persistent storage, called when the driver stops.
+        """
+        self._settings.flush()
+        try:
+            self._save_energy(int(self._clock()), persistent=True)
+        except OSError as error:
+            logging.warning(f"Could not write the energy counters: {error}")
 
-        self._dbusservice["/Devices/0/UpTime"] = int(time()) - time_driver_started
+    def _handlechangedvalue(self, path, value):
+        logging.debug("someone else updated %s to %s" % (path, value))
+        if self._forwarder is not None:
+            self._forwarder.write(path, value)
+        if is_persisted(path):
+            self._settings.set(path, value)
+        return True  # accept the change
 
-        if phase_count >= 2:
-            self._dbusservice["/Devices/1/UpTime"] = int(time()) - time_driver_started
 
-        if phase_count == 3:
-            self._dbusservice["/Devices/2/UpTime"] = int(time()) - time_driver_started
+# meters which are looked up again when their config changes:
+# config key, attribute of DbusMultiPlusEmulator, service name prefix, description, role in the trace
+meter_roles = (
+    ("dbus_service_name_grid", "grid_items", "com.victronenergy.grid", "grid", "grid"),
+    ("dbus_service_name_ac_load", "ac_load_items", "com.victronenergy.acload", "ac load", "acload"),
+)
+
+# paths imported from com.victronenergy.system
+dbus_paths_system = (
+    "/Ac/ActiveIn/L1/Power",
+    "/Ac/ActiveIn/L2/Power",
+    "/Ac/ActiveIn/L3/Power",
+    "/Ac/PvOnGrid/L1/Power",
+    "/Ac/PvOnGrid/L2/Power",
+    "/Ac/PvOnGrid/L3/Power",
+    "/Dc/Battery/BatteryService",
+    "/Dc/Battery/Current",
+    "/Dc/Battery/Power",
+    "/Dc/Battery/Temperature",
+    "/Dc/Battery/Voltage",
+    "/Dc/Battery/Soc",
+)
+
+# paths imported from the grid and ac load meters
+dbus_paths_meter = (
+    "/Ac/L1/Power",
+    "/Ac/L1/Current",
+    "/Ac/L1/Voltage",
+    "/Ac/L1/Frequency",
+    "/Ac/L2/Power",
+    "/Ac/L2/Current",
+    "/Ac/L2/Voltage",
+    "/Ac/L2/Frequency",
+    "/Ac/L3/Power",
+    "/Ac/L3/Current",
+    "/Ac/L3/Voltage",
+    "/Ac/L3/Frequency",
+    "/Ac/Power",
+    "/Ac/Current",
+    "/Ac/Voltage",
+)
+
+
+class DbusInputCache:
+    """
+    Imports every service/path only once, so all emulated devices share the same VeDbusItemImport objects.
+    """
 
-        self._dbusservice["/Energy/InverterToAcOut"] = json_data["dc"]["discharging"] if "dc" in json_data and "discharging" in json_data["dc"] else 0
-        self._dbusservice["/Energy/OutToInverter"] = json_data["dc"]["charging"] if "dc" in json_data and "charging" in json_data["dc"] else 0
+    def __init__(self, dbus_connection, item_class=None):
+        if item_class is None:
+            from vedbus import VeDbusItemImport
 
-        # self._dbusservice["/Hub/ChargeVoltage"] = self.system_items["/Info/MaxChargeVoltage"]
+            item_class = VeDbusItemImport
+        self._item_class = item_class
+        self.dbus_connection = dbus_connection
+        # list of dbus services
+        self.dbus_services = dbus_connection.list_names()
+        self._items = {}
 
-        # self._dbusservice["/Leds/Absorption"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Absorption") else 0
-        # self._dbusservice["/Leds/Bulk"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Bulk") else 0
-        # self._dbusservice["/Leds/Float"] = 1 if self.system_items["/Info/ChargeMode"].startswith("Float") else 0
-        self._dbusservice["/Soc"] = self.system_items["/Dc/Battery/Soc"].get_value()
+    def refresh(self):
+        """
+        Fetch the list of dbus services again and forget the paths which did not exist, before meters are looked up
+        after a config change.
+        """
+        self.dbus_services = self.dbus_connection.list_names()
+        self._items = {key: item for key, item in self._items.items() if item is not None}
 
-        # increment UpdateIndex - to show that new data is available
-        index = self._dbusservice["/UpdateIndex"] + 1  # increment index
-        if index > 255:  # maximum value of the index
-            index = 0  # overflow from 255 to 0
-        self._dbusservice["/UpdateIndex"] = index
+    def release(self, items: dict, in_use: list):
+        """
+        Close the aggregators of `items` and remove their imports which are not part of one of the item dictionaries
+        `in_use` from the cache. The signal match of a removed import is removed right away, so a meter which is
+        looked up again is imported and hooked anew.
+        """
+        for item in items.values():
+            if isinstance(item, AggregatedItem):
+                item.aggregator.close()
+
+        keep = {id(source) for role_items in in_use for source in import_sources(role_items)}
+        released = {id(source) for source in import_sources(items) if id(source) not in keep}
+        for key, item in list(self._items.items()):
+            if item is not None and id(item) in released:
+                del self._items[key]
+                # removes the match of the PropertiesChanged signal
+                item.__del__()
+
+    def get_items(self, service_name: str, paths: tuple) -> dict:
+        """
+        Returns a dictionary with the VeDbusItemImport for each path, or None if the path does not exist.
+        """
+        items = {}
+        for path in paths:
+            key = (service_name, path)
+            if key not in self._items:
+                item = self._item_class(self.dbus_connection, service_name, path)
+                # remove items that does not exist
+                self._items[key] = item if item.exists else None
+            items[path] = self._items[key]
+        return items
+
+
+def find_dbus_service_names(dbus_services, dbus_service_name: str, prefix: str) -> list:
+    """
+    Returns the configured service names which are present on dbus. Multiple names and glob patterns are separated by a comma,
+    e.g. com.victronenergy.acload.*. If none is configured, the first service starting with prefix.
+    """
+    # check if the dbus services are available
+    if dbus_service_name != "":
+        logging.info(f"Fetched {prefix} service name from config: {dbus_service_name}")
+        names = []
+        for pattern in dbus_service_name.replace(" ", "").split(","):
+            if any(character in pattern for character in "*?["):
+                matches = sorted(str(name) for name in dbus_services if fnmatchcase(name, pattern))
+            else:
+                matches = [pattern] if pattern in dbus_services else []
+            names += [name for name in matches if name not in names]
+        return names
 
-        return True
+    # iterate through the array to find the first string containing the prefix
+    for name in dbus_services:
+        if prefix in name:
+            logging.info(f"No {prefix} service name provided, using the first one found: {name}")
+            return [str(name)]
 
-    def _handlechangedvalue(self, path, value):
-        logging.debug("someone else updated %s to %s" % (path, value))
-        return True  # accept the change
+    return []
 
 
-def create_device_dbus_paths(device_number: int = 0):
+def get_meter_items(input_cache: DbusInputCache, dbus_service_names: list) -> dict:
     """
-    Create the dbus paths for the device.
+    Returns the items of the meter, or the aggregated items if there is more than one meter.
     """
+    if len(dbus_service_names) == 0:
+        return {}
 
-    global _w, _n, _v
-
-    paths_dbus = {
-        f"/Devices/{device_number}/Ac/In/L2/P": {"initial": None, "textformat": _w},
-        f"/Devices/{device_number}/Ac/In/P": {"initial": None, "textformat": _w},
-        f"/Devices/{device_number}/Ac/Inverter/P": {"initial": None, "textformat": _w},
-        f"/Devices/{device_number}/Ac/Out/L2/P": {"initial": None, "textformat": _w},
-        f"/Devices/{device_number}/Ac/Out/P": {"initial": None, "textformat": _w},
-        f"/Devices/{device_number}/Assistants": {
-            "initial": [
-                139,
-                1,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-                0,
-            ],
-            "textformat": None,
-        },
-        f"/Devices/{device_number}/CNBFirmwareVersion": {
-            "initial": 2204156,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Diagnostics/UBatRipple": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Diagnostics/UBatTerminal": {
-            "initial": None,
-            "textformat": _v,
-        },
-        f"/Devices/{device_number}/Diagnostics/UBatVSense": {
-            "initial": None,
-            "textformat": _v,
-        },
-        f"/Devices/{device_number}/ErrorAndWarningFlags/NSErrConnectFrustratedByRelayTest": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ErrorAndWarningFlags/NSErrRelayTestKeepsFailing": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ErrorAndWarningFlags/RawFlags": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ErrorAndWarningFlags/WarnRelayTestRecentlyFailed": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/AcIn1Available": {
-            "initial": 1,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/BolTimeoutOccured": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/ChargeDisabledDueToLowTemp": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/ChargeIsDisabled": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/DMCGeneratorSelected": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/GridRelayReport/Code": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/GridRelayReport/Count": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/GridRelayReport/Reset": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/HighDcCurrent": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/HighDcVoltage": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/IgnoreAcIn1": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/IgnoreAcIn1AssistantsVs": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/MainsPllLocked": {
-            "initial": 1,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/NPFGeneratorSelected": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/PcvPotmeterOnZero": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/PowerPackPreOverload": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/PreferRenewableEnergy": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/PreferRenewableEnergyActive": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/RawFlags0": {
-            "initial": 268697648,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/RawFlags1": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/RelayTestOk": {
-            "initial": 1,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/SocTooLowToInvert": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/SustainMode": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/SwitchoverInfo/Connecting": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/SwitchoverInfo/Delay": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/SwitchoverInfo/ErrorFlags": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/TemperatureHighForceBypass": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/VeBusNetworkQualityCounter": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/ExtendStatus/WaitingForRelayTest": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/FirmwareSubVersion": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/FirmwareVersion": {
-            "initial": 1296,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Info/DeltaTBatNominalTBatMinimum": {
-            "initial": 45,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Info/MaximumRelayCurrentAC1": {
-            "initial": 50,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Info/MaximumRelayCurrentAC2": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/0/ErrorFlags": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/0/Time": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/1/ErrorFlags": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/1/Time": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/2/ErrorFlags": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/2/Time": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/3/ErrorFlags": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/3/Time": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/4/ErrorFlags": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/InterfaceProtectionLog/4/Time": {
-            "initial": None,
-            "textformat": _n,
-        },
-        # ----
-        f"/Devices/{device_number}/ProductId": {
-            "initial": 9763,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/SerialNumber": {
-            "initial": "HQ00000AA0" + str(device_number + 1),
-            "textformat": _s,
-        },
-        f"/Devices/{device_number}/Settings/AssistCurrentBoostFactor": {
-            "initial": 2.0,
-            "textformat": _n1,
-        },
-        f"/Devices/{device_number}/Settings/InverterOutputVoltage": {
-            "initial": 230.0,
-            "textformat": _n1,
-        },
-        f"/Devices/{device_number}/Settings/PowerAssistEnabled": {
-            "initial": False,
-            "textformat": None,
-        },
-        f"/Devices/{device_number}/Settings/ReadProgress": {
-            "initial": 100,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Settings/ResetRequired": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Settings/UpsFunction": {
-            "initial": False,
-            "textformat": None,
-        },
-        f"/Devices/{device_number}/Settings/WriteProgress": {
-            "initial": None,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/UpTime": {
-            "initial": 0,
-            "textformat": _n,
-        },
-        f"/Devices/{device_number}/Version": {"initial": 2987520, "textformat": _s},
-    }
+    if len(dbus_service_names) == 1:
+        return input_cache.get_items(dbus_service_names[0], dbus_paths_meter)
 
-    return paths_dbus
+    return MeterAggregator({name: input_cache.get_items(name, dbus_paths_meter) for name in dbus_service_names}).items
 
 
-def setup_dbus_external_items():
-    global dbus_service_name_grid, dbus_service_name_ac_load
+def setup_meter_items(input_cache: DbusInputCache, dbus_service_name: str, prefix: str, description: str) -> tuple:
+    """
+    Returns the service names and the items of the grid or ac load meters.
+    """
+    dbus_service_names = find_dbus_service_names(input_cache.dbus_services, dbus_service_name, prefix)
+    if dbus_service_names != []:
+        logging.info(f"{', '.join(dbus_service_names)} present in dbus, setting up the {description} values")
+    return dbus_service_names, get_meter_items(input_cache, dbus_service_names)
 
-    # setup external dbus paths
-    # connect to the sessionbus, on a CC GX the systembus is used
-    dbus_connection = dbus.SessionBus() if "DBUS_SESSION_BUS_ADDRESS" in os.environ else dbus.SystemBus()
 
-    # list of dbus services
-    dbus_services = dbus_connection.list_names()
+def setup_dbus_external_items(input_cache: DbusInputCache, dbus_service_name_grid: str = "", dbus_service_name_ac_load: str = "") -> tuple:
+    dbus_services = input_cache.dbus_services
 
     # ----- BATTERY -----
     # check if the dbus service is available
     dbus_service_system = "com.victronenergy.system"
-    is_present_in_vebus = dbus_service_system in dbus_services
-
-    # dictionary containing the different items
-    dbus_objects_system = {}
-
-    if is_present_in_vebus:
-        dbus_objects_system["/Ac/ActiveIn/L1/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/ActiveIn/L1/Power")
-        dbus_objects_system["/Ac/ActiveIn/L2/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/ActiveIn/L2/Power")
-        dbus_objects_system["/Ac/ActiveIn/L3/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/ActiveIn/L3/Power")
-
-        dbus_objects_system["/Ac/PvOnGrid/L1/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/PvOnGrid/L1/Power")
-        dbus_objects_system["/Ac/PvOnGrid/L2/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/PvOnGrid/L2/Power")
-        dbus_objects_system["/Ac/PvOnGrid/L3/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Ac/PvOnGrid/L3/Power")
-
-        dbus_objects_system["/Dc/Battery/BatteryService"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/BatteryService")
-        dbus_objects_system["/Dc/Battery/Current"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/Current")
-        dbus_objects_system["/Dc/Battery/Power"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/Power")
-        dbus_objects_system["/Dc/Battery/Temperature"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/Temperature")
-        dbus_objects_system["/Dc/Battery/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/Voltage")
-        dbus_objects_system["/Dc/Battery/Soc"] = VeDbusItemImport(dbus_connection, dbus_service_system, "/Dc/Battery/Soc")
+    dbus_objects_system = input_cache.get_items(dbus_service_system, dbus_paths_system) if dbus_service_system in dbus_services else {}
 
     # ----- GRID -----
-    is_present_in_vebus = False
-
-    # check if the dbus service is available
-    if dbus_service_name_grid != "":
-        logging.info(f"Fetched dbus_service_name_grid from config: {dbus_service_name_grid}")
-        is_present_in_vebus = dbus_service_name_grid in dbus_services
-    # search for the first com.victronenergy.grid service
-    else:
-        # create variable to store the first grid service name
-        dbus_service_name_grid = None
-
-        # iterate through the array to find the first string containing "com.victronenergy.grid"
-        for name in dbus_services:
-            if "com.victronenergy.grid" in name:
-                dbus_service_name_grid = name
-                is_present_in_vebus = True
-                break
-
-        if dbus_service_name_grid is not None:
-            logging.info(f"No grid service name provided, using the first one found: {dbus_service_name_grid}")
-
-    # dictionary containing the different items
-    dbus_objects_grid = {}
-
-    if is_present_in_vebus:
-        logging.info(f"{dbus_service_name_grid} is present in dbus, setting up the grid values")
-        dbus_objects_grid["/Ac/L1/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L1/Power")
-        dbus_objects_grid["/Ac/L1/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L1/Current")
-        dbus_objects_grid["/Ac/L1/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L1/Voltage")
-        dbus_objects_grid["/Ac/L1/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L1/Frequency")
-
-        dbus_objects_grid["/Ac/L2/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L2/Power")
-        dbus_objects_grid["/Ac/L2/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L2/Current")
-        dbus_objects_grid["/Ac/L2/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L2/Voltage")
-        dbus_objects_grid["/Ac/L2/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L2/Frequency")
-
-        dbus_objects_grid["/Ac/L3/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L3/Power")
-        dbus_objects_grid["/Ac/L3/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L3/Current")
-        dbus_objects_grid["/Ac/L3/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L3/Voltage")
-        dbus_objects_grid["/Ac/L3/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/L3/Frequency")
-
-        dbus_objects_grid["/Ac/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/Power")
-        dbus_objects_grid["/Ac/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/Current")
-        dbus_objects_grid["/Ac/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_grid, "/Ac/Voltage")
+    dbus_service_names_grid, dbus_objects_grid = setup_meter_items(input_cache, dbus_service_name_grid, "com.victronenergy.grid", "grid")
 
     # ----- AC LOAD -----
-    is_present_in_vebus = False
-
-    # check if the dbus service is available
-    if dbus_service_name_ac_load != "":
-        logging.info(f"Fetched dbus_service_name_ac_load from config: {dbus_service_name_ac_load}")
-        is_present_in_vebus = dbus_service_name_ac_load in dbus_services
-    # search for the first com.victronenergy.acload service
-    else:
-        # create variable to store the first ac load service name
-        dbus_service_name_ac_load = None
-
-        # iterate through the array to find the first string containing "com.victronenergy.acload"
-        for name in dbus_services:
-            if "com.victronenergy.acload" in name:
-                dbus_service_name_ac_load = name
-                is_present_in_vebus = True
-                break
-
-        if dbus_service_name_ac_load is not None:
-            logging.info(f"No AC Load service name provided, using the first one found: {dbus_service_name_ac_load}")
-
-    # dictionary containing the different items
-    dbus_objects_ac_load = {}
-
-    if is_present_in_vebus:
-        logging.info(f"{dbus_service_name_ac_load} is present in dbus, setting up the ac load values")
-        dbus_objects_ac_load["/Ac/L1/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L1/Power")
-        dbus_objects_ac_load["/Ac/L1/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L1/Current")
-        dbus_objects_ac_load["/Ac/L1/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L1/Voltage")
-        dbus_objects_ac_load["/Ac/L1/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L1/Frequency")
-
-        dbus_objects_ac_load["/Ac/L2/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L2/Power")
-        dbus_objects_ac_load["/Ac/L2/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L2/Current")
-        dbus_objects_ac_load["/Ac/L2/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L2/Voltage")
-        dbus_objects_ac_load["/Ac/L2/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L2/Frequency")
-
-        dbus_objects_ac_load["/Ac/L3/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L3/Power")
-        dbus_objects_ac_load["/Ac/L3/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L3/Current")
-        dbus_objects_ac_load["/Ac/L3/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L3/Voltage")
-        dbus_objects_ac_load["/Ac/L3/Frequency"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/L3/Frequency")
-
-        dbus_objects_ac_load["/Ac/Power"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/Power")
-        dbus_objects_ac_load["/Ac/Current"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/Current")
-        dbus_objects_ac_load["/Ac/Voltage"] = VeDbusItemImport(dbus_connection, dbus_service_name_ac_load, "/Ac/Voltage")
+    dbus_service_names_ac_load, dbus_objects_ac_load = setup_meter_items(input_cache, dbus_service_name_ac_load, "com.victronenergy.acload", "ac load")
 
     logging.info("*** Found values ***")
 
-    if dbus_service_system != "":
-        logging.info(f"Dbus system service name: {dbus_service_system}")
-        for item in dbus_objects_system:
-            # remove items that does not exist
-            if dbus_objects_system[item].exists:
-                logging.info(f"{item} = {dbus_objects_system[item].get_value()}")
-            else:
-                dbus_objects_system[item] = None
-                logging.debug(f"{item} does not exist, removed from grid values")
-
-    if dbus_service_name_grid != "":
-        logging.info(f"Dbus grid service name: {dbus_service_name_grid}")
-        for item in dbus_objects_grid:
-            # remove items that does not exist
-            if dbus_objects_grid[item].exists:
-                logging.info(f"{item} = {dbus_objects_grid[item].get_value()}")
-            else:
-                dbus_objects_grid[item] = None
-                logging.debug(f"{item} does not exist, removed from grid values")
-
-    if dbus_service_name_ac_load != "":
-        logging.info(f"Dbus ac load service name: {dbus_service_name_ac_load}")
-        for item in dbus_objects_ac_load:
-            # remove items that does not exist
-            if dbus_objects_ac_load[item].exists:
-                logging.info(f"{item} = {dbus_objects_ac_load[item].get_value()}")
+    for description, dbus_service_name, dbus_objects in (
+        ("system", dbus_service_system, dbus_objects_system),
+        ("grid", ", ".join(dbus_service_names_grid), dbus_objects_grid),
+        ("ac load", ", ".join(dbus_service_names_ac_load), dbus_objects_ac_load),
+    ):
+        if dbus_objects == {}:
+            continue
+        logging.info(f"Dbus {description} service name: {dbus_service_name}")
+        for item in dbus_objects:
+            if dbus_objects[item] is not None:
+                logging.info("%s = %s", item, LazyCall(dbus_objects[item].get_value))
             else:
-                dbus_objects_ac_load[item] = None
-                logging.debug(f"{item} does not exist, removed from ac_load values")
+                logging.debug(f"{item} does not exist, removed from {description} values")
 
     return dbus_objects_system, dbus_objects_grid, dbus_objects_ac_load
 
@@ -1063,13 +890,382 @@ def _s(p, v):
     return str("%s" % v)
 
 
-def main():
-    global time_driver_started
+def _ms(p, v):
+    return str("%.1f" % v) + "ms"
 
-    _thread.daemon = True  # allow the program to quit
 
-    # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
-    DBusGMainLoop(set_as_default=True)
+class PathSettings:
+    """
+    Initial value and text format of an exported path. The path tables are read-only, so paths with
+    the same settings share one record.
+    """
+
+    __slots__ = ("initial", "textformat")
+
+    def __init__(self, initial=None, textformat=None):
+        self.initial = initial
+        self.textformat = textformat
+
+
+def compact_dbus_paths(paths: dict) -> dict:
+    """
+    Returns the path table with interned paths and one shared PathSettings per distinct setting.
+    """
+    records = {}
+    compact = {}
+    for path, settings in paths.items():
+        initial, textformat = settings["initial"], settings["textformat"]
+        try:
+            # the type is part of the key, since 0, 0.0 and False are equal but exported as different types
+            key = (type(initial), initial, textformat)
+            record = records.get(key)
+            if record is None:
+                record = records[key] = PathSettings(initial, textformat)
+        except TypeError:
+            # unhashable initial values like the assistants are not shared
+            record = PathSettings(initial, textformat)
+        compact[sys.intern(path)] = record
+    return compact
+
+
+# assistants of a device, shared by all devices
+device_assistants = [
+    139,
+    1,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+    0,
+]
+
+# template of the dbus paths of a device, relative to /Devices/<device_number>
+# the settings are shared by all devices and are never modified
+device_dbus_paths = {
+    "/Ac/In/P": {"initial": None, "textformat": _w},
+    "/Ac/Inverter/P": {"initial": None, "textformat": _w},
+    "/Ac/Out/P": {"initial": None, "textformat": _w},
+    "/Assistants": {"initial": device_assistants, "textformat": None},
+    "/CNBFirmwareVersion": {
+        "initial": 2204156,
+        "textformat": _n,
+    },
+    "/Diagnostics/UBatRipple": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/Diagnostics/UBatTerminal": {
+        "initial": None,
+        "textformat": _v,
+    },
+    "/Diagnostics/UBatVSense": {
+        "initial": None,
+        "textformat": _v,
+    },
+    "/ErrorAndWarningFlags/NSErrConnectFrustratedByRelayTest": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ErrorAndWarningFlags/NSErrRelayTestKeepsFailing": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ErrorAndWarningFlags/RawFlags": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ErrorAndWarningFlags/WarnRelayTestRecentlyFailed": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/AcIn1Available": {
+        "initial": 1,
+        "textformat": _n,
+    },
+    "/ExtendStatus/BolTimeoutOccured": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/ChargeDisabledDueToLowTemp": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/ChargeIsDisabled": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/DMCGeneratorSelected": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/GridRelayReport/Code": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/ExtendStatus/GridRelayReport/Count": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/ExtendStatus/GridRelayReport/Reset": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/HighDcCurrent": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/HighDcVoltage": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/IgnoreAcIn1": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/IgnoreAcIn1AssistantsVs": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/MainsPllLocked": {
+        "initial": 1,
+        "textformat": _n,
+    },
+    "/ExtendStatus/NPFGeneratorSelected": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/PcvPotmeterOnZero": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/PowerPackPreOverload": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/PreferRenewableEnergy": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/PreferRenewableEnergyActive": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/RawFlags0": {
+        "initial": 268697648,
+        "textformat": _n,
+    },
+    "/ExtendStatus/RawFlags1": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/ExtendStatus/RelayTestOk": {
+        "initial": 1,
+        "textformat": _n,
+    },
+    "/ExtendStatus/SocTooLowToInvert": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/SustainMode": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/SwitchoverInfo/Connecting": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/SwitchoverInfo/Delay": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/SwitchoverInfo/ErrorFlags": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/TemperatureHighForceBypass": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/VeBusNetworkQualityCounter": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/ExtendStatus/WaitingForRelayTest": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/FirmwareSubVersion": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/FirmwareVersion": {
+        "initial": 1296,
+        "textformat": _n,
+    },
+    "/Info/DeltaTBatNominalTBatMinimum": {
+        "initial": 45,
+        "textformat": _n,
+    },
+    "/Info/MaximumRelayCurrentAC1": {
+        "initial": 50,
+        "textformat": _n,
+    },
+    "/Info/MaximumRelayCurrentAC2": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/0/ErrorFlags": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/0/Time": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/1/ErrorFlags": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/1/Time": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/2/ErrorFlags": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/2/Time": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/3/ErrorFlags": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/3/Time": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/4/ErrorFlags": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/InterfaceProtectionLog/4/Time": {
+        "initial": None,
+        "textformat": _n,
+    },
+    # ----
+    "/ProductId": {
+        "initial": 9763,
+        "textformat": _n,
+    },
+    "/Settings/AssistCurrentBoostFactor": {
+        "initial": 2.0,
+        "textformat": _n1,
+    },
+    "/Settings/InverterOutputVoltage": {
+        "initial": 230.0,
+        "textformat": _n1,
+    },
+    "/Settings/PowerAssistEnabled": {
+        "initial": False,
+        "textformat": None,
+    },
+    "/Settings/ReadProgress": {
+        "initial": 100,
+        "textformat": _n,
+    },
+    "/Settings/ResetRequired": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/Settings/UpsFunction": {
+        "initial": False,
+        "textformat": None,
+    },
+    "/Settings/WriteProgress": {
+        "initial": None,
+        "textformat": _n,
+    },
+    "/UpTime": {
+        "initial": 0,
+        "textformat": _n,
+    },
+    "/Version": {"initial": 2987520, "textformat": _s},
+}
+
+
+def create_device_dbus_paths(device_number: int = 0, phase: str = "L1") -> dict:
+    """
+    Create the dbus paths for the device from the shared template.
+    """
+    prefix = f"/Devices/{device_number}"
+
+    paths_dbus = {prefix + path: settings for path, settings in device_dbus_paths.items()}
+
+    # paths which differ between the devices
+    paths_dbus[f"{prefix}/Ac/In/{phase}/P"] = {"initial": None, "textformat": _w}
+    paths_dbus[f"{prefix}/Ac/Out/{phase}/P"] = {"initial": None, "textformat": _w}
+    paths_dbus[f"{prefix}/SerialNumber"] = {"initial": "HQ00000AA0" + str(device_number + 1), "textformat": _s}
+
+    return paths_dbus
+
+
+@lru_cache(maxsize=None)
+def create_multiplus_dbus_paths(phase_count: int = 1, device_phases: tuple = None) -> dict:
+    """
+    Create the dbus paths of the MultiPlus, including the devices of all used phases.
+    The table is built once per layout and shared between the devices, so it must not be modified.
+    """
 
     paths_multiplus_dbus = {
         "/Ac/ActiveIn/ActiveInput": {"initial": 0, "textformat": _n},
@@ -1265,28 +1461,28 @@ def main():
     }
 
     # ----
-    # Device 0
+    # Devices, one per phase if not specified otherwise
     # ----
-    paths_multiplus_dbus.update(create_device_dbus_paths(0))
+    if device_phases is None:
+        device_phases = [f"L{phase}" for phase in range(1, phase_count + 1)]
 
-    if phase_count >= 2:
-        # ----
-        # Device 1
-        # ----
-        paths_multiplus_dbus.update(create_device_dbus_paths(1))
-
-    if phase_count == 3:
-        # ----
-        # Device 2
-        # ----
-        paths_multiplus_dbus.update(create_device_dbus_paths(2))
+    for device_number, phase in enumerate(device_phases):
+        paths_multiplus_dbus.update(create_device_dbus_paths(device_number, phase))
 
     paths_multiplus_dbus.update(
         {
             # ----
             "/Devices/Bms/Version": {"initial": None, "textformat": _s},
             "/Devices/Dmc/Version": {"initial": None, "textformat": _s},
-            "/Devices/NumberOfMultis": {"initial": phase_count, "textformat": _n},
+            "/Devices/NumberOfMultis": {"initial": len(device_phases), "textformat": _n},
+            # ----
+            "/Emulator/Forward/Coalesced": {"initial": None, "textformat": _n},
+            "/Emulator/Forward/Errors": {"initial": None, "textformat": _n},
+            "/Emulator/Forward/Latency": {"initial": None, "textformat": _ms},
+            "/Emulator/Forward/LatencyMax": {"initial": None, "textformat": _ms},
+            "/Emulator/Forward/Sent": {"initial": None, "textformat": _n},
+            "/Emulator/Stale/AcLoad": {"initial": None, "textformat": _n},
+            "/Emulator/Stale/Grid": {"initial": None, "textformat": _n},
             # ----
             "/Energy/AcIn1ToAcOut": {"initial": None, "textformat": _n},
             "/Energy/AcIn1ToInverter": {"initial": None, "textformat": _n},
@@ -1412,24 +1608,487 @@ def main():
         }
     )
 
-    time_driver_started = int(time())
+    return compact_dbus_paths(paths_multiplus_dbus)
+
+
+def replay(trace_file: str, output_file: str = None, profile_file: str = None):
+    """
+    Feed a recorded trace into the emulator faster than real time.
+
+    The emulator runs on the in-memory backend and ticks once per second of trace time. After each
+    tick the /Ac/ActiveIn/* and /Energy/* values are written as JSON line to `output_file` (default
+    stdout). The CPU profile of the ticks is printed to stderr and optionally saved to `profile_file`.
+    """
+    import cProfile
+    import pstats
+    import tempfile
+    from time import perf_counter
+
+    from inputtrace import read_trace
+    from memorybus import ManualClock, MemoryItemImport, MemoryService
+
+    start, records = read_trace(trace_file)
+    clock = ManualClock(start)
 
-    # has to be called before DbusMultiPlusEmulator() else it does not work
-    system_items, grid_items, ac_load_items = setup_dbus_external_items()
+    # do not touch the energy counters of the real installation
+    tmpdir = tempfile.TemporaryDirectory(prefix="dbus-multiplus-emulator-replay-")
+    device_config = dict(device_configs[0])
+    device_config["data_watt_hours_storage_file"] = os.path.join(tmpdir.name, "data_watt_hours.json")
+    device_config["data_watt_hours_working_file"] = os.path.join(tmpdir.name, "data_watt_hours_working.json")
+    device_config["settings_file"] = os.path.join(tmpdir.name, "settings.json")
+
+    paths = create_multiplus_dbus_paths(len(device_config["phase_used"]), get_device_phases(device_config))
+    output_paths = [path for path in paths if path.startswith("/Ac/ActiveIn/") or path.startswith("/Energy/")]
 
     dbus_multiplus_emulator = DbusMultiPlusEmulator(
-        servicename="com.victronenergy.vebus.ttyS3",
+        servicename="com.victronenergy.vebus.replay",
         deviceinstance=275,
-        paths=paths_multiplus_dbus,
+        paths=paths,
+        dbusservice=MemoryService("com.victronenergy.vebus.replay"),
+        clock=clock,
+        device_config=device_config,
+    )
+    items = {
+        "system": dbus_multiplus_emulator.system_items,
+        "grid": dbus_multiplus_emulator.grid_items,
+        "acload": dbus_multiplus_emulator.ac_load_items,
+    }
+    imports = {}
+
+    output = open(output_file, "w") if output_file is not None else sys.stdout
+    profile = cProfile.Profile()
+    ticks = 0
+    next_tick = 1.0
+    time_started = perf_counter()
+
+    def tick():
+        nonlocal ticks, next_tick
+        if ticks == 0:
+            # the items are complete before the first tick, the age follows the trace time
+            dbus_multiplus_emulator.track_input_age(clock)
+        clock.advance(1)
+        profile.enable()
+        dbus_multiplus_emulator._update()
+        profile.disable()
+        ticks += 1
+        next_tick += 1.0
+        values = {"time": next_tick - 1.0}
+        values.update({path: dbus_multiplus_emulator._dbusservice[path] for path in output_paths})
+        output.write(json.dumps(values) + "\n")
+
+    for record in records:
+        if record[0] == "item":
+            _, role, service_name, path, exists = record
+            # items of further devices
+            if role not in items:
+                continue
+            if exists:
+                imports[(service_name, path)] = items[role][path] = MemoryItemImport(service_name, path)
+            else:
+                items[role][path] = None
+            continue
+
+        _, seconds, service_name, path, value = record
+        # the emulator needs at least the system values to tick
+        while seconds >= next_tick and items["system"] != {}:
+            tick()
+        if (service_name, path) in imports:
+            imports[(service_name, path)].publish(value)
+
+    if items["system"] != {}:
+        tick()
+
+    duration = perf_counter() - time_started
+    if output is not sys.stdout:
+        output.close()
+    tmpdir.cleanup()
+
+    print(f"Replayed {ticks} ticks ({ticks} seconds of trace) in {duration:.3f} seconds, {ticks / duration if duration else 0:.0f}x real time", file=sys.stderr)
+    stats = pstats.Stats(profile, stream=sys.stderr)
+    stats.sort_stats("cumulative").print_stats(20)
+    if profile_file is not None:
+        stats.dump_stats(profile_file)
+
+
+class StartupProfile:
+    """
+    Time spent per startup phase, printed with --startup-profile.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases = {}
+        self._last = started
+
+    def mark(self, phase: str):
+        """
+        Add the time since the last mark to `phase`, a phase can be marked several times.
+        """
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def print(self):
+        for phase, seconds in self.phases.items():
+            print(f"{phase:<20} {seconds * 1000:9.1f} ms", file=sys.stderr)
+        print(f"{'total':<20} {(self._last - self.started) * 1000:9.1f} ms", file=sys.stderr)
+
+
+def main():
+    startup_profile = StartupProfile(time_import_started)
+
+    parser = argparse.ArgumentParser(description="Emulates a MultiPlus II in Venus OS")
+    parser.add_argument("--replay", metavar="TRACE", help="replay a trace recorded with trace_file instead of connecting to dbus")
+    parser.add_argument("--replay-output", metavar="FILE", help="write the replayed values to this file instead of stdout")
+    parser.add_argument("--replay-profile", metavar="FILE", help="save the CPU profile of the replay to this file")
+    parser.add_argument("--startup-profile", action="store_true", help="print the time spent per startup phase to stderr")
+    args = parser.parse_args()
+    startup_profile.mark("imports")
+
+    if args.replay:
+        try:
+            load_config()
+        except StartupError as error:
+            logging.error(str(error))
+            sys.exit(1)
+        replay(args.replay, args.replay_output, args.replay_profile)
+        return
+
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
+    from vedbus import VeDbusService, wrap_dbus_value
+
+    startup_profile.mark("imports")
+
+    _thread.daemon = True  # allow the program to quit
+
+    # Have a mainloop, so we can send/receive asynchronous calls to and from dbus
+    DBusGMainLoop(set_as_default=True)
+
+    def _new_connection(private: bool = False):
+        # on a CC GX the systembus is used
+        return dbus.SessionBus(private=private) if "DBUS_SESSION_BUS_ADDRESS" in os.environ else dbus.SystemBus(private=private)
+
+    dbus_connection = None
+    # imports of the last discovery, shared with the meters looked up again after a config change
+    input_cache = None
+    status_service = None
+    trace_recorder = None
+    tick_scheduler = None
+    discovered = []
+    # the discovered items are from the layout cache and not validated yet
+    warm_start = False
+    dbus_multiplus_emulators = []
+
+    # ----- STARTUP STAGES -----
+    # every stage can fail with a StartupError and is then retried by the supervisor, the results of
+    # the stages before are kept
+
+    def connect():
+        nonlocal dbus_connection
+        try:
+            # one connection for all imports
+            dbus_connection = _new_connection()
+        except dbus.exceptions.DBusException as error:
+            raise StartupError(f"Could not connect to dbus: {error}.")
+        startup_profile.mark("connect")
+
+    def publish_status():
+        nonlocal status_service
+        # own connection, since the object paths are registered per connection
+        service = VeDbusService(status_service_name, bus=_new_connection(private=True), register=False)
+        service.add_path("/Mgmt/ProcessName", __file__)
+        service.add_path("/Mgmt/ProcessVersion", "Unkown version, and running on Python " + "%d.%d.%d" % sys.version_info[:3])
+        service.add_path("/Mgmt/Connection", "Supervisor")
+        service.add_path("/State", supervisor.state)
+        service.add_path("/Degraded", 0)
+        service.add_path("/Retries", 0)
+        service.add_path("/NextRetry", None, gettextcallback=lambda p, v: "%.1fs" % v)
+        service.add_path("/LastError", "")
+        # distance of the ticks to the second boundaries, see tickscheduler.py
+        service.add_path("/Tick/Jitter", None, gettextcallback=lambda p, v: "%.1fms" % v)
+        service.add_path("/Tick/JitterMean", None, gettextcallback=lambda p, v: "%.1fms" % v)
+        service.add_path("/Tick/JitterMax", None, gettextcallback=lambda p, v: "%.1fms" % v)
+        service.add_path("/Tick/Missed", 0)
+        try:
+            service.register()
+        except dbus.exceptions.NameExistsException:
+            raise StartupError(f"{status_service_name} is already on dbus, is the driver running twice?")
+        status_service = service
+        startup_profile.mark("status")
+
+    def configure():
+        nonlocal trace_recorder
+        load_config()
+
+        # dump the last ticks on "kill -USR1 <pid>"
+        if tick_log.enabled:
+            tick_log.install_signal_handler(signal.SIGUSR1, tick_log_file)
+
+        # record all imported values for a later replay
+        trace_recorder = TraceRecorder(trace_file) if trace_file != "" else None
+        startup_profile.mark("config")
+
+    def discover_items() -> list:
+        nonlocal input_cache
+        # the list of services has to be fetched again on every attempt
+        input_cache = DbusInputCache(dbus_connection)
+
+        devices = []
+        for device_config in device_configs:
+            # has to be called before DbusMultiPlusEmulator() else it does not work
+            try:
+                items = setup_dbus_external_items(input_cache, device_config["dbus_service_name_grid"], device_config["dbus_service_name_ac_load"])
+            except dbus.exceptions.DBusException as error:
+                # e.g. a service which left the bus while its items were imported
+                raise StartupError(f"Could not import the items: {error}.")
+            if items[0] == {}:
+                raise StartupError("com.victronenergy.system is not on dbus yet.")
+            devices.append((device_config,) + items)
+        return devices
+
+    def discover():
+        nonlocal discovered, warm_start
+        # after a restart start with the imports of the last run, they are validated after the first publish
+        if layout_cache_file != "" and supervisor.retries == 0:
+            devices = load_layout(layout_cache_file, device_configs)
+            if devices is not None:
+                logging.info(f"Using the imports cached in {layout_cache_file} until they are validated")
+                discovered = devices
+                warm_start = True
+                startup_profile.mark("discovery (cache)")
+                return
+
+        discovered = discover_items()
+        warm_start = False
+        startup_profile.mark("discovery")
+
+    def attach_items():
+        for dbus_multiplus_emulator, (device_config, system_items, grid_items, ac_load_items) in zip(dbus_multiplus_emulators, discovered):
+            dbus_multiplus_emulator.system_items = system_items
+            dbus_multiplus_emulator.grid_items = grid_items
+            dbus_multiplus_emulator.ac_load_items = ac_load_items
+            dbus_multiplus_emulator.track_input_age()
+
+        # the cached items are not recorded, they would replay the values of the last run
+        if trace_recorder is not None and not warm_start:
+            for index, (device_config, system_items, grid_items, ac_load_items) in enumerate(discovered):
+                # the replay uses the roles without prefix, which are the ones of the first device
+                prefix = "" if index == 0 else f"device.{device_config['name']}/"
+                trace_recorder.add_items(prefix + "system", system_items)
+                trace_recorder.add_items(prefix + "grid", grid_items)
+                trace_recorder.add_items(prefix + "acload", ac_load_items)
+
+    def save_layout_cache():
+        # the current items, which include the meters changed by a config reload
+        save_layout(
+            layout_cache_file,
+            [(emulator._device_config, emulator.system_items, emulator.grid_items, emulator.ac_load_items) for emulator in dbus_multiplus_emulators],
+        )
+        return True
+
+    def cache_layout():
+        if layout_cache_file != "":
+            save_layout_cache()
+            # keep the last values in the cache up to date, it is on the ramdisk
+            GLib.timeout_add_seconds(60, save_layout_cache)
+
+    def validate_layout():
+        nonlocal discovered, warm_start
+        try:
+            devices = discover_items()
+        except StartupError:
+            # do not publish the values of the last run while waiting, the supervisor validates them again
+            for device_config, *items in discovered:
+                for role_items in items:
+                    for item in role_items.values():
+                        if item is not None:
+                            item.publish(None)
+            raise
+
+        for (device_config, *cached), (_, *live) in zip(discovered, devices):
+            changed = [role for role, cached_items, live_items in zip(("system", "grid", "ac load"), cached, live) if layout_signature(cached_items) != layout_signature(live_items)]
+            if changed:
+                logging.warning(f"{device_config['servicename']}: the {', '.join(changed)} imports changed since the last run")
+
+        discovered = devices
+        warm_start = False
+        attach_items()
+        cache_layout()
+        logging.info(f"Validated the cached imports {(perf_counter() - time_import_started):.3f} seconds after the start")
+
+    def register():
+        def release(dbusservice, private: bool):
+            # removes the object paths and releases the name, a private connection is not used by anything else
+            dbusservice.__del__()
+            if private:
+                dbusservice.dbusconn.close()
+
+        for index, (device_config, *items) in enumerate(discovered):
+            # object paths are registered per connection, so every further device needs its own private connection
+            dbusservice = VeDbusService(device_config["servicename"], bus=None if index == 0 else _new_connection(private=True), register=False)
+            try:
+                emulator = DbusMultiPlusEmulator(
+                    servicename=device_config["servicename"],
+                    deviceinstance=device_config["deviceinstance"],
+                    paths=create_multiplus_dbus_paths(len(device_config["phase_used"]), get_device_phases(device_config)),
+                    productname=device_config["productname"],
+                    device_config=device_config,
+                    dbusservice=dbusservice,
+                )
+            except dbus.exceptions.NameExistsException:
+                # release the failing and the already registered devices, all are registered again on the next attempt
+                release(dbusservice, index > 0)
+                for registered_index, registered in enumerate(dbus_multiplus_emulators):
+                    release(registered._dbusservice, registered_index > 0)
+                dbus_multiplus_emulators.clear()
+                raise StartupError(f"{device_config['servicename']} is already on dbus.")
+
+            emulator.forward_setpoints(send_setpoint, GLib.timeout_add)
+            dbus_multiplus_emulators.append(emulator)
+
+        attach_items()
+        if trace_recorder is not None:
+            GLib.timeout_add_seconds(60, trace_recorder.flush)
+
+        startup_profile.mark("export registration")
+
+    def run():
+        nonlocal tick_scheduler
+        tick_scheduler = TickScheduler(_update, GLib.timeout_add, GLib.timeout_add_seconds, coalesced=config["DEFAULT"].get("tick_coalesced", "0") == "1")
+
+        # publish the first values right away instead of after the first interval
+        _update()
+        startup_profile.mark("first publish")
+        logging.info(f"Started in {(perf_counter() - time_import_started):.3f} seconds")
+        if args.startup_profile:
+            startup_profile.print()
+
+        # the discovery blocks, so the cached imports are validated after the first publish but before the
+        # ticks are scheduled, instead of stalling the main loop later
+        if warm_start:
+            validate_layout()
+        else:
+            cache_layout()
+
+        # one tick per second, aligned to the seconds of the monotonic clock
+        tick_scheduler.start()
+
+        # apply changes of the config.ini without restart
+        config_watch_interval = int(config["DEFAULT"].get("config_watch_interval", 5))
+        if config_watch_interval > 0:
+            ConfigWatcher(get_config_file(), reload_config, config_watch_interval).start()
+
+    def reload_config():
+        global config, device_configs
+        try:
+            new_config, new_device_configs = read_config()
+        except StartupError as error:
+            logging.error(f"{error} Keeping the running config.")
+            return
+
+        logging.getLogger().setLevel(get_logging_level(new_config))
+
+        for key in ("tick_log_size", "tick_log_file", "trace_file", "tick_coalesced"):
+            if new_config["DEFAULT"].get(key) != config["DEFAULT"].get(key):
+                logging.warning(f"{key} is only changed after a restart")
+
+        new_device_configs_by_servicename = {device_config["servicename"]: device_config for device_config in new_device_configs}
+        for dbus_multiplus_emulator in dbus_multiplus_emulators:
+            device_config = new_device_configs_by_servicename.pop(dbus_multiplus_emulator._servicename, None)
+            if device_config is None:
+                logging.warning(f"{dbus_multiplus_emulator._servicename} was removed from the config, it is only removed after a restart")
+                continue
+
+            changes = dbus_multiplus_emulator.apply_device_config(device_config)
+
+            # look up the changed meters again, the system items and the other devices keep their items
+            roles = [role for role in meter_roles if role[0] in changes]
+            if roles != []:
+                # release the imports of the replaced meters first, so a meter which stays is imported and hooked anew
+                in_use = [emulator.system_items for emulator in dbus_multiplus_emulators]
+                in_use += [getattr(emulator, attribute) for emulator in dbus_multiplus_emulators for key, attribute, *_ in meter_roles if emulator is not dbus_multiplus_emulator or key not in changes]
+                for key, attribute, *_ in roles:
+                    input_cache.release(getattr(dbus_multiplus_emulator, attribute), in_use)
+
+                input_cache.refresh()
+                for key, attribute, service_prefix, description, trace_role in roles:
+                    _, items = setup_meter_items(input_cache, device_config[key], service_prefix, description)
+                    setattr(dbus_multiplus_emulator, attribute, items)
+                    if trace_recorder is not None:
+                        prefix = "" if dbus_multiplus_emulator is dbus_multiplus_emulators[0] else f"device.{device_config['name']}/"
+                        trace_recorder.add_items(prefix + trace_role, items)
+                dbus_multiplus_emulator.track_input_age()
+
+        for servicename in new_device_configs_by_servicename:
+            logging.warning(f"{servicename} was added to the config, it is only added after a restart")
+
+        config = new_config
+        device_configs = new_device_configs
+
+    def send_setpoint(service: str, path: str, value, reply_handler, error_handler):
+        # non-blocking SetValue on the connection of the imports, the reply is handled in the main loop
+        dbus_connection.call_async(service, path, "com.victronenergy.BusItem", "SetValue", "v", [wrap_dbus_value(value)], reply_handler, error_handler)
+
+    # one tick for all devices
+    def _update():
+        for dbus_multiplus_emulator in dbus_multiplus_emulators:
+            dbus_multiplus_emulator._update()
+
+        # jitter of the ticks in milliseconds, in one ItemsChanged signal
+        if status_service is not None and tick_scheduler.ticks:
+            with status_service as service:
+                service["/Tick/Jitter"] = round(tick_scheduler.jitter * 1000, 1)
+                service["/Tick/JitterMean"] = round(tick_scheduler.jitter_mean * 1000, 1)
+                service["/Tick/JitterMax"] = round(tick_scheduler.jitter_max * 1000, 1)
+                service["/Tick/Missed"] = tick_scheduler.missed
+        return True
+
+    def _status_changed(supervisor):
+        # time spent in failed attempts and waiting for the next attempt
+        if supervisor.degraded:
+            startup_profile.mark("retries")
+        if status_service is not None:
+            status_service["/State"] = supervisor.state
+            status_service["/Degraded"] = int(supervisor.degraded)
+            status_service["/Retries"] = supervisor.retries
+            status_service["/NextRetry"] = supervisor.next_retry
+            status_service["/LastError"] = supervisor.last_error
+
+    supervisor = Supervisor(
+        [
+            ("connect", connect),
+            ("status", publish_status),
+            ("config", configure),
+            ("discovery", discover),
+            ("registration", register),
+            ("first publish", run),
+        ],
+        on_change=_status_changed,
     )
 
-    dbus_multiplus_emulator.system_items = system_items
-    dbus_multiplus_emulator.grid_items = grid_items
-    dbus_multiplus_emulator.ac_load_items = ac_load_items
+    def _terminate():
+        # daemontools stops the service with SIGTERM, leave the main loop to save the state and close the trace below
+        logging.warning("Received SIGTERM, stopping")
+        mainloop.quit()
+        return False
+
+    supervisor.start()
 
     logging.info("Connected to dbus and switching over to GLib.MainLoop() (= event based)")
     mainloop = GLib.MainLoop()
-    mainloop.run()
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signal.SIGTERM, _terminate)
+    try:
+        mainloop.run()
+    finally:
+        # keep the settings changed within the save delay and the energy since the last persistent save
+        for dbus_multiplus_emulator in dbus_multiplus_emulators:
+            dbus_multiplus_emulator.save_state()
+        # without the gzip trailer the trace can only be read up to the last flush
+        if trace_recorder is not None:
+            trace_recorder.close()
 
 
 if __name__ == "__main__":
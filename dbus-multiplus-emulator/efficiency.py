@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Conversion losses of the inverter/charger.
+
+The efficiency curve is configured as points of load and efficiency, both in percent, where the
+load is relative to `inverter_max_power`:
+
+    inverter_efficiency = 5:85, 10:91, 25:95, 50:95.5, 100:94
+
+At startup the curve is sampled into a lookup table with a fixed number of steps between no load and
+`inverter_max_power`, so a tick only needs one index calculation and a linear interpolation between
+two neighbouring entries. Below the first point the efficiency of the first point is used, above the
+last point the one of the last point. Without points the conversion is lossless.
+"""
+
+from functools import lru_cache
+
+# number of steps of the lookup table between no load and inverter_max_power
+RESOLUTION = 100
+
+
+def parse_efficiency_points(value: str) -> tuple:
+    """
+    Returns the points of `value`, e.g. "10:91, 50:95.5", as sorted tuple of (load, efficiency) fractions.
+    Raises ValueError for an invalid value.
+    """
+    points = []
+    for point in value.replace(" ", "").split(","):
+        if point == "":
+            continue
+        load, separator, efficiency = point.partition(":")
+        if separator == "":
+            raise ValueError(f"point {point} is not in the format <load>:<efficiency>")
+        try:
+            load = float(load) / 100
+            efficiency = float(efficiency) / 100
+        except ValueError:
+            raise ValueError(f"point {point} has to contain two numbers")
+        if load < 0:
+            raise ValueError(f"load of point {point} has to be 0 or more")
+        if not 0 < efficiency <= 1:
+            raise ValueError(f"efficiency of point {point} has to be above 0 and at most 100")
+        points.append((load, efficiency))
+
+    points.sort()
+    if len(set(load for load, _ in points)) != len(points):
+        raise ValueError("every load can only be used once")
+    return tuple(points)
+
+
+class EfficiencyCurve:
+    """
+    Efficiency of one unit over its load, sampled into a lookup table.
+    """
+
+    __slots__ = ("max_power", "table", "_scale")
+
+    def __init__(self, points: tuple, max_power: float, resolution: int = RESOLUTION):
+        self.max_power = max_power
+        # steps of the table per watt
+        self._scale = resolution / max_power if max_power > 0 else 0
+
+        if points == ():
+            self.table = (1.0,) * (resolution + 1)
+            return
+
+        table = []
+        for step in range(resolution + 1):
+            load = step / resolution
+            if load <= points[0][0]:
+                table.append(points[0][1])
+            elif load >= points[-1][0]:
+                table.append(points[-1][1])
+            else:
+                for (load_low, efficiency_low), (load_high, efficiency_high) in zip(points, points[1:]):
+                    if load <= load_high:
+                        table.append(efficiency_low + (efficiency_high - efficiency_low) * (load - load_low) / (load_high - load_low))
+                        break
+        self.table = tuple(table)
+
+    def efficiency(self, power: float) -> float:
+        """
+        Returns the efficiency at `power` watts of one unit, the sign of the power is ignored.
+        """
+        position = abs(power) * self._scale
+        step = int(position)
+        table = self.table
+        # at or above the maximum power
+        if step >= len(table) - 1:
+            return table[-1]
+        low = table[step]
+        return low + (table[step + 1] - low) * (position - step)
+
+    def to_ac(self, dc_power: float, units: int = 1) -> float:
+        """
+        Returns the AC side power of `dc_power` watts split equally between `units` units.
+        Charging (positive) needs more power on the AC side, discharging (negative) delivers less.
+        """
+        # same as efficiency(), inlined since it is called for every phase on every tick
+        position = abs(dc_power / units) * self._scale
+        step = int(position)
+        table = self.table
+        if step >= len(table) - 1:
+            efficiency = table[-1]
+        else:
+            low = table[step]
+            efficiency = low + (table[step + 1] - low) * (position - step)
+        return dc_power / efficiency if dc_power > 0 else dc_power * efficiency
+
+
+@lru_cache(maxsize=None)
+def get_efficiency_curve(points: tuple, max_power: float) -> EfficiencyCurve:
+    """
+    Returns the curve of `points` for units with `max_power` watts, shared between devices with the same settings.
+    """
+    return EfficiencyCurve(points, max_power)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""
+Energy counters of the flows between the AC inputs, the AC output and the inverter.
+
+Every tick the power of each flow is multiplied with the time since the last tick and added to an
+integer counter in milliwatt-seconds. Integers do not lose small flows to rounding, however long the
+driver runs, and the counters are only converted to kWh when they are published or saved.
+
+The flows of a phase follow from its AC input, inverter and AC output power (see powerflow.py). The
+three are in balance, so either one of them supplies the other two or two of them supply the third:
+
+    AC input 1 -> AC output     AcIn1ToAcOut
+    AC input 1 -> inverter      AcIn1ToInverter
+    AC output  -> AC input 1    AcOutToAcIn1
+    inverter   -> AC input 1    InverterToAcIn1
+    inverter   -> AC output     InverterToAcOut
+    AC output  -> inverter      OutToInverter
+
+The emulated unit has only one AC input, so the flows of AC input 2 stay at 0. The charged and
+discharged energy on the DC side of the battery is counted as well.
+
+The counters are saved as
+
+    {
+        "dc": {"charging": <kWh>, "discharging": <kWh>},
+        "energy_mws": {"DcCharging": <mWs>, "DcDischarging": <mWs>, "AcIn1ToAcOut": <mWs>, ...}
+    }
+
+where "dc" is the format of previous versions. A file with only "dc" is taken over into the flows which
+count the charged and discharged energy of the emulated unit, AcIn1ToInverter and InverterToAcIn1.
+"""
+
+# milliwatt-seconds per kWh
+MWS_PER_KWH = 3600 * 1000 * 1000
+
+# longest interval in seconds which is integrated, a few ticks, a longer gap e.g. after a suspend is not counted
+MAX_INTERVAL = 5.0
+
+# /Energy/<flow>
+FLOWS = (
+    "AcIn1ToAcOut",
+    "AcIn1ToInverter",
+    "AcIn2ToAcOut",
+    "AcIn2ToInverter",
+    "AcOutToAcIn1",
+    "AcOutToAcIn2",
+    "InverterToAcIn1",
+    "InverterToAcIn2",
+    "InverterToAcOut",
+    "OutToInverter",
+)
+
+# flows of a phase as returned by split_flows(), index in FLOWS
+PHASE_FLOWS = tuple(
+    FLOWS.index(flow)
+    for flow in (
+        "AcIn1ToAcOut",
+        "AcIn1ToInverter",
+        "AcOutToAcIn1",
+        "InverterToAcIn1",
+        "InverterToAcOut",
+        "OutToInverter",
+    )
+)
+
+DC_CHARGING = "DcCharging"
+DC_DISCHARGING = "DcDischarging"
+
+
+def split_flows(ac_in: float, inverter: float, ac_out: float) -> tuple:
+    """
+    Returns the flows of one phase in watts as (AcIn1ToAcOut, AcIn1ToInverter, AcOutToAcIn1,
+    InverterToAcIn1, InverterToAcOut, OutToInverter).
+
+    `ac_in` is positive when taken from the AC input, `inverter` when fed to the AC side and `ac_out`
+    when delivered to the loads of the AC output, with ac_out = ac_in + inverter.
+    """
+    if ac_in >= 0 and inverter >= 0:
+        # AC input and inverter supply the AC output
+        return (ac_in, 0, 0, 0, inverter, 0)
+    if ac_in >= 0 and ac_out <= 0:
+        # AC input and a source on the AC output charge
+        return (0, ac_in, 0, 0, 0, -ac_out)
+    if inverter >= 0 and ac_out <= 0:
+        # inverter and a source on the AC output feed into the AC input
+        return (0, 0, -ac_out, inverter, 0, 0)
+    if ac_in > 0:
+        # AC input supplies the charger and the AC output
+        return (ac_out, -inverter, 0, 0, 0, 0)
+    if inverter > 0:
+        # inverter supplies the AC input and the AC output
+        return (0, 0, 0, -ac_in, ac_out, 0)
+    # a source on the AC output supplies the AC input and the charger
+    return (0, 0, -ac_in, 0, 0, -inverter)
+
+
+class EnergyCounters:
+    """
+    Integer counters in milliwatt-seconds of the /Energy/* flows and of the DC side.
+    """
+
+    __slots__ = ("flows", "dc_charging", "dc_discharging", "_time", "_paths", "_published", "_published_flows")
+
+    def __init__(self, data: dict, now: float):
+        """
+        `data` is the saved JSON as returned by to_json() or {}, `now` the monotonic time in seconds of the start of the first interval.
+        """
+        counters = data.get("energy_mws")
+        if counters is not None:
+            self.flows = [int(counters.get(flow, 0)) for flow in FLOWS]
+            self.dc_charging = int(counters.get(DC_CHARGING, 0))
+            self.dc_discharging = int(counters.get(DC_DISCHARGING, 0))
+        else:
+            # format of previous versions
+            dc = data.get("dc", {})
+            self.dc_charging = round(dc.get("charging", 0) * MWS_PER_KWH)
+            self.dc_discharging = round(dc.get("discharging", 0) * MWS_PER_KWH)
+            # the emulated unit has no loads on its AC output, so charging and discharging go through the AC input
+            self.flows = [0] * len(FLOWS)
+            self.flows[FLOWS.index("AcIn1ToInverter")] = self.dc_charging
+            self.flows[FLOWS.index("InverterToAcIn1")] = self.dc_discharging
+
+        self._time = now
+        self._paths = tuple(f"/Energy/{flow}" for flow in FLOWS)
+        # kWh values which were written last and the counters they were calculated from, None before the first write
+        self._published = [None] * len(FLOWS)
+        self._published_flows = [None] * len(FLOWS)
+
+    def add(self, powerflow, dc_power: float, now: float):
+        """
+        Add the flows of all phases of `powerflow` and the DC power since the last call, at most for MAX_INTERVAL seconds.
+        `now` is the monotonic time in seconds.
+        """
+        seconds = min(now - self._time, MAX_INTERVAL)
+        self._time = now
+        if seconds <= 0:
+            return
+
+        watts = [0.0] * len(PHASE_FLOWS)
+        for ac_in, inverter, ac_out in zip(powerflow.in_p, powerflow.inverter_p, powerflow.out_p):
+            # a phase without values, e.g. the ac load meter has no power for it
+            if ac_in is None:
+                continue
+            for index, power in enumerate(split_flows(ac_in, inverter, ac_out)):
+                watts[index] += power
+
+        factor = seconds * 1000
+        flows = self.flows
+        for index, power in zip(PHASE_FLOWS, watts):
+            if power:
+                flows[index] += round(power * factor)
+
+        if dc_power > 0:
+            self.dc_charging += round(dc_power * factor)
+        elif dc_power < 0:
+            self.dc_discharging -= round(dc_power * factor)
+
+    def publish(self, dbusservice):
+        """
+        Write the counters in kWh to the exported service, only the ones which changed at this resolution.
+        """
+        published = self._published
+        published_flows = self._published_flows
+        for index, (path, value, published_value) in enumerate(zip(self._paths, self.flows, published_flows)):
+            # most flows are 0 or did not change since the last tick, then they do not need to be converted
+            if value == published_value:
+                continue
+            published_flows[index] = value
+            value = round(value / MWS_PER_KWH, 3)
+            if value != published[index]:
+                dbusservice[path] = published[index] = value
+
+    def to_json(self) -> dict:
+        counters = dict(zip(FLOWS, self.flows))
+        counters[DC_CHARGING] = self.dc_charging
+        counters[DC_DISCHARGING] = self.dc_discharging
+        return {
+            "dc": {
+                "charging": round(self.dc_charging / MWS_PER_KWH, 3),
+                "discharging": round(self.dc_discharging / MWS_PER_KWH, 3),
+            },
+            "energy_mws": counters,
+        }
@@ -27,6 +27,7 @@ import traceback
 import os
 from collections import defaultdict
 from functools import partial
+from sys import intern
 
 # our own packages
 from ve_utils import exit_on_error, wrap_dbus_value, unwrap_dbus_value, add_name_owner_changed_receiver
@@ -42,7 +43,11 @@ class SessionBus(dbus.bus.BusConnection):
 	def __new__(cls):
 		return dbus.bus.BusConnection.__new__(cls, dbus.bus.BusConnection.TYPE_SESSION)
 
+# The records below have __slots__ instead of a __dict__, since there is one per monitored path.
+# Subclasses which add attributes get a __dict__ again.
 class MonitoredValue(object):
+	__slots__ = ('value', 'text', 'options')
+
 	def __init__(self, value, text, options):
 		super(MonitoredValue, self).__init__()
 		self.value = value
@@ -54,6 +59,8 @@ class MonitoredValue(object):
 		return iter((self.value, self.text, self.options))
 
 class Service(object):
+	__slots__ = ('id', 'name', 'paths', '_seen', 'deviceInstance')
+
 	def __init__(self, id, serviceName, deviceInstance):
 		super(Service, self).__init__()
 		self.id = id
@@ -65,9 +72,12 @@ class Service(object):
 	# For legacy code, attributes can still be accessed as if keys from a
 	# dictionary.
 	def __setitem__(self, key, value):
-		self.__dict__[key] = value
+		setattr(self, key, value)
 	def __getitem__(self, key):
-		return self.__dict__[key]
+		try:
+			return getattr(self, key)
+		except AttributeError:
+			raise KeyError(key)
 
 	def set_seen(self, path):
 		self._seen.add(path)
@@ -82,15 +92,37 @@ class Service(object):
 class DbusMonitor(object):
 	## Constructor
 	def __init__(self, dbusTree, valueChangedCallback=None, deviceAddedCallback=None,
-					deviceRemovedCallback=None, namespace="com.victronenergy", ignoreServices=[]):
+					deviceRemovedCallback=None, namespace="com.victronenergy", ignoreServices=[],
+					batchValueChangedCallback=None, asyncScan=False, scanReadyCallback=None,
+					maxPendingScans=8, scopedSignals=False):
 		# valueChangedCallback is the callback that we call when something has changed.
 		# def value_changed_on_dbus(dbusServiceName, dbusPath, options, changes, deviceInstance):
 		# in which changes is a tuple with GetText() and GetValue()
 		self.valueChangedCallback = valueChangedCallback
+		# batchValueChangedCallback is called once per main loop iteration with all changes since
+		# the last call, as a list of (dbusServiceName, dbusPath, options, changes, deviceInstance).
+		# def values_changed_on_dbus(changes):
+		self.batchValueChangedCallback = batchValueChangedCallback
 		self.deviceAddedCallback = deviceAddedCallback
 		self.deviceRemovedCallback = deviceRemovedCallback
 		self.dbusTree = dbusTree
 		self.ignoreServices = ignoreServices
+		# Only services in this namespace are contacted, e.g. com.victronenergy
+		self.namespace = namespace
+
+		# With asyncScan the services found on startup are scanned with asynchronous calls, at
+		# most maxPendingScans at the same time. The constructor returns right away and
+		# scanReadyCallback() is called from the mainloop once all services are scanned.
+		self.scanReadyCallback = scanReadyCallback
+		self.maxPendingScans = maxPendingScans
+		self.scanning = False
+		self._scanQueue = []
+		self._pendingScans = 0
+
+		# With scopedSignals the signals are subscribed per tracked service, so the dbus-daemon
+		# only sends the signals of those services instead of the signals of the whole bus.
+		self.scopedSignals = scopedSignals
+		self._serviceSignals = {}
 
 		# Lists all tracked services. Stores name, id, device instance, value per path, and whenToLog info
 		# indexed by service name (eg. com.victronenergy.settings).
@@ -105,6 +137,10 @@ class DbusMonitor(object):
 		# Keep track of any additional watches placed on items
 		self.serviceWatches = defaultdict(list)
 
+		# Changes not yet passed to the callbacks, indexed by (service name, path). A further change
+		# of the same path replaces the pending one, so only the last value is dispatched.
+		self._pendingChanges = {}
+
 		# For a PC, connect to the SessionBus
 		# For a CCGX, connect to the SystemBus
 		self.dbusConn = SessionBus() if 'DBUS_SESSION_BUS_ADDRESS' in os.environ else SystemBus()
@@ -116,20 +152,29 @@ class DbusMonitor(object):
 
 		add_name_owner_changed_receiver(standardBus, self.dbus_name_owner_changed)
 
-		# Subscribe to PropertiesChanged for all services
-		self.dbusConn.add_signal_receiver(self.handler_value_changes,
-			dbus_interface='com.victronenergy.BusItem',
-			signal_name='PropertiesChanged', path_keyword='path',
-			sender_keyword='senderId')
+		if not scopedSignals:
+			# Subscribe to PropertiesChanged for all services
+			self.dbusConn.add_signal_receiver(self.handler_value_changes,
+				dbus_interface='com.victronenergy.BusItem',
+				signal_name='PropertiesChanged', path_keyword='path',
+				sender_keyword='senderId')
 
-		# Subscribe to ItemsChanged for all services
-		self.dbusConn.add_signal_receiver(self.handler_item_changes,
-			dbus_interface='com.victronenergy.BusItem',
-			signal_name='ItemsChanged', path='/',
-			sender_keyword='senderId')
+			# Subscribe to ItemsChanged for all services
+			self.dbusConn.add_signal_receiver(self.handler_item_changes,
+				dbus_interface='com.victronenergy.BusItem',
+				signal_name='ItemsChanged', path='/',
+				sender_keyword='senderId')
 
 		logger.info('===== Search on dbus for services that we will monitor starting... =====')
 		serviceNames = self.dbusConn.list_names()
+		if asyncScan:
+			self.scanning = True
+			self._scanQueue = [str(serviceName) for serviceName in serviceNames if self.wants_service(serviceName)]
+			self._scanQueue.reverse()
+			# the ready callback is also called from the mainloop if there is nothing to scan
+			GLib.idle_add(exit_on_error, self._start_scans)
+			return
+
 		for serviceName in serviceNames:
 			self.scan_dbus_service(serviceName)
 
@@ -153,6 +198,11 @@ class DbusMonitor(object):
 
 	def _process_name_owner_changed(self, name, oldowner, newowner):
 		if newowner != '':
+			# an asynchronous scan on startup might have found it already
+			service = self.servicesByName.get(name, None)
+			if service is not None and service.id == newowner:
+				return
+
 			# so we found some new service. Check if we can do something with it.
 			newdeviceadded = self.scan_dbus_service(name)
 			if newdeviceadded and self.deviceAddedCallback is not None:
@@ -167,17 +217,88 @@ class DbusMonitor(object):
 			for watch in self.serviceWatches[name]:
 				watch.remove()
 			del self.serviceWatches[name]
+			self._unsubscribe_service(name)
 			self.servicesByClass[service.service_class].remove(service)
 			if self.deviceRemovedCallback is not None:
 				self.deviceRemovedCallback(name, service.deviceInstance)
 
+	def wants_service(self, serviceName):
+		""" Returns if the service could be of interest, without contacting it. """
+		if not serviceName.startswith(self.namespace + '.'):
+			return False
+		if any(serviceName.startswith(x) for x in self.ignoreServices):
+			return False
+		return '.'.join(serviceName.split('.')[0:3]) in self.dbusTree
+
+	def _start_scans(self):
+		while self._scanQueue and self._pendingScans < self.maxPendingScans:
+			serviceName = self._scanQueue.pop()
+			self._pendingScans += 1
+			# the service id is needed to match the signals, so first ask the bus for the owner
+			self.dbusConn.call_async('org.freedesktop.DBus', '/org/freedesktop/DBus',
+				'org.freedesktop.DBus', 'GetNameOwner', 's', [serviceName],
+				reply_handler=partial(self._scan_name_owner_done, serviceName),
+				error_handler=partial(self._scan_failed, serviceName))
+
+		if self.scanning and not self._scanQueue and self._pendingScans == 0:
+			self.scanning = False
+			logger.info('===== Search on dbus for services that we will monitor finished =====')
+			if self.scanReadyCallback is not None:
+				self.scanReadyCallback()
+
+		return False
+
+	def _scan_name_owner_done(self, serviceName, serviceId):
+		logger.info("Found: %s, scanning and storing items" % serviceName)
+		self._subscribe_service(serviceName, str(serviceId))
+		self.dbusConn.call_async(serviceName, '/', None, 'GetItems', '', [],
+			reply_handler=partial(self._scan_getitems_done, serviceName, str(serviceId)),
+			error_handler=partial(self._scan_getitems_failed, serviceName))
+
+	def _scan_getitems_done(self, serviceName, serviceId, values):
+		# the service might have been added by a NameOwnerChanged in the meantime
+		if serviceName not in self.servicesByName and serviceId not in self.servicesById:
+			try:
+				self.scan_dbus_service_getitems_done(serviceName, serviceId, values)
+			except:
+				logger.error("Ignoring %s because of error while scanning:" % (serviceName))
+				traceback.print_exc()
+			if serviceName not in self.servicesByName:
+				self._unsubscribe_service(serviceName)
+		self._scan_done()
+
+	def _scan_getitems_failed(self, serviceName, error):
+		# older services do not support GetItems, fall back to the blocking legacy methods
+		if error.get_dbus_name() in (
+				'org.freedesktop.DBus.Error.ServiceUnknown',
+				'org.freedesktop.DBus.Error.Disconnected'):
+			logger.info("Ignoring %s, it disappeared while scanning" % serviceName)
+			self._unsubscribe_service(serviceName)
+		elif serviceName not in self.servicesByName:
+			logger.info("GetItems failed, trying legacy methods")
+			self.scan_dbus_service(serviceName)
+		self._scan_done()
+
+	def _scan_failed(self, serviceName, error):
+		# the service disappeared before it could be scanned
+		logger.info("Ignoring %s, %s" % (serviceName, error))
+		self._scan_done()
+
+	def _scan_done(self):
+		self._pendingScans -= 1
+		exit_on_error(self._start_scans)
+
 	def scan_dbus_service(self, serviceName):
 		try:
-			return self.scan_dbus_service_inner(serviceName)
+			added = self.scan_dbus_service_inner(serviceName)
 		except:
 			logger.error("Ignoring %s because of error while scanning:" % (serviceName))
 			traceback.print_exc()
-			return False
+			added = False
+
+		if not added and str(serviceName) not in self.servicesByName:
+			self._unsubscribe_service(str(serviceName))
+		return added
 
 			# Errors 'org.freedesktop.DBus.Error.ServiceUnknown' and
 			# 'org.freedesktop.DBus.Error.Disconnected' seem to happen when the service
@@ -208,6 +329,8 @@ class DbusMonitor(object):
 		assert serviceName not in self.servicesByName
 		assert serviceId not in self.servicesById
 
+		self._subscribe_service(serviceName, serviceId)
+
 		# Try to fetch everything with a GetItems, then fall back to older
 		# methods if that fails
 		try:
@@ -246,6 +369,8 @@ class DbusMonitor(object):
 		for path, options in paths.items():
 			# path will be the D-Bus path: '/Ac/ActiveIn/L1/V'
 			# options will be a dictionary: {'code': 'V', 'whenToLog': 'onIntervalAlways'}
+			# the same path string is shared by all services
+			path = intern(path)
 
 			# Try to obtain the value we want from our bulk fetch. If we
 			# cannot find it there, do an individual query.
@@ -277,9 +402,7 @@ class DbusMonitor(object):
 
 		# Adjust self at the end of the scan, so we don't have an incomplete set of
 		# data if an exception occurs during the scan.
-		self.servicesByName[serviceName] = service
-		self.servicesById[serviceId] = service
-		self.servicesByClass[service.service_class].append(service)
+		self._add_service(service)
 
 		return True
 
@@ -303,6 +426,8 @@ class DbusMonitor(object):
 
 		paths = self.dbusTree.get('.'.join(serviceName.split('.')[0:3]), {})
 		for path, options in paths.items():
+			# the same path string is shared by all services
+			path = intern(path)
 			item = values.get(path, notfound)
 			if item is notfound:
 				service.paths[path] = self.make_monitor(service, path, None, None, options)
@@ -312,11 +437,36 @@ class DbusMonitor(object):
 				text = item.get('Text', None)
 				service.paths[path] = self.make_monitor(service, path, unwrap_dbus_value(value), unwrap_dbus_value(text), options)
 
-		self.servicesByName[serviceName] = service
-		self.servicesById[serviceId] = service
-		self.servicesByClass[service.service_class].append(service)
+		self._add_service(service)
 		return True
 
+	def _add_service(self, service):
+		self.servicesByName[service.name] = service
+		self.servicesById[service.id] = service
+		self.servicesByClass[service.service_class].append(service)
+
+	def _subscribe_service(self, serviceName, serviceId):
+		# Subscribe before the values are fetched: the dbus-daemon handles the AddMatch before the
+		# GetItems, so no change after the fetch is missed.
+		if not self.scopedSignals or serviceName in self._serviceSignals:
+			return
+
+		# Match on the unique name, a well-known name would make dbus-python track its owner as well
+		self._serviceSignals[serviceName] = (
+			self.dbusConn.add_signal_receiver(self.handler_value_changes,
+				dbus_interface='com.victronenergy.BusItem',
+				signal_name='PropertiesChanged', path_keyword='path',
+				sender_keyword='senderId', bus_name=serviceId),
+			self.dbusConn.add_signal_receiver(self.handler_item_changes,
+				dbus_interface='com.victronenergy.BusItem',
+				signal_name='ItemsChanged', path='/',
+				sender_keyword='senderId', bus_name=serviceId),
+		)
+
+	def _unsubscribe_service(self, serviceName):
+		for match in self._serviceSignals.pop(serviceName, ()):
+			match.remove()
+
 	def handler_item_changes(self, items, senderId):
 		if not isinstance(items, dict):
 			return
@@ -374,19 +524,36 @@ class DbusMonitor(object):
 		a.value = value
 		a.text = text
 
-		# And do the rest of the processing in on the mainloop
+		# And do the rest of the processing in on the mainloop, all changes until then are
+		# dispatched together by a single idle source
+		if self.valueChangedCallback is None and self.batchValueChangedCallback is None:
+			return
+
+		if not self._pendingChanges:
+			GLib.idle_add(exit_on_error, self._execute_value_changes)
+		self._pendingChanges[(service.name, path)] = ({'Value': value, 'Text': text}, a.options)
+
+	def _execute_value_changes(self):
+		pending = self._pendingChanges
+		self._pendingChanges = {}
+
+		batch = []
+		for (serviceName, objectPath), (changes, options) in pending.items():
+			# double check that the service still exists, as it might have
+			# disappeared between scheduling-for and executing this function.
+			service = self.servicesByName.get(serviceName, None)
+			if service is None:
+				continue
+			batch.append((serviceName, objectPath, options, changes, service.deviceInstance))
+
 		if self.valueChangedCallback is not None:
-			GLib.idle_add(exit_on_error, self._execute_value_changes, service.name, path, {
-				'Value': value, 'Text': text}, a.options)
+			for change in batch:
+				self.valueChangedCallback(*change)
 
-	def _execute_value_changes(self, serviceName, objectPath, changes, options):
-		# double check that the service still exists, as it might have
-		# disappeared between scheduling-for and executing this function.
-		if serviceName not in self.servicesByName:
-			return
+		if self.batchValueChangedCallback is not None and batch:
+			self.batchValueChangedCallback(batch)
 
-		self.valueChangedCallback(serviceName, objectPath,
-			options, changes, self.get_device_instance(serviceName))
+		return False
 
 	# Gets the value for a certain servicename and path
 	# The default_value is returned when:
@@ -7,6 +7,7 @@ import traceback
 import os
 import weakref
 from collections import defaultdict
+from sys import intern
 from ve_utils import wrap_dbus_value, unwrap_dbus_value
 
 # vedbus contains three classes:
@@ -295,6 +296,10 @@ make sure to also subscribe to the NamerOwnerChanged signal on bus-level. Or jus
 because that takes care of all of that for you.
 """
 class VeDbusItemImport(object):
+	# One instance per imported path, so no __dict__. __weakref__ is needed by weak_functor and
+	# the WeakSet of VeDbusRootTracker.
+	__slots__ = ('_serviceName', '_path', '_match', '_proxy', '_eventCallback', '_cachedvalue', '__weakref__')
+
 	def __new__(cls, bus, serviceName, path, eventCallback=None, createsignal=True):
 		instance = object.__new__(cls)
 
@@ -316,8 +321,9 @@ class VeDbusItemImport(object):
 	def __init__(self, bus, serviceName, path, eventCallback=None, createsignal=True):
 		# TODO: is it necessary to store _serviceName and _path? Isn't it
 		# stored in the bus_getobjectsomewhere?
-		self._serviceName = serviceName
-		self._path = path
+		# share the strings with all other imports and monitors of the process
+		self._serviceName = intern(str(serviceName))
+		self._path = intern(str(path))
 		self._match = None
 		# TODO: _proxy is being used in settingsdevice.py, make a getter for that
 		self._proxy = bus.get_object(serviceName, path, introspect=False)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Age of the imported values of a role, to detect meters which stay on the bus but stopped publishing.
+
+VeDbusItemImport keeps the last received value forever. InputAge hooks into the eventCallback of
+all items of a role and stores the monotonic time of the last change per service, so checking if a
+role is stale is a comparison with the oldest change per tick instead of a scan over all items. The
+services are kept in the order of their last change, a change moves the service to the end, so the
+oldest change is the first one and the check does not depend on the number of meters.
+
+The age is tracked per service and not per role: the aggregated items of several meters (see
+meteraggregate.py) are tracked by the items of each meter, so a meter which stopped publishing is
+not hidden by the others while its last values are still part of the sum. The role is stale as soon
+as one of its services is stale.
+
+When the items or max_age change, e.g. after the config.ini changed, the same InputAge tracks the
+new items with track(). An item is hooked only once, so the callbacks do not pile up.
+"""
+
+import logging
+from collections import OrderedDict
+from time import monotonic
+
+from meteraggregate import import_sources
+
+
+class InputAge:
+    """
+    Tracks the time of the last value change of each service of a role.
+
+    `items` is a dictionary as returned by setup_dbus_external_items(), where paths which do not exist
+    are None. A `max_age` of 0 disables the tracking, the role is then never stale. A role without
+    items is never stale, too.
+    """
+
+    __slots__ = ("role", "max_age", "last_change", "stale", "_clock", "_hooked")
+
+    def __init__(self, role: str, items: dict, max_age: float, clock=monotonic):
+        self.role = role
+        self._clock = clock
+        self.max_age = 0
+        # time of the last change per service name, the oldest change first
+        self.last_change = OrderedDict()
+        self.stale = False
+        # hooked items of the tracked services by id, the reference keeps the id from being reused
+        self._hooked = {}
+        self.track(items, max_age)
+
+    def track(self, items: dict, max_age: float):
+        """
+        Track `items` with `max_age` instead of the previous items, the services which were already
+        tracked keep their time of the last change.
+        """
+        # the imported items of the services, an aggregated item stands for the items of its meters
+        sources = import_sources(items)
+        self.max_age = max_age if sources != [] else 0
+        # the values of new services were just read, so they count as fresh
+        now = self._clock()
+        last_change = {source.serviceName: self.last_change.get(source.serviceName, now) for source in sources}
+        self.last_change = OrderedDict(sorted(last_change.items(), key=lambda service: service[1]))
+
+        if self.max_age <= 0:
+            # the items which stay tracked keep their hooks
+            self._hooked = {id(source): source for source in sources if id(source) in self._hooked}
+            return
+
+        hooked = {}
+        for source in sources:
+            if id(source) not in self._hooked:
+                self._hook(source)
+            hooked[id(source)] = source
+        self._hooked = hooked
+
+    def _hook(self, item):
+        # keep an already set callback working, e.g. of the trace recorder or another device
+        previous_callback = item.eventCallback
+        if previous_callback is None:
+            item.eventCallback = self.touch
+        else:
+
+            def _callback(serviceName, path, changes, previous_callback=previous_callback):
+                self.touch(serviceName, path, changes)
+                previous_callback(serviceName, path, changes)
+
+            item.eventCallback = _callback
+
+    def touch(self, serviceName: str, path: str = None, changes: dict = None):
+        """
+        Mark the service as updated now, has the signature of a VeDbusItemImport eventCallback.
+        """
+        # items which are not tracked anymore can still be hooked
+        if serviceName in self.last_change:
+            self.last_change[serviceName] = self._clock()
+            self.last_change.move_to_end(serviceName)
+
+    def is_stale(self) -> bool:
+        """
+        Returns True if no value of one of the services changed for more than max_age seconds. Changes of the state are logged.
+        """
+        now = self._clock()
+        stale = self.max_age > 0 and now - next(iter(self.last_change.values())) > self.max_age
+        if stale != self.stale:
+            self.stale = stale
+            if stale:
+                services = ", ".join(name for name, last_change in self.last_change.items() if now - last_change > self.max_age)
+                logging.warning(f"No {self.role} values received from {services} for more than {self.max_age} seconds, using the fallback")
+            else:
+                logging.warning(f"Receiving {self.role} values again")
+        return stale
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+"""
+Compact binary trace of the imported values, used to record a site and replay it in the lab.
+
+The trace is a gzip stream which starts with a header followed by records. Each record starts with
+a one byte type. Strings (roles, service names and paths) are only written once and are referenced
+by id afterwards.
+
+    header:   b"DMET" | uint8 version | float64 wall clock time of the start
+    STRING:   0x01 | uint16 id | uint16 length | utf-8 bytes
+    ITEM:     0x02 | uint16 role id | uint16 service id | uint16 path id | uint8 exists
+    VALUE:    0x03 | uint64 milliseconds since start | uint16 service id | uint16 path id | value
+
+    value:    uint8 tag | payload
+              0 = None, 1 = float64, 2 = int64, 3 = bool (uint8), 4 = string (uint16 length | utf-8 bytes)
+
+ITEM records describe the imports as they were set up, including the ones which did not exist on
+the bus, so that the replay can rebuild the same dictionaries as setup_dbus_external_items().
+
+Version 1 stored the milliseconds as uint32, which overflows after 49.7 days of recording. Traces
+of version 1 can still be read.
+"""
+
+import logging
+import struct
+from time import monotonic, time
+
+MAGIC = b"DMET"
+VERSION = 2
+
+RECORD_STRING = 0x01
+RECORD_ITEM = 0x02
+RECORD_VALUE = 0x03
+
+TAG_NONE = 0
+TAG_FLOAT = 1
+TAG_INT = 2
+TAG_BOOL = 3
+TAG_STRING = 4
+
+_header = struct.Struct("<4sBd")
+_string = struct.Struct("<HH")
+_item = struct.Struct("<HHHB")
+_value = struct.Struct("<QHHB")
+# VALUE record of version 1
+_value_v1 = struct.Struct("<IHHB")
+_float = struct.Struct("<d")
+_int = struct.Struct("<q")
+_length = struct.Struct("<H")
+
+
+class TraceRecorder:
+    """
+    Records every value change of the imports to a trace file.
+    """
+
+    def __init__(self, filename: str, compresslevel: int = 1):
+        self.filename = filename
+        self.records = 0
+        self._strings = {}
+        # hooked items by id, the reference keeps the id from being reused by a later import
+        self._hooked = {}
+        self._start = monotonic()
+        # imported here, since it is only needed if a trace is recorded or replayed
+        import gzip
+
+        self._file = gzip.open(filename, "wb", compresslevel=compresslevel)
+        self._file.write(_header.pack(MAGIC, VERSION, time()))
+        logging.info(f"Recording imported values to {filename}")
+
+    def _string_id(self, value: str) -> int:
+        try:
+            return self._strings[value]
+        except KeyError:
+            string_id = len(self._strings)
+            if string_id > 0xFFFF:
+                raise OverflowError("Too many different strings in trace")
+            self._strings[value] = string_id
+            encoded = value.encode("utf-8")
+            self._file.write(bytes((RECORD_STRING,)) + _string.pack(string_id, len(encoded)) + encoded)
+            return string_id
+
+    def add_items(self, role: str, items: dict):
+        """
+        Write the imports of a role and their current values and record all further changes.
+
+        `items` is a dictionary as returned by setup_dbus_external_items(), where paths which do not
+        exist are None.
+        """
+        role_id = self._string_id(role)
+        for path, item in items.items():
+            if item is None:
+                # the service name is unknown, but also not needed for a missing path
+                self._file.write(bytes((RECORD_ITEM,)) + _item.pack(role_id, self._string_id(""), self._string_id(path), 0))
+                continue
+
+            self._file.write(bytes((RECORD_ITEM,)) + _item.pack(role_id, self._string_id(item.serviceName), self._string_id(path), 1))
+
+            # items shared between several devices are recorded only once
+            if id(item) in self._hooked:
+                continue
+            self._hooked[id(item)] = item
+            self.record(item.serviceName, path, {"Value": item.get_value()})
+
+            # keep an already set callback working
+            previous_callback = item.eventCallback
+            if previous_callback is None:
+                item.eventCallback = self.record
+            else:
+
+                def _callback(serviceName, path, changes, previous_callback=previous_callback):
+                    self.record(serviceName, path, changes)
+                    previous_callback(serviceName, path, changes)
+
+                item.eventCallback = _callback
+
+    def record(self, serviceName: str, path: str, changes: dict):
+        """
+        Write one value change, has the signature of a VeDbusItemImport eventCallback.
+        """
+        if self._file is None:
+            return
+
+        value = changes.get("Value")
+        milliseconds = int((monotonic() - self._start) * 1000)
+        record = bytes((RECORD_VALUE,)) + _value.pack(milliseconds, self._string_id(serviceName), self._string_id(path), _tag(value))
+
+        if value is None:
+            pass
+        elif isinstance(value, bool):
+            record += bytes((1 if value else 0,))
+        elif isinstance(value, float):
+            record += _float.pack(value)
+        elif isinstance(value, int):
+            record += _int.pack(value)
+        else:
+            encoded = str(value).encode("utf-8")[:0xFFFF]
+            record += _length.pack(len(encoded)) + encoded
+
+        self._file.write(record)
+        self.records += 1
+
+    def flush(self):
+        """
+        Flush the compressed data to the file, so a crash does not lose more than the last interval.
+        """
+        if self._file is not None:
+            self._file.flush()
+        # allow to be used with GLib.timeout_add
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logging.info(f"Recorded {self.records} values to {self.filename}")
+
+
+def _tag(value) -> int:
+    if value is None:
+        return TAG_NONE
+    # bool has to be checked before int, since it is a subclass of int
+    if isinstance(value, bool):
+        return TAG_BOOL
+    if isinstance(value, float):
+        return TAG_FLOAT
+    if isinstance(value, int):
+        return TAG_INT
+    return TAG_STRING
+
+
+def read_trace(filename: str):
+    """
+    Returns the wall clock start time of the trace and a generator of its records:
+
+    ("item", role, serviceName, path, exists) and ("value", seconds since start, serviceName, path, value)
+
+    A trace which was not closed properly (e.g. the driver was killed) is read up to the last
+    complete record.
+    """
+    import gzip
+
+    file = gzip.open(filename, "rb")
+    try:
+        magic, version, start = _header.unpack(file.read(_header.size))
+    except struct.error:
+        file.close()
+        raise ValueError(f"{filename} is not a trace file")
+    if magic != MAGIC or version not in (1, VERSION):
+        file.close()
+        raise ValueError(f"{filename} is not a trace file of version 1 to {VERSION}")
+
+    return start, _read_records(file, _value if version == VERSION else _value_v1)
+
+
+def _read_records(file, value_struct: struct.Struct):
+    strings = {}
+
+    def read(size):
+        data = file.read(size)
+        if len(data) != size:
+            raise EOFError
+        return data
+
+    with file:
+        try:
+            while True:
+                record_type = read(1)[0]
+
+                if record_type == RECORD_STRING:
+                    string_id, length = _string.unpack(read(_string.size))
+                    strings[string_id] = read(length).decode("utf-8")
+
+                elif record_type == RECORD_ITEM:
+                    role_id, service_id, path_id, exists = _item.unpack(read(_item.size))
+                    yield ("item", strings[role_id], strings[service_id], strings[path_id], bool(exists))
+
+                elif record_type == RECORD_VALUE:
+                    milliseconds, service_id, path_id, tag = value_struct.unpack(read(value_struct.size))
+                    if tag == TAG_NONE:
+                        value = None
+                    elif tag == TAG_FLOAT:
+                        value = _float.unpack(read(_float.size))[0]
+                    elif tag == TAG_INT:
+                        value = _int.unpack(read(_int.size))[0]
+                    elif tag == TAG_BOOL:
+                        value = read(1)[0] == 1
+                    else:
+                        value = read(_length.unpack(read(_length.size))[0]).decode("utf-8")
+                    yield ("value", milliseconds / 1000, strings[service_id], strings[path_id], value)
+
+                else:
+                    raise ValueError(f"Unknown record type {record_type}")
+
+        except EOFError:
+            # end of the trace or truncated trace
+            return
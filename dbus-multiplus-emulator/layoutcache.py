@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""
+Warm-start cache of the discovered imports.
+
+The discovery lists all services on dbus, selects the meters and probes every path, which takes
+seconds on a busy GX device. After the discovery the selected services, the paths which exist and
+their last values are written to a small JSON file on the ramdisk. After a restart of the driver
+(but not after a reboot) the imports are first built from this file as in-memory items, so the
+emulator can register and publish right away. The real discovery then runs in the main loop and
+replaces the cached items. A cache which can not be read or has an unexpected structure is
+ignored.
+
+    {
+        "version": 1,
+        "devices": {
+            "<servicename>": {
+                "dbus_service_name_grid": "<config value>",
+                "dbus_service_name_ac_load": "<config value>",
+                "system": {"<path>": ["<service name>", <value>] or null, ...},
+                "grid": {...},
+                "acload": {...}
+            }
+        }
+    }
+"""
+
+import json
+import logging
+import os
+
+from memorybus import MemoryItemImport
+
+VERSION = 1
+
+ROLES = ("system", "grid", "acload")
+
+
+def _dump_items(items: dict) -> dict:
+    return {path: None if item is None else [item.serviceName, item.get_value()] for path, item in items.items()}
+
+
+def _load_items(items: dict) -> dict:
+    return {path: None if item is None else MemoryItemImport(item[0], path, item[1]) for path, item in items.items()}
+
+
+def layout_signature(items: dict) -> dict:
+    """
+    Returns the service name of each path or None if the path does not exist, to compare a cached with a discovered layout.
+    """
+    return {path: None if item is None else item.serviceName for path, item in items.items()}
+
+
+def save_layout(filename: str, devices: list):
+    """
+    Write the layout of `devices`, a list of (device_config, system_items, grid_items, ac_load_items).
+    Has the signature of a GLib source callback, errors are logged but do not stop the driver.
+    """
+    layout = {"version": VERSION, "devices": {}}
+    for device_config, *items in devices:
+        device = {
+            "dbus_service_name_grid": device_config["dbus_service_name_grid"],
+            "dbus_service_name_ac_load": device_config["dbus_service_name_ac_load"],
+        }
+        for role, role_items in zip(ROLES, items):
+            device[role] = _dump_items(role_items)
+        layout["devices"][device_config["servicename"]] = device
+
+    try:
+        # write to a temporary file first, so a crash does not leave a half written cache
+        with open(filename + ".tmp", "w") as file:
+            json.dump(layout, file, default=str)
+        os.replace(filename + ".tmp", filename)
+    except OSError as error:
+        logging.warning(f"Could not write the layout cache {filename}: {error}")
+    return True
+
+
+def load_layout(filename: str, device_configs: list):
+    """
+    Returns the cached devices as list of (device_config, system_items, grid_items, ac_load_items) with
+    MemoryItemImport items, or None if there is no usable cache, e.g. if the devices or meters in the config changed.
+    """
+    try:
+        with open(filename, "r") as file:
+            layout = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as error:
+        logging.warning(f"Ignoring the layout cache {filename}: {error}")
+        return None
+
+    if not isinstance(layout, dict) or layout.get("version") != VERSION:
+        return None
+
+    devices = []
+    try:
+        for device_config in device_configs:
+            device = layout["devices"].get(device_config["servicename"])
+            meters = None if device is None else (device["dbus_service_name_grid"], device["dbus_service_name_ac_load"])
+            if meters != (device_config["dbus_service_name_grid"], device_config["dbus_service_name_ac_load"]) or device["system"] == {}:
+                logging.info(f"Layout cache {filename} does not match the config")
+                return None
+            devices.append((device_config,) + tuple(_load_items(device[role]) for role in ROLES))
+    except (AttributeError, IndexError, KeyError, TypeError) as error:
+        # a cache with a wrong structure is a miss, the discovery runs as without a cache
+        logging.warning(f"Ignoring the malformed layout cache {filename}: {error!r}")
+        return None
+
+    return devices
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""
+In-process replacements for VeDbusItemImport (input source) and VeDbusService (output sink).
+
+They have the same get_value/__getitem__/__setitem__ semantics as the vedbus classes, but keep
+everything in memory. This allows to drive DbusMultiPlusEmulator._update() without any D-Bus,
+e.g. to benchmark the compute path on its own or to replay recorded inputs.
+"""
+
+
+class InputSource:
+    """
+    Interface of an imported value, implemented by VeDbusItemImport and MemoryItemImport.
+    """
+
+    __slots__ = ()
+
+    @property
+    def serviceName(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def path(self) -> str:
+        raise NotImplementedError
+
+    @property
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    def get_value(self):
+        raise NotImplementedError
+
+
+class OutputSink:
+    """
+    Interface of an exported service, implemented by VeDbusService and MemoryService.
+    """
+
+    def add_path(self, path, value, description="", writeable=False, onchangecallback=None, gettextcallback=None, valuetype=None, itemtype=None):
+        raise NotImplementedError
+
+    def register(self):
+        raise NotImplementedError
+
+    def __getitem__(self, path):
+        raise NotImplementedError
+
+    def __setitem__(self, path, newvalue):
+        raise NotImplementedError
+
+    def __contains__(self, path):
+        raise NotImplementedError
+
+
+class MemoryItemImport(InputSource):
+    """
+    Imported value kept in memory. Use publish() to simulate the producer changing the value.
+    """
+
+    __slots__ = ("_serviceName", "_path", "_cachedvalue", "_exists", "eventCallback")
+
+    def __init__(self, serviceName: str, path: str, value=None, exists: bool = True, eventCallback=None):
+        self._serviceName = serviceName
+        self._path = path
+        self._cachedvalue = value
+        self._exists = exists
+        self.eventCallback = eventCallback
+
+    @property
+    def serviceName(self) -> str:
+        return self._serviceName
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def exists(self) -> bool:
+        return self._exists
+
+    def get_value(self):
+        return self._cachedvalue
+
+    def publish(self, value):
+        """
+        Same as a PropertiesChanged signal received by VeDbusItemImport: update the cache and
+        call the eventCallback, if set. Like on D-Bus nothing happens if the value did not change.
+        """
+        if value == self._cachedvalue:
+            return
+        self._cachedvalue = value
+        self._exists = True
+        if self.eventCallback is not None:
+            self.eventCallback(self._serviceName, self._path, {"Value": value, "Text": str(value)})
+
+
+class MemoryService(OutputSink):
+    """
+    Exported service kept in memory.
+
+    Like VeDbusItemExport a value change is only counted as signal if the value is different from
+    the current one, so `signals` is the number of PropertiesChanged signals the real service would
+    have emitted. The changes within `with service:` are counted as one ItemsChanged signal.
+    `reads` and `writes` count all calls of __getitem__ and __setitem__, changed or not.
+    """
+
+    def __init__(self, servicename: str = None):
+        self.name = servicename
+        self.registered = False
+        self.signals = 0
+        self.reads = 0
+        self.writes = 0
+        self._values = {}
+        # number of changes of each open `with service:` block
+        self._batches = []
+        self._gettextcallbacks = {}
+        self._onchangecallbacks = {}
+
+    def add_path(self, path, value, description="", writeable=False, onchangecallback=None, gettextcallback=None, valuetype=None, itemtype=None):
+        self._values[path] = value
+        if gettextcallback is not None:
+            self._gettextcallbacks[path] = gettextcallback
+        if onchangecallback is not None:
+            self._onchangecallbacks[path] = onchangecallback
+
+    def register(self):
+        self.registered = True
+
+    def __getitem__(self, path):
+        self.reads += 1
+        return self._values[path]
+
+    def __setitem__(self, path, newvalue):
+        self.writes += 1
+        # raise a KeyError for unknown paths, like VeDbusService does
+        if self._values[path] == newvalue:
+            return
+        self._values[path] = newvalue
+        if self._batches:
+            self._batches[-1] += 1
+        else:
+            self.signals += 1
+
+    def __delitem__(self, path):
+        del self._values[path]
+
+    def __contains__(self, path):
+        return path in self._values
+
+    def __enter__(self):
+        # VeDbusService returns a context which collects the changes for one ItemsChanged signal
+        self._batches.append(0)
+        return self
+
+    def __exit__(self, *exc):
+        if self._batches.pop():
+            self.signals += 1
+
+    def del_tree(self, root):
+        """
+        Remove `root` and all paths below it, like the context of VeDbusService does.
+        """
+        root = root.rstrip("/")
+        for path in list(self._values):
+            if path == root or path.startswith(root + "/"):
+                self[path] = None
+                del self[path]
+
+    def get_text(self, path) -> str:
+        """
+        Same as GetText() on D-Bus.
+        """
+        value = self._values[path]
+        if value is None:
+            return "---"
+        if path in self._gettextcallbacks:
+            return self._gettextcallbacks[path](path, value)
+        return str(value)
+
+    def set_value(self, path, newvalue) -> int:
+        """
+        Same as a SetValue() call from another process on D-Bus.
+        """
+        if path in self._onchangecallbacks and not self._onchangecallbacks[path](path, newvalue):
+            return 2
+        self[path] = newvalue
+        return 0
+
+    def items(self):
+        return self._values.items()
+
+
+class ManualClock:
+    """
+    Replacement for time.time() which only advances when told to, for deterministic runs.
+    """
+
+    __slots__ = ("now",)
+
+    def __init__(self, start: float = 1700000000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float = 1.0):
+        self.now += seconds
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Aggregation of several grid or ac load meters to one set of values per phase.
+
+Power and current are summed. Voltage and frequency are averaged, weighted with the absolute power
+of the meter on the same phase, so a meter which carries most of the load also dominates the
+voltage. If no power flows at all, the plain mean is used.
+
+The sums are updated incrementally from the eventCallback of the imported items: when a meter
+changes, only its own contribution is removed and added again, independent of the number of meters.
+When the meters of the role change, the aggregator is closed, so an import which is kept for another
+device does not update the replaced aggregated items anymore.
+"""
+
+from memorybus import InputSource
+
+# phases of a meter and the total, as prefix of the imported paths
+PHASES = ("/Ac/L1", "/Ac/L2", "/Ac/L3", "/Ac")
+
+POWER = 0
+CURRENT = 1
+VOLTAGE = 2
+FREQUENCY = 3
+
+QUANTITIES = ("Power", "Current", "Voltage", "Frequency")
+
+
+class AggregatedItem(InputSource):
+    """
+    Aggregated value of one path, has the same interface as VeDbusItemImport. `sources` are the
+    imported items of the meters which have the path.
+    """
+
+    __slots__ = ("_serviceName", "_path", "_value", "sources", "aggregator", "eventCallback")
+
+    def __init__(self, serviceName: str, path: str, aggregator=None):
+        self._serviceName = serviceName
+        self._path = path
+        self._value = None
+        self.sources = ()
+        # the MeterAggregator which updates the item
+        self.aggregator = aggregator
+        self.eventCallback = None
+
+    @property
+    def serviceName(self) -> str:
+        return self._serviceName
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def exists(self) -> bool:
+        return True
+
+    def get_value(self):
+        return self._value
+
+    def _set_value(self, value):
+        if value == self._value:
+            return
+        self._value = value
+        if self.eventCallback is not None:
+            self.eventCallback(self._serviceName, self._path, {"Value": value, "Text": str(value)})
+
+
+def import_sources(items: dict) -> list:
+    """
+    Returns the imported items of `items`, an aggregated item stands for the items of its meters.
+    """
+    return [source for item in items.values() if item is not None for source in (item.sources if isinstance(item, AggregatedItem) else (item,))]
+
+
+class _PhaseAggregate:
+    """
+    Running sums of one phase over all meters.
+    """
+
+    __slots__ = ("items", "values", "power_sum", "power_count", "current_sum", "current_count", "weighted", "plain")
+
+    def __init__(self, items: list):
+        # aggregated item per quantity, None if no meter has the path
+        self.items = items
+        # last values per meter, [power, current, voltage, frequency]
+        self.values = {}
+        self.power_sum = 0.0
+        self.power_count = 0
+        self.current_sum = 0.0
+        self.current_count = 0
+        # [sum of weight * value, sum of weight] for voltage and frequency
+        self.weighted = [[0.0, 0.0], [0.0, 0.0]]
+        # [sum of value, count] for voltage and frequency
+        self.plain = [[0.0, 0], [0.0, 0]]
+
+    def _apply(self, values: list, sign: int):
+        power, current = values[POWER], values[CURRENT]
+        if power is not None:
+            self.power_sum += sign * power
+            self.power_count += sign
+        if current is not None:
+            self.current_sum += sign * current
+            self.current_count += sign
+
+        weight = abs(power) if power is not None else 0.0
+        for index, value in enumerate((values[VOLTAGE], values[FREQUENCY])):
+            if value is None:
+                continue
+            self.weighted[index][0] += sign * weight * value
+            self.weighted[index][1] += sign * weight
+            self.plain[index][0] += sign * value
+            self.plain[index][1] += sign
+
+    def update(self, meter: str, quantity: int, value):
+        values = self.values[meter]
+        if values[quantity] == value:
+            return
+        # the power is also the weight of voltage and frequency, so the whole contribution is replaced
+        self._apply(values, -1)
+        values[quantity] = value
+        self._apply(values, 1)
+        self.publish()
+
+    def publish(self):
+        if self.power_count == 0:
+            # start from exact zero again, so rounding errors do not accumulate
+            self.power_sum = 0.0
+        if self.current_count == 0:
+            self.current_sum = 0.0
+
+        results = [
+            round(self.power_sum, 3) if self.power_count else None,
+            round(self.current_sum, 3) if self.current_count else None,
+        ]
+        for index in range(2):
+            if self.plain[index][1] == 0:
+                self.weighted[index] = [0.0, 0.0]
+                self.plain[index][0] = 0.0
+                results.append(None)
+            elif self.weighted[index][1] > 0:
+                results.append(round(self.weighted[index][0] / self.weighted[index][1], 3))
+            else:
+                results.append(round(self.plain[index][0] / self.plain[index][1], 3))
+
+        for item, result in zip(self.items, results):
+            if item is not None:
+                item._set_value(result)
+
+
+class MeterAggregator:
+    """
+    Aggregates the items of several meters of the same role.
+
+    `meters` is a dictionary of service name to a dictionary as returned by DbusInputCache.get_items(),
+    where paths which do not exist are None. The aggregated items are in `items` with the same layout.
+    """
+
+    def __init__(self, meters: dict):
+        self.meters = list(meters)
+        self.items = {}
+        self.closed = False
+        # (item, callback, previous callback) of the hooked imports, to remove the hooks on close()
+        self._hooks = []
+        serviceName = ",".join(self.meters)
+
+        # create the aggregated items, a path only exists if at least one meter has it
+        phases = []
+        for phase in PHASES:
+            items = []
+            for quantity in QUANTITIES:
+                path = f"{phase}/{quantity}"
+                if any(meter_items.get(path) is not None for meter_items in meters.values()):
+                    self.items[path] = AggregatedItem(serviceName, path, self)
+                    items.append(self.items[path])
+                else:
+                    if any(path in meter_items for meter_items in meters.values()):
+                        self.items[path] = None
+                    items.append(None)
+            phases.append(_PhaseAggregate(items))
+
+        # initial values and hooks for the incremental updates
+        for meter, meter_items in meters.items():
+            for phase, aggregate in zip(PHASES, phases):
+                aggregate.values[meter] = [None, None, None, None]
+                for quantity, name in enumerate(QUANTITIES):
+                    item = meter_items.get(f"{phase}/{name}")
+                    if item is None:
+                        continue
+                    aggregate.values[meter][quantity] = item.get_value()
+                    aggregate.items[quantity].sources += (item,)
+                    self._hook(item, aggregate, meter, quantity)
+                aggregate._apply(aggregate.values[meter], 1)
+
+        for aggregate in phases:
+            aggregate.publish()
+
+    def _hook(self, item, aggregate: _PhaseAggregate, meter: str, quantity: int):
+        # keep an already set callback working, e.g. of another device using the same meter
+        previous_callback = item.eventCallback
+
+        def _callback(serviceName, path, changes):
+            if "Value" in changes and not self.closed:
+                aggregate.update(meter, quantity, changes["Value"])
+            if previous_callback is not None:
+                previous_callback(serviceName, path, changes)
+
+        item.eventCallback = _callback
+        self._hooks.append((item, _callback, previous_callback))
+
+    def close(self):
+        """
+        Stop updating the aggregated items. A hook which is still the callback of its item is removed, a hook
+        with a callback set after it only passes the changes on.
+        """
+        self.closed = True
+        for item, callback, previous_callback in self._hooks:
+            if item.eventCallback is callback:
+                item.eventCallback = previous_callback
+        self._hooks = []
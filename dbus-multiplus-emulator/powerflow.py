@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""
+Power flow of the emulated unit per phase.
+
+The AC input, the inverter and the AC output are solved together in one pass over lists which are
+allocated once per phase layout, so a tick does not format paths or read values back from the
+exported service:
+
+    AC output = AC input + inverter
+
+The AC input is the power of the ac load meter or, without one, the DC power split by the ratio of
+the grid and PV on grid power of each phase and converted to the AC side with the efficiency curve.
+The inverter converts exactly this power and is positive when it feeds the AC side. The emulated unit
+has no loads on its AC output, so the output carries no power and only follows the voltage and
+frequency of the input like a MultiPlus in passthrough.
+
+Each phase is exported as two AC sensors, the sensors of the AC input first, then the ones of the AC
+output.
+"""
+
+# all phases of the system, the ratio is always calculated over all of them
+PHASES = ("L1", "L2", "L3")
+
+# /AcSensor/N/Location
+SENSOR_LOCATION_AC_IN1 = 0
+SENSOR_LOCATION_AC_OUT = 2
+
+# number of /AcSensor/N slots in the path table
+SENSOR_SLOTS = 9
+
+# marks the values which were not written yet
+_UNPUBLISHED = object()
+
+
+class PowerFlow:
+    """
+    Solves and publishes the flows of the phases `phases`, e.g. ("L1", "L2").
+
+    The values of a phase are kept between the ticks: if the ac load meter has no power path for a
+    phase, the phase keeps its last values.
+    """
+
+    __slots__ = (
+        "phases",
+        "in_p",
+        "in_v",
+        "in_f",
+        "in_i",
+        "inverter_p",
+        "out_p",
+        "out_v",
+        "out_f",
+        "out_i",
+        "totals",
+        "_grid_frequency",
+        "_grid_nominal_voltage",
+        "_efficiency",
+        "_units_per_phase",
+        "_meter_paths",
+        "_ratio_paths",
+        "_ratio",
+        "_phase_index",
+        "_phase_layout",
+        "_paths",
+        "_sources",
+        "_published",
+        "_sensor_layout",
+        "_layout_published",
+    )
+
+    def __init__(self, phases, grid_frequency: float, grid_nominal_voltage: float, efficiency, units_per_phase: int = 1):
+        self.phases = tuple(phases)
+        count = len(self.phases)
+
+        # per phase values, index = position in `phases`
+        self.in_p = [None] * count
+        self.in_v = [None] * count
+        self.in_f = [None] * count
+        self.in_i = [None] * count
+        self.inverter_p = [None] * count
+        self.out_p = [None] * count
+        # the AC output follows the voltage and frequency of the input
+        self.out_v = self.in_v
+        self.out_f = self.in_f
+        self.out_i = [None] * count
+        # AC input, AC output
+        self.totals = [0, 0]
+
+        self._grid_frequency = grid_frequency
+        self._grid_nominal_voltage = grid_nominal_voltage
+        # efficiency.EfficiencyCurve of one unit
+        self._efficiency = efficiency
+        self._units_per_phase = units_per_phase
+
+        # imported paths of the meters per used phase: power, frequency, voltage, current
+        self._meter_paths = tuple((f"/Ac/{phase}/Power", f"/Ac/{phase}/Frequency", f"/Ac/{phase}/Voltage", f"/Ac/{phase}/Current") for phase in self.phases)
+        # imported paths of the system per phase of the system: active in, PV on grid
+        self._ratio_paths = tuple((f"/Ac/ActiveIn/{phase}/Power", f"/Ac/PvOnGrid/{phase}/Power") for phase in PHASES)
+        # AC power of each phase of the system, reused on every tick
+        self._ratio = [0] * len(PHASES)
+        # index of each used phase in PHASES
+        self._phase_index = tuple(PHASES.index(phase) for phase in self.phases)
+        # per used phase: index in the lists, index in PHASES and the meter paths, so a tick only unpacks one tuple per phase
+        self._phase_layout = tuple((index, phase_index) + paths for index, (phase_index, paths) in enumerate(zip(self._phase_index, self._meter_paths)))
+
+        # exported paths and the list and index their value is taken from
+        exports = []
+        for index, phase in enumerate(self.phases):
+            for side, (power, voltage, frequency, current) in (("ActiveIn", (self.in_p, self.in_v, self.in_f, self.in_i)), ("Out", (self.out_p, self.out_v, self.out_f, self.out_i))):
+                exports += (
+                    (f"/Ac/{side}/{phase}/P", power, index),
+                    (f"/Ac/{side}/{phase}/S", power, index),
+                    (f"/Ac/{side}/{phase}/V", voltage, index),
+                    (f"/Ac/{side}/{phase}/F", frequency, index),
+                    (f"/Ac/{side}/{phase}/I", current, index),
+                )
+        exports += (
+            ("/Ac/ActiveIn/P", self.totals, 0),
+            ("/Ac/ActiveIn/S", self.totals, 0),
+            ("/Ac/Out/P", self.totals, 1),
+            ("/Ac/Out/S", self.totals, 1),
+        )
+        # the sensors of the AC input, then the ones of the AC output
+        sensor = 0
+        for power, voltage, current in ((self.in_p, self.in_v, self.in_i), (self.out_p, self.out_v, self.out_i)):
+            for index in range(count):
+                exports += (
+                    (f"/AcSensor/{sensor}/Power", power, index),
+                    (f"/AcSensor/{sensor}/Voltage", voltage, index),
+                    (f"/AcSensor/{sensor}/Current", current, index),
+                )
+                sensor += 1
+        # a value is compared once and written to all of its paths, e.g. /Ac/ActiveIn/L1/P, /Ac/ActiveIn/L1/S and /AcSensor/0/Power
+        targets = {}
+        for path, values, index in exports:
+            targets.setdefault((id(values), index), (values, index, []))[2].append(path)
+        self._sources = tuple((values, index) for values, index, _ in targets.values())
+        self._paths = tuple(tuple(paths) for _, _, paths in targets.values())
+        self._published = [_UNPUBLISHED] * len(self._sources)
+        self._sensor_layout = tuple((SENSOR_LOCATION_AC_IN1, phase_index) for phase_index in self._phase_index) + tuple((SENSOR_LOCATION_AC_OUT, phase_index) for phase_index in self._phase_index)
+        self._layout_published = False
+
+    def solve(self, dc_power: float, system_items: dict, grid_items: dict, ac_load_items: dict):
+        """
+        Calculate the flows of all phases. Stale meters have to be passed as empty dictionary.
+        """
+        in_p = self.in_p
+        in_v = self.in_v
+        in_f = self.in_f
+        in_i = self.in_i
+        use_grid = grid_items != {}
+
+        if ac_load_items != {}:
+            for index, _, path_power, path_frequency, path_voltage, path_current in self._phase_layout:
+                item = ac_load_items[path_power]
+                if item is None:
+                    continue
+                power = in_p[index] = item.get_value()
+
+                # frequency and voltage: ac load meter -> grid meter -> config
+                item = ac_load_items[path_frequency]
+                if item is not None:
+                    in_f[index] = item.get_value()
+                elif use_grid and grid_items[path_frequency] is not None:
+                    in_f[index] = grid_items[path_frequency].get_value()
+                else:
+                    in_f[index] = self._grid_frequency
+
+                item = ac_load_items[path_voltage]
+                if item is not None:
+                    voltage = in_v[index] = item.get_value()
+                elif use_grid and grid_items[path_voltage] is not None:
+                    voltage = in_v[index] = grid_items[path_voltage].get_value()
+                else:
+                    voltage = in_v[index] = self._grid_nominal_voltage
+
+                item = ac_load_items[path_current]
+                if item is not None:
+                    in_i[index] = item.get_value()
+                else:
+                    in_i[index] = round(power / voltage, 2) if power is not None and voltage else None
+
+        else:
+            # ratio of the AC power (grid and PV on grid) of each phase of the system
+            ratio_powers = self._ratio
+            total = 0
+            for phase_index, (path_active_in, path_pv_on_grid) in enumerate(self._ratio_paths):
+                item = system_items[path_active_in]
+                active_in = item.get_value() if item is not None else None
+                item = system_items[path_pv_on_grid]
+                pv_on_grid = item.get_value() if item is not None else None
+                power = ratio_powers[phase_index] = (active_in if active_in is not None else 0) + (pv_on_grid if pv_on_grid is not None else 0)
+                total += power
+
+            to_ac = self._efficiency.to_ac
+            units = self._units_per_phase
+            for index, phase_index, path_power, path_frequency, path_voltage, path_current in self._phase_layout:
+                # since the MultiPlus emulator is only integrating the power flowing from AC to DC and vice versa, the DC power is split by the ratio
+                # the AC side includes the conversion losses of the units of the phase
+                if dc_power != 0:
+                    ratio = round(ratio_powers[phase_index] / total, 4) if total != 0 else 0
+                    power = in_p[index] = round(to_ac(dc_power * ratio, units), 0)
+                else:
+                    power = in_p[index] = 0
+
+                # frequency, voltage and current: grid meter -> config
+                item = grid_items[path_frequency] if use_grid else None
+                in_f[index] = item.get_value() if item is not None else self._grid_frequency
+
+                item = grid_items[path_voltage] if use_grid else None
+                voltage = in_v[index] = item.get_value() if item is not None else self._grid_nominal_voltage
+
+                item = grid_items[path_current] if use_grid else None
+                if item is not None:
+                    in_i[index] = item.get_value()
+                else:
+                    in_i[index] = round(power / voltage, 2) if voltage else None
+
+        # the inverter converts the power taken from the AC input, the AC output has no loads
+        inverter_p = self.inverter_p
+        out_p = self.out_p
+        out_i = self.out_i
+        in_total = out_total = 0
+        for index, power in enumerate(in_p):
+            if power is None:
+                inverter_p[index] = out_p[index] = out_i[index] = None
+                continue
+            inverter = inverter_p[index] = -power
+            output = out_p[index] = power + inverter
+            voltage = in_v[index]
+            out_i[index] = round(output / voltage, 2) if voltage else None
+            in_total += power
+            out_total += output
+        self.totals[0] = in_total
+        self.totals[1] = out_total
+
+    def publish(self, dbusservice):
+        """
+        Write the flows to the exported service or to the context of `with service:`. Only values which
+        changed since the last tick are written, since a write to VeDbusService costs more than the comparison.
+        """
+        values = [column[index] for column, index in self._sources]
+        for paths, value, published in zip(self._paths, values, self._published):
+            if value != published:
+                for path in paths:
+                    dbusservice[path] = value
+        self._published = values
+
+        if not self._layout_published:
+            self._publish_sensor_layout(dbusservice)
+
+    def _publish_sensor_layout(self, dbusservice):
+        """
+        Write the location and phase of the sensors and clear the unused slots, only needed once per layout.
+        """
+        dbusservice["/AcSensor/Count"] = len(self._sensor_layout)
+        for sensor in range(SENSOR_SLOTS):
+            location, phase = self._sensor_layout[sensor] if sensor < len(self._sensor_layout) else (None, None)
+            dbusservice[f"/AcSensor/{sensor}/Location"] = location
+            dbusservice[f"/AcSensor/{sensor}/Phase"] = phase
+            if location is None:
+                for quantity in ("Power", "Voltage", "Current", "Energy"):
+                    dbusservice[f"/AcSensor/{sensor}/{quantity}"] = None
+        self._layout_published = True
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+import json
+import logging
+from collections import deque
+from time import monotonic, time
+
+
+class LazyJson:
+    """
+    Wraps a value which is only serialized to JSON when the log record is really emitted.
+
+    Usage: logging.debug("--> data: %s", LazyJson(data))
+    """
+
+    __slots__ = ("_value",)
+
+    def __init__(self, value):
+        self._value = value
+
+    def __str__(self):
+        return json.dumps(self._value)
+
+
+class LazyCall:
+    """
+    Wraps a function which is only called when the log record is really emitted.
+
+    Usage: logging.info("%s = %s", path, LazyCall(item.get_value))
+    """
+
+    __slots__ = ("_function",)
+
+    def __init__(self, function):
+        self._function = function
+
+    def __str__(self):
+        return str(self._function())
+
+
+class TickRingBuffer:
+    """
+    Keeps the last `size` tick records in RAM.
+
+    A record is a plain tuple of values in the order of `fields`, so appending a record costs the
+    same no matter which logging level is configured. The buffer is only serialized when `dump()`
+    is called, e.g. from a signal handler.
+    """
+
+    def __init__(self, fields: tuple, size: int = 300):
+        self.fields = ("time", "monotonic") + tuple(fields)
+        self.size = size
+        self._records = deque(maxlen=size) if size > 0 else None
+
+    @property
+    def enabled(self) -> bool:
+        return self._records is not None
+
+    def __len__(self):
+        return len(self._records) if self._records is not None else 0
+
+    def append(self, *values):
+        """
+        Append one record. The values have to be in the same order as the fields passed to the constructor.
+        """
+        if self._records is not None:
+            self._records.append((time(), monotonic()) + values)
+
+    def records(self) -> list:
+        """
+        Returns the buffered records as list of dictionaries, oldest first.
+        """
+        if self._records is None:
+            return []
+        return [dict(zip(self.fields, record)) for record in self._records]
+
+    def dump(self, filename: str) -> int:
+        """
+        Write the buffered records as JSON lines to `filename` and return the number of written records.
+        """
+        records = self.records()
+        with open(filename, "w") as file:
+            for record in records:
+                file.write(json.dumps(record) + "\n")
+        logging.warning(f"Dumped {len(records)} tick records to {filename}")
+        return len(records)
+
+    def install_signal_handler(self, signum: int, filename: str):
+        """
+        Dump the buffer to `filename` each time the process receives `signum` (e.g. SIGUSR1).
+
+        The handler is dispatched by the GLib main loop, so it never interrupts a running tick.
+        """
+        from gi.repository import GLib
+
+        def _handler():
+            try:
+                self.dump(filename)
+            except Exception as e:
+                logging.error(f"Could not dump tick records to {filename}: {repr(e)}")
+            # keep the handler installed
+            return True
+
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signum, _handler)
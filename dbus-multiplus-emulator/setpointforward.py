@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+
+"""
+Forwarding of the ESS setpoints which hub4control writes to the emulator.
+
+hub4control writes /Hub4/L1..L3/AcPowerSetpoint, /Hub4/DisableCharge and /Hub4/DisableFeedIn several
+times per second. The writes can be forwarded to other services, e.g. the driver of an inverter or
+charger, configured per device:
+
+    hub4_forward_service = com.victronenergy.inverter.mqtt_inverter_1
+    hub4_forward_paths = /Hub4/L1/AcPowerSetpoint=/Ac/L1/PowerSetpoint, /Hub4/DisableFeedIn=com.victronenergy.settings/Settings/Ess/DisableFeedIn
+
+Without hub4_forward_paths all five paths are forwarded to the same paths of hub4_forward_service.
+A target of hub4_forward_paths is either a path of hub4_forward_service or a service name followed
+by the path.
+
+The onchange callback of the exported path only stores the value, so hub4control never waits for
+the target. A target service gets at most one batch of writes per `interval` seconds and no new batch
+while a write to it is still unanswered. Values written in between replace the pending value of the
+same path, so the target always receives the latest setpoint. The writes are sent with non-blocking
+SetValue calls, their replies update the latency and error statistics.
+"""
+
+import logging
+from math import ceil
+from time import monotonic
+
+# exported paths which can be forwarded
+FORWARDED_PATHS = (
+    "/Hub4/L1/AcPowerSetpoint",
+    "/Hub4/L2/AcPowerSetpoint",
+    "/Hub4/L3/AcPowerSetpoint",
+    "/Hub4/DisableCharge",
+    "/Hub4/DisableFeedIn",
+)
+
+
+def parse_forward_routes(service: str, paths: str) -> tuple:
+    """
+    Returns the routes of hub4_forward_service `service` and hub4_forward_paths `paths` as tuple of
+    (exported path, target service, target path). Raises ValueError for an invalid value.
+    """
+    service = service.strip()
+    routes = {path: (service, path) for path in FORWARDED_PATHS} if service != "" else {}
+
+    for route in paths.replace(" ", "").split(","):
+        if route == "":
+            continue
+        path, separator, target = route.partition("=")
+        if separator == "" or target == "":
+            raise ValueError(f"route {route} is not in the format <path>=[<service>]<path>")
+        if path not in FORWARDED_PATHS:
+            raise ValueError(f"{path} can not be forwarded, valid are {', '.join(FORWARDED_PATHS)}")
+        if target.startswith("/"):
+            if service == "":
+                raise ValueError(f"route {route} has no service and hub4_forward_service is not set")
+            routes[path] = (service, target)
+        else:
+            target_service, slash, target_path = target.partition("/")
+            if slash == "":
+                raise ValueError(f"target of route {route} has no path")
+            routes[path] = (target_service, "/" + target_path)
+
+    return tuple((path,) + routes[path] for path in FORWARDED_PATHS if path in routes)
+
+
+class _Target:
+    """
+    Pending writes and rate limit of one target service.
+    """
+
+    __slots__ = ("service", "pending", "last_sent", "in_flight", "scheduled", "failing")
+
+    def __init__(self, service: str):
+        self.service = service
+        # exported path: (target path, value, time the value was written)
+        self.pending = {}
+        self.last_sent = None
+        self.in_flight = 0
+        self.scheduled = False
+        # the last write failed
+        self.failing = False
+
+
+class SetpointForwarder:
+    """
+    Forwards the writes of the exported paths of `routes`, as returned by parse_forward_routes().
+
+    `send(service, path, value, reply_handler, error_handler)` has to start a non-blocking SetValue
+    call, an exception raised by it is handled like a failed call. `schedule(milliseconds, callback)`
+    has the signature of GLib.timeout_add().
+    """
+
+    __slots__ = ("_routes", "_targets", "_interval", "_send", "_schedule", "_clock", "latency", "latency_max", "sent", "coalesced", "errors")
+
+    def __init__(self, routes: tuple, interval: float, send, schedule, clock=monotonic):
+        self._targets = {service: _Target(service) for _, service, _ in routes}
+        self._routes = {path: (self._targets[service], target_path) for path, service, target_path in routes}
+        self._interval = interval
+        self._send = send
+        self._schedule = schedule
+        self._clock = clock
+
+        # seconds between the write to the emulator and the reply of the target, of the last and the slowest write
+        self.latency = None
+        self.latency_max = None
+        self.sent = 0
+        # writes which were replaced by a newer value before they were sent
+        self.coalesced = 0
+        self.errors = 0
+
+    def write(self, path: str, value):
+        """
+        Queue the value written to the exported `path`, ignored if the path is not forwarded.
+        """
+        route = self._routes.get(path)
+        if route is None:
+            return
+        target, target_path = route
+        if path in target.pending:
+            self.coalesced += 1
+        target.pending[path] = (target_path, value, self._clock())
+        self._flush_or_schedule(target)
+
+    def _flush_or_schedule(self, target: _Target):
+        # a sent batch or the timer send the pending values later
+        if target.in_flight or target.scheduled or not target.pending:
+            return
+        wait = target.last_sent + self._interval - self._clock() if target.last_sent is not None else 0
+        if wait <= 0:
+            self._flush(target)
+            return
+        target.scheduled = True
+        self._schedule(ceil(wait * 1000), lambda: self._on_timer(target))
+
+    def _on_timer(self, target: _Target) -> bool:
+        target.scheduled = False
+        if not target.in_flight and target.pending:
+            self._flush(target)
+        return False
+
+    def _flush(self, target: _Target):
+        target.last_sent = self._clock()
+        pending = target.pending
+        target.pending = {}
+        for target_path, value, written in pending.values():
+            target.in_flight += 1
+            self.sent += 1
+            try:
+                self._send(
+                    target.service,
+                    target_path,
+                    value,
+                    lambda result, target=target, target_path=target_path, written=written: self._on_reply(target, target_path, written, result),
+                    lambda error, target=target, target_path=target_path: self._on_error(target, target_path, error),
+                )
+            except Exception as error:
+                # e.g. the connection is closed or the value can not be wrapped, no handler is called then
+                self._on_error(target, target_path, error)
+
+    def _on_reply(self, target: _Target, target_path: str, written: float, result):
+        target.in_flight -= 1
+        if result != 0:
+            self._on_failure(target, target_path, f"SetValue returned {result}")
+        else:
+            latency = self._clock() - written
+            self.latency = latency
+            self.latency_max = latency if self.latency_max is None or latency > self.latency_max else self.latency_max
+            if target.failing:
+                logging.warning(f"Forwarding to {target.service} works again")
+                target.failing = False
+        self._flush_or_schedule(target)
+
+    def _on_error(self, target: _Target, target_path: str, error):
+        target.in_flight -= 1
+        self._on_failure(target, target_path, error)
+        self._flush_or_schedule(target)
+
+    def _on_failure(self, target: _Target, target_path: str, error):
+        self.errors += 1
+        # log only the first of a series of failures, the writes come several times per second
+        if not target.failing:
+            logging.warning(f"Could not forward to {target.service}{target_path}: {error}")
+            target.failing = True
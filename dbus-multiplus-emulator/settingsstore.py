@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Persistence of the settings which the GUI or VRM write to the emulated device.
+
+/Mode, the current limits and /Devices/N/Settings/* are kept in a small JSON file on persistent
+storage:
+
+    {
+        "version": 1,
+        "values": {"/Mode": 3, "/Ac/In/1/CurrentLimit": 16.0, ...}
+    }
+
+The file is read once at startup, before the paths are added, so the restored values are the
+initial values of the paths and the registration does not wait for any dbus call.
+
+A write only updates the values in memory. The file is written once no value changed for `delay`
+seconds, so dragging a slider in the GUI results in one write with the final value. While values
+keep changing, the file is written at the latest `max_delay` seconds after the first change. The
+check is a comparison of two timestamps and runs once per tick. Unsaved values are written by
+flush() when the driver stops.
+
+A file which can not be parsed or has an unexpected structure is ignored with a warning.
+"""
+
+import json
+import logging
+import os
+import re
+
+VERSION = 1
+
+# writeable paths which are persisted
+PATHS = ("/Mode", "/Ac/ActiveIn/CurrentLimit", "/Ac/In/1/CurrentLimit")
+
+# settings of the devices, without the progress and reset state
+DEVICE_SETTINGS = re.compile(r"/Devices/\d+/Settings/(?!ReadProgress$|WriteProgress$|ResetRequired$)\w+")
+
+
+def is_persisted(path: str) -> bool:
+    return path in PATHS or DEVICE_SETTINGS.fullmatch(path) is not None
+
+
+class SettingsStore:
+    """
+    Values of the persisted paths of one device, saved to `filename`.
+    """
+
+    __slots__ = ("filename", "delay", "max_delay", "values", "_clock", "_first_change", "_last_change")
+
+    def __init__(self, filename: str, clock, delay: float = 5, max_delay: float = 60):
+        self.filename = filename
+        self.delay = delay
+        self.max_delay = max_delay
+        self._clock = clock
+        # time of the first and the last change since the last save, None if there is nothing to save
+        self._first_change = None
+        self._last_change = None
+        self.values = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.filename, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            logging.warning(f"Ignoring the saved settings {self.filename}: {error}")
+            return {}
+
+        if not isinstance(data, dict) or data.get("version") != VERSION:
+            return {}
+        if not isinstance(data.get("values"), dict):
+            logging.warning(f"Ignoring the saved settings {self.filename}: malformed values")
+            return {}
+        values = {path: value for path, value in data["values"].items() if is_persisted(path)}
+        logging.info(f"Restored {len(values)} settings from {self.filename}")
+        return values
+
+    def set(self, path: str, value):
+        """
+        Remember a written value, has to be saved with save_if_due().
+        """
+        if path in self.values and self.values[path] == value:
+            return
+        self.values[path] = value
+        now = self._clock()
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+
+    def save_if_due(self):
+        """
+        Write the file if the values did not change for `delay` seconds or changed first `max_delay` seconds ago.
+        """
+        if self._first_change is None:
+            return
+        now = self._clock()
+        if now - self._last_change < self.delay and now - self._first_change < self.max_delay:
+            return
+        self.save()
+
+    def flush(self):
+        """
+        Write the file now if there are unsaved values, e.g. before the driver stops.
+        """
+        if self._first_change is not None:
+            self.save()
+
+    def save(self):
+        self._first_change = self._last_change = None
+        try:
+            # write to a temporary file first, so a crash does not leave a half written file
+            with open(self.filename + ".tmp", "w") as file:
+                json.dump({"version": VERSION, "values": self.values}, file, default=str)
+            os.replace(self.filename + ".tmp", self.filename)
+            logging.info(f"Saved {len(self.values)} settings to {self.filename}")
+        except OSError as error:
+            logging.warning(f"Could not write the settings {self.filename}: {error}")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+"""
+Smoothing of the imported power and current values of a role.
+
+Meters behind an MQTT bridge often deliver their values in bursts and with noise, which the emulator
+would pass on to the GUI and into the ratio of the phases on every tick. A role can be configured with
+a chain of smoothing stages, which are applied to each of its power and current paths:
+
+    smoothing_grid = mean:10, ema:0.5
+
+    mean:<n>    mean of the last n ticks
+    min:<n>     minimum of the last n ticks
+    max:<n>     maximum of the last n ticks
+    ema:<a>     exponential moving average, a is the weight of the new value between 0 and 1
+
+The windows are fixed size ring buffers of array("d"), so the memory per path is bounded and an
+update costs the same for every window size: the mean is a running sum and the minimum or maximum
+is kept in a monotonic queue, where every sample is added and removed at most once.
+
+Every path is sampled once per tick before the values are used, the smoothed value is rounded to
+DIGITS, so a converged filter stops producing changes which would only cause bus traffic.
+"""
+
+from array import array
+from collections import deque
+
+from memorybus import InputSource
+
+# largest window in ticks
+MAX_WINDOW = 3600
+
+# decimals of the smoothed values
+DIGITS = 1
+
+# the imported paths which are smoothed, ending with one of these
+QUANTITIES = ("/Power", "/Current")
+
+
+def parse_smoothing(value: str) -> tuple:
+    """
+    Returns the stages of `value`, e.g. "mean:10, ema:0.5", as tuple of (kind, parameter).
+    Raises ValueError for an invalid value.
+    """
+    stages = []
+    for stage in value.replace(" ", "").split(","):
+        if stage == "":
+            continue
+        kind, separator, parameter = stage.partition(":")
+        if separator == "":
+            raise ValueError(f"stage {stage} is not in the format <kind>:<parameter>")
+        if kind in ("mean", "min", "max"):
+            try:
+                size = int(parameter)
+            except ValueError:
+                raise ValueError(f"window of stage {stage} has to be a whole number")
+            if not 1 <= size <= MAX_WINDOW:
+                raise ValueError(f"window of stage {stage} has to be between 1 and {MAX_WINDOW}")
+            stages.append((kind, size))
+        elif kind == "ema":
+            try:
+                alpha = float(parameter)
+            except ValueError:
+                raise ValueError(f"weight of stage {stage} has to be a number")
+            if not 0 < alpha <= 1:
+                raise ValueError(f"weight of stage {stage} has to be above 0 and at most 1")
+            stages.append((kind, alpha))
+        else:
+            raise ValueError(f"unknown stage {kind}, valid are mean, min, max and ema")
+    return tuple(stages)
+
+
+class RollingWindow:
+    """
+    The last `size` values with their mean and, depending on `kind`, their minimum or maximum.
+    add() returns the value selected by `kind`, which is "mean", "min" or "max".
+    """
+
+    __slots__ = ("size", "kind", "_values", "_count", "_sum", "_extremes", "_lower")
+
+    def __init__(self, size: int, kind: str = "mean"):
+        self.size = size
+        self.kind = kind
+        self._values = array("d", bytes(8 * size))
+        # number of values added since the last reset, the position of the next value is _count % size
+        self._count = 0
+        self._sum = 0.0
+        # sequence numbers of the values which can still become the minimum (ascending values) or maximum (descending values)
+        self._extremes = deque() if kind != "mean" else None
+        self._lower = kind == "min"
+
+    def reset(self):
+        self._count = 0
+        self._sum = 0.0
+        if self._extremes is not None:
+            self._extremes.clear()
+
+    def add(self, value: float) -> float:
+        values = self._values
+        size = self.size
+        sequence = self._count
+        position = sequence % size
+
+        if sequence >= size:
+            self._sum -= values[position]
+        values[position] = value
+        self._count = sequence + 1
+        if position == size - 1:
+            # sum up again once per round, so rounding errors of the running sum do not accumulate
+            self._sum = sum(values)
+        else:
+            self._sum += value
+
+        extremes = self._extremes
+        if extremes is None:
+            return self._sum / (sequence + 1 if sequence < size else size)
+
+        # drop the value which left the window and the ones which can not become the minimum/maximum anymore
+        if extremes and extremes[0] <= sequence - size:
+            extremes.popleft()
+        if self._lower:
+            while extremes and values[extremes[-1] % size] > value:
+                extremes.pop()
+        else:
+            while extremes and values[extremes[-1] % size] < value:
+                extremes.pop()
+        extremes.append(sequence)
+        return values[extremes[0] % size]
+
+    @property
+    def mean(self) -> float:
+        return self._sum / min(self._count, self.size)
+
+    @property
+    def extreme(self) -> float:
+        """
+        Minimum or maximum of the window, depending on `kind`.
+        """
+        return self._values[self._extremes[0] % self.size]
+
+
+class Ema:
+    """
+    Exponential moving average, `alpha` is the weight of a new value.
+    """
+
+    __slots__ = ("alpha", "_value")
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self._value = None
+
+    def reset(self):
+        self._value = None
+
+    def add(self, value: float) -> float:
+        if self._value is None:
+            self._value = value
+        else:
+            self._value += self.alpha * (value - self._value)
+        return self._value
+
+
+class SmoothedItem(InputSource):
+    """
+    Smoothed value of an imported item, has the same interface as VeDbusItemImport.
+    """
+
+    __slots__ = ("_item", "_stages", "_value", "eventCallback")
+
+    def __init__(self, item, stages: tuple):
+        self._item = item
+        self._stages = tuple(RollingWindow(parameter, kind) if kind != "ema" else Ema(parameter) for kind, parameter in stages)
+        self._value = None
+        self.eventCallback = None
+
+    @property
+    def serviceName(self) -> str:
+        return self._item.serviceName
+
+    @property
+    def path(self) -> str:
+        return self._item.path
+
+    @property
+    def exists(self) -> bool:
+        return self._item.exists
+
+    def get_value(self):
+        return self._value
+
+    def sample(self):
+        """
+        Add the current value of the item to the stages, a missing value starts them again.
+        """
+        value = self._item.get_value()
+        if value is None:
+            for stage in self._stages:
+                stage.reset()
+            self._value = None
+            return
+        value = float(value)
+        for stage in self._stages:
+            value = stage.add(value)
+        self._value = round(value, DIGITS)
+
+
+class InputSmoothing:
+    """
+    Smooths the power and current paths of a dictionary as returned by setup_dbus_external_items().
+
+    `items` has the same layout, with the smoothed paths replaced by SmoothedItem, which have no value
+    before the first sample(). Without stages it is the dictionary itself and sample() does nothing.
+    """
+
+    __slots__ = ("items", "_smoothed")
+
+    def __init__(self, items: dict, stages: tuple):
+        if stages == ():
+            self.items = items
+            self._smoothed = ()
+            return
+
+        self.items = {}
+        smoothed = []
+        for path, item in items.items():
+            if item is not None and path.endswith(QUANTITIES):
+                item = SmoothedItem(item, stages)
+                smoothed.append(item)
+            self.items[path] = item
+        self._smoothed = tuple(smoothed)
+
+    def sample(self):
+        for item in self._smoothed:
+            item.sample()
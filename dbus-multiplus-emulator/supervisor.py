@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+In-process supervisor of the startup stages.
+
+Instead of sleeping and exiting on a failure, so that daemontools restarts the whole interpreter,
+the failing stage is retried in the GLib main loop with jittered exponential backoff. The stages
+which already succeeded, e.g. the bus connection, are kept.
+"""
+
+import logging
+import os
+import random
+
+
+class StartupError(Exception):
+    """
+    A startup stage failed for a reason which can go away, e.g. a missing config.ini or a service
+    which is not on dbus yet. Every other exception is a bug and still ends the process.
+    """
+
+
+class Supervisor:
+    """
+    Runs the startup `stages`, a list of (name, function), one after the other.
+
+    A stage which raises StartupError is retried after `backoff_min` seconds, doubled on every
+    further failure up to `backoff_max` seconds. The delay is randomized between 50% and 100%, so
+    several drivers waiting for the same service do not retry at the same time.
+
+    Any other exception is logged and ends the process with os._exit(1), so daemontools restarts it.
+    Raised in a GLib callback it would only be printed and the retry dropped, leaving the process
+    running without a service.
+
+    `on_change` is called with the supervisor after every change of the state. `timeout_add` schedules
+    the retries and defaults to GLib.timeout_add.
+    """
+
+    def __init__(self, stages: list, on_change=None, backoff_min: float = 1.0, backoff_max: float = 60.0, rng=None, timeout_add=None):
+        self.stages = stages
+        self.on_change = on_change
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self._rng = rng if rng is not None else random.Random()
+        if timeout_add is None:
+            from gi.repository import GLib
+
+            timeout_add = GLib.timeout_add
+        self._timeout_add = timeout_add
+        self._index = 0
+
+        # current stage or "running", when all stages succeeded
+        self.state = "starting"
+        self.degraded = False
+        # failed attempts of the current stage
+        self.retries = 0
+        self.next_retry = None
+        self.last_error = ""
+
+    @property
+    def running(self) -> bool:
+        return self._index >= len(self.stages)
+
+    def backoff(self) -> float:
+        """
+        Returns the delay in seconds before the next attempt of the current stage.
+        """
+        delay = min(self.backoff_max, self.backoff_min * 2 ** (self.retries - 1))
+        return delay * self._rng.uniform(0.5, 1.0)
+
+    def start(self):
+        """
+        Run the stages until one fails or all succeeded. Has the signature of a GLib source callback.
+        """
+        while not self.running:
+            name, function = self.stages[self._index]
+            self._set_state(name)
+
+            try:
+                function()
+            except StartupError as error:
+                self.retries += 1
+                self.degraded = True
+                self.last_error = str(error)
+                self.next_retry = self.backoff()
+                logging.error(f"Startup stage {name} failed: {error} Retrying in {self.next_retry:.1f} seconds (attempt {self.retries}).")
+                self._notify()
+                self._timeout_add(int(self.next_retry * 1000), self.start)
+                return False
+            except Exception:
+                logging.exception(f"Startup stage {name} failed with an unexpected error, exiting")
+                os._exit(1)
+
+            if self.retries > 0:
+                logging.warning(f"Startup stage {name} succeeded after {self.retries} retries")
+            self._index += 1
+            self.retries = 0
+            self.next_retry = None
+
+        self.degraded = False
+        self.last_error = ""
+        self._set_state("running")
+        return False
+
+    def _set_state(self, state: str):
+        self.state = state
+        self._notify()
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(self)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""
+Write-out of the values computed in one tick.
+
+DbusMultiPlusEmulator._update() computes the DC values, the state of the meters, the update index
+and the values of the devices as locals from the imported items and the power flow, without reading
+anything back from the exported service. At the end of the tick they are passed as one list in the
+order of the paths of the frame and written in the same `with service:` block as the power flow.
+
+Like PowerFlow.publish() the frame keeps the values of the previous tick and only writes the ones
+which changed, e.g. the DC temperature or /Ac/NumberOfPhases are compared but rarely written.
+"""
+
+# marks the values which were not written yet
+_UNPUBLISHED = object()
+
+
+class TickFrame:
+    """
+    Exported paths of the values of a tick, `paths` is the order of the values passed to publish().
+    """
+
+    __slots__ = ("paths", "_published")
+
+    def __init__(self, paths):
+        self.paths = tuple(paths)
+        self._published = [_UNPUBLISHED] * len(self.paths)
+
+    def publish(self, dbusservice, values: list):
+        """
+        Write the changed `values` to the exported service or to the context of `with service:`.
+        """
+        for path, value, published in zip(self.paths, values, self._published):
+            if value != published:
+                dbusservice[path] = value
+        self._published = values
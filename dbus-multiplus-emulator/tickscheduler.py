@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+"""
+Tick scheduler aligned to the boundaries of time.monotonic().
+
+GLib.timeout_add(1000, callback) schedules the next call relative to the end of the previous one,
+so every tick is late by the time the callback took and a slow tick delays all following ones.
+The scheduler instead arms a one-shot timeout for the next multiple of `interval` on the monotonic
+clock, so the delays do not add up.
+
+A tick which starts an interval or more after its deadline has missed ticks. The callback runs once
+and the scheduler continues with the next boundary in the future. Running the callback again for the
+missed ticks would not add anything: the energy counters integrate the monotonic time since the last
+tick (up to a few intervals, see energycounter.py), so a late tick counts the missed time as well.
+
+With `coalesced` the timeouts are armed with GLib.timeout_add_seconds(), which lets the system wake
+up once for all timers of the same second and saves power, but the ticks are then up to half a second
+before or after the boundaries.
+
+The distance of every tick to its boundary is the jitter. Its last value and the mean and maximum of the last
+JITTER_WINDOW ticks are kept in `jitter`, `jitter_mean` and `jitter_max`, in seconds.
+"""
+
+import logging
+from math import ceil, floor
+from time import monotonic
+
+from smoothing import RollingWindow
+
+# number of ticks of the jitter statistics
+JITTER_WINDOW = 60
+
+
+class TickScheduler:
+    """
+    Calls `callback` at every multiple of `interval` seconds. `timeout_add` and `timeout_add_seconds`
+    have the signature of the GLib functions.
+    """
+
+    __slots__ = (
+        "interval",
+        "coalesced",
+        "ticks",
+        "missed",
+        "jitter",
+        "_callback",
+        "_timeout_add",
+        "_timeout_add_seconds",
+        "_clock",
+        "_deadline",
+        "_jitter_mean",
+        "_jitter_max",
+    )
+
+    def __init__(self, callback, timeout_add, timeout_add_seconds, interval: float = 1.0, coalesced: bool = False, clock=monotonic):
+        self.interval = interval
+        self.coalesced = coalesced
+        self.ticks = 0
+        self.missed = 0
+        self.jitter = None
+        self._callback = callback
+        self._timeout_add = timeout_add
+        self._timeout_add_seconds = timeout_add_seconds
+        self._clock = clock
+        self._deadline = None
+        self._jitter_mean = RollingWindow(JITTER_WINDOW, "mean")
+        self._jitter_max = RollingWindow(JITTER_WINDOW, "max")
+
+    @property
+    def jitter_mean(self) -> float:
+        return self._jitter_mean.mean if self.ticks else None
+
+    @property
+    def jitter_max(self) -> float:
+        return self._jitter_max.extreme if self.ticks else None
+
+    def start(self):
+        """
+        Arm the first tick at the next boundary.
+        """
+        self._deadline = floor(self._clock() / self.interval + 1) * self.interval
+        self._arm()
+
+    def _arm(self):
+        delay = self._deadline - self._clock()
+        if self.coalesced:
+            self._timeout_add_seconds(max(ceil(delay), 1), self._tick)
+        else:
+            self._timeout_add(max(ceil(delay * 1000), 0), self._tick)
+
+    def _tick(self) -> bool:
+        now = self._clock()
+        # the timeouts of GLib can fire a little early, then the deadline is only rearmed. The seconds of
+        # timeout_add_seconds() are not aligned to the boundaries, so a coalesced tick can be up to half an interval early.
+        if now < self._deadline - (self.interval / 2 if self.coalesced else 0.001):
+            self._arm()
+            return False
+
+        late = now - self._deadline
+        self._record(abs(late))
+        missed = int(late // self.interval) if late > 0 else 0
+        if missed:
+            self.missed += missed
+            logging.info(f"Tick is {late:.3f} seconds late, missed {missed} ticks")
+
+        self._callback()
+
+        # the next boundary in the future
+        self._deadline += (missed + 1) * self.interval
+        self._arm()
+        return False
+
+    def _record(self, jitter: float):
+        self.ticks += 1
+        self.jitter = jitter
+        self._jitter_mean.add(jitter)
+        self._jitter_max.add(jitter)
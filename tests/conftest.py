@@ -0,0 +1,23 @@
+"""
+The driver is not a package, its modules are imported from the driver directory like the driver does
+it itself. The benchmark helpers load the whole driver with a generated config.ini.
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.realpath(__file__))
+DRIVER_DIR = os.path.realpath(os.path.join(TESTS_DIR, "..", "dbus-multiplus-emulator"))
+BENCH_DIR = os.path.realpath(os.path.join(TESTS_DIR, "..", "benchmarks"))
+
+for directory in (DRIVER_DIR, BENCH_DIR):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+
+@pytest.fixture(autouse=True)
+def driver_config_env(monkeypatch):
+    # load_driver() points the driver to its generated config.ini with os.environ, restore the variable after every test
+    monkeypatch.delenv("DBUS_MULTIPLUS_EMULATOR_CONFIG", raising=False)
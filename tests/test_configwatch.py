@@ -0,0 +1,42 @@
+import os
+
+from configwatch import ConfigWatcher
+
+
+def test_callback_runs_once_per_change(tmp_path):
+    config_file = tmp_path / "config.ini"
+    config_file.write_text("[DEFAULT]\n")
+    calls = []
+    watcher = ConfigWatcher(str(config_file), lambda: calls.append(1))
+
+    assert watcher.check()
+    assert calls == []
+
+    config_file.write_text("[DEFAULT]\nlogging = INFO\n")
+    watcher.check()
+    watcher.check()
+    assert calls == [1]
+    assert watcher.reloads == 1
+
+
+def test_missing_file_is_not_a_change(tmp_path):
+    config_file = tmp_path / "config.ini"
+    config_file.write_text("[DEFAULT]\n")
+    calls = []
+    watcher = ConfigWatcher(str(config_file), lambda: calls.append(1))
+
+    os.remove(config_file)
+    watcher.check()
+    assert calls == []
+
+
+def test_failing_callback_keeps_the_watcher_running(tmp_path):
+    config_file = tmp_path / "config.ini"
+    config_file.write_text("[DEFAULT]\n")
+
+    def callback():
+        raise KeyError("phase_used")
+
+    watcher = ConfigWatcher(str(config_file), callback)
+    config_file.write_text("[DEFAULT]\nphase_used = L1\n")
+    assert watcher.check()
@@ -0,0 +1,38 @@
+import pytest
+
+from efficiency import EfficiencyCurve, parse_efficiency_points
+
+
+def test_parse_efficiency_points_sorts_and_converts_to_fractions():
+    assert parse_efficiency_points("50:95, 10:90") == ((0.1, 0.9), (0.5, 0.95))
+    assert parse_efficiency_points("") == ()
+
+
+@pytest.mark.parametrize("value", ["50", "a:90", "-5:90", "50:0", "50:101", "50:90, 50:91"])
+def test_parse_efficiency_points_rejects_invalid_points(value):
+    with pytest.raises(ValueError):
+        parse_efficiency_points(value)
+
+
+def test_curve_without_points_is_lossless():
+    curve = EfficiencyCurve((), 4000)
+    assert curve.to_ac(1000) == 1000
+    assert curve.to_ac(-1000) == -1000
+
+
+def test_curve_interpolates_and_holds_the_ends():
+    curve = EfficiencyCurve(((0.1, 0.9), (0.5, 0.95)), 1000)
+
+    assert curve.efficiency(0) == pytest.approx(0.9)
+    assert curve.efficiency(300) == pytest.approx(0.925)
+    assert curve.efficiency(-300) == pytest.approx(0.925)
+    assert curve.efficiency(5000) == pytest.approx(0.95)
+
+
+def test_charging_needs_more_and_discharging_delivers_less_ac_power():
+    curve = EfficiencyCurve(((0.0, 0.9),), 1000)
+
+    assert curve.to_ac(900) == pytest.approx(1000)
+    assert curve.to_ac(-1000) == pytest.approx(-900)
+    # the power is split between the units, the efficiency is the one of a single unit
+    assert curve.to_ac(1800, units=2) == pytest.approx(2000)
@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+from energycounter import FLOWS, MAX_INTERVAL, MWS_PER_KWH, EnergyCounters
+
+
+def flows(in_p: list) -> SimpleNamespace:
+    """
+    Power flow of the emulated unit, the inverter converts all of the AC input and the AC output has no loads.
+    """
+    return SimpleNamespace(in_p=in_p, inverter_p=[-power if power is not None else None for power in in_p], out_p=[0 if power is not None else None for power in in_p])
+
+
+def test_interval_is_capped_after_a_gap():
+    counters = EnergyCounters({}, 100.0)
+    counters.add(flows([1000.0]), 1000.0, 101.0)
+    assert counters.flows[FLOWS.index("AcIn1ToInverter")] == 1000 * 1000
+    assert counters.dc_charging == 1000 * 1000
+
+    # e.g. the system was suspended for an hour
+    counters.add(flows([1000.0]), 1000.0, 3701.0)
+    assert counters.dc_charging == round(1000 * 1000 * (1 + MAX_INTERVAL))
+
+
+def test_time_going_back_adds_nothing():
+    counters = EnergyCounters({}, 100.0)
+    counters.add(flows([-500.0]), -500.0, 99.0)
+    assert counters.dc_discharging == 0
+    counters.add(flows([-500.0]), -500.0, 100.0)
+    assert counters.dc_discharging == 500 * 1000
+    assert counters.flows[FLOWS.index("InverterToAcIn1")] == 500 * 1000
+    assert counters.to_json()["dc"]["discharging"] == round(500 * 1000 / MWS_PER_KWH, 3)
+
+
+def test_counters_of_previous_versions_keep_counting():
+    counters = EnergyCounters({"dc": {"charging": 1.5, "discharging": 0.25}}, 0.0)
+    assert counters.flows[FLOWS.index("AcIn1ToInverter")] == counters.dc_charging == 1.5 * MWS_PER_KWH
+    assert counters.flows[FLOWS.index("InverterToAcIn1")] == counters.dc_discharging == 0.25 * MWS_PER_KWH
+
+    counters.add(flows([3600.0]), 3600.0, 1.0)
+    counters.add(flows([-3600.0]), -3600.0, 2.0)
+    assert counters.flows[FLOWS.index("AcIn1ToInverter")] == 1.5 * MWS_PER_KWH + 3600 * 1000
+    assert counters.flows[FLOWS.index("InverterToAcIn1")] == 0.25 * MWS_PER_KWH + 3600 * 1000
+    assert counters.flows[FLOWS.index("OutToInverter")] == counters.flows[FLOWS.index("InverterToAcOut")] == 0
+
+
+def test_saved_counters_are_restored_exactly():
+    counters = EnergyCounters({}, 0.0)
+    counters.add(flows([0.4, 0.3]), 0.7, 0.001)
+    restored = EnergyCounters(counters.to_json(), 0.0)
+    assert restored.flows == counters.flows
+    assert restored.dc_charging == counters.dc_charging
+
+
+def test_small_flows_are_not_lost_to_rounding():
+    counters = EnergyCounters({}, 0.0)
+    # 0.4 W for 0.1 s are 40 mWs, a float sum in kWh would round them away
+    for tick in range(1, 36001):
+        counters.add(flows([0.4]), 0.4, tick / 10)
+    assert counters.dc_charging == 36000 * 40
+    assert counters.flows[FLOWS.index("AcIn1ToInverter")] == 36000 * 40
+    # 0.4 Wh, saved without rounding
+    assert counters.to_json()["energy_mws"]["DcCharging"] * 1000 == 0.4 * MWS_PER_KWH
+
+
+def test_publish_writes_kwh_only_when_they_changed():
+    from memorybus import MemoryService
+
+    service = MemoryService()
+    for flow in FLOWS:
+        service.add_path(f"/Energy/{flow}", None)
+    counters = EnergyCounters({}, 0.0)
+    counters.publish(service)
+    writes = service.writes
+
+    # 1 W for 1 s is far below the published resolution of 1 Wh
+    counters.add(flows([1.0]), 1.0, 1.0)
+    counters.publish(service)
+    assert service.writes == writes
+
+    counters.add(flows([3600.0]), 3600.0, 2.0)
+    counters.publish(service)
+    assert service["/Energy/AcIn1ToInverter"] == 0.001
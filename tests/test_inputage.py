@@ -0,0 +1,115 @@
+from inputage import InputAge
+from memorybus import ManualClock, MemoryItemImport
+from meteraggregate import MeterAggregator
+
+
+def meter(servicename: str) -> dict:
+    return {path: MemoryItemImport(servicename, path, 0.0) for path in ("/Ac/L1/Power", "/Ac/Power")}
+
+
+def test_role_is_stale_after_max_age_without_changes():
+    clock = ManualClock(0)
+    items = meter("com.victronenergy.grid.a")
+    age = InputAge("grid", items, 10, clock)
+
+    clock.advance(10)
+    assert not age.is_stale()
+    clock.advance(1)
+    assert age.is_stale()
+
+    items["/Ac/Power"].publish(5.0)
+    assert not age.is_stale()
+
+
+def test_one_dead_meter_of_an_aggregate_makes_the_role_stale():
+    clock = ManualClock(0)
+    a = meter("com.victronenergy.grid.a")
+    b = meter("com.victronenergy.grid.b")
+    aggregator = MeterAggregator({"com.victronenergy.grid.a": a, "com.victronenergy.grid.b": b})
+    age = InputAge("grid", aggregator.items, 10, clock)
+
+    for value in range(1, 20):
+        clock.advance(1)
+        a["/Ac/L1/Power"].publish(float(value))
+    assert age.is_stale()
+
+    b["/Ac/Power"].publish(1.0)
+    assert not age.is_stale()
+    # the aggregation still works with the hooks of the age
+    assert aggregator.items["/Ac/L1/Power"].get_value() == 19.0
+
+
+def test_existing_callbacks_are_kept():
+    changes = []
+    items = meter("com.victronenergy.grid.a")
+    items["/Ac/Power"].eventCallback = lambda serviceName, path, change: changes.append(change["Value"])
+    InputAge("grid", items, 10, ManualClock())
+
+    items["/Ac/Power"].publish(3.0)
+    assert changes == [3.0]
+
+
+def test_disabled_or_without_items_is_never_stale():
+    clock = ManualClock(0)
+    disabled = InputAge("grid", meter("com.victronenergy.grid.a"), 0, clock)
+    empty = InputAge("ac load", {"/Ac/Power": None}, 10, clock)
+
+    clock.advance(1000)
+    assert not disabled.is_stale()
+    assert not empty.is_stale()
+
+
+def test_tracking_again_hooks_the_items_only_once():
+    clock = ManualClock(0)
+    changes = []
+    items = meter("com.victronenergy.grid.a")
+    items["/Ac/Power"].eventCallback = lambda serviceName, path, change: changes.append(change["Value"])
+    age = InputAge("grid", items, 10, clock)
+    callback = items["/Ac/Power"].eventCallback
+
+    for max_age in (10, 0, 20):
+        age.track(items, max_age)
+    assert items["/Ac/Power"].eventCallback is callback
+    assert age.max_age == 20
+
+    items["/Ac/Power"].publish(3.0)
+    assert changes == [3.0]
+
+
+def test_services_which_are_not_tracked_anymore_are_ignored():
+    clock = ManualClock(0)
+    a = meter("com.victronenergy.grid.a")
+    b = meter("com.victronenergy.grid.b")
+    age = InputAge("grid", a, 10, clock)
+
+    clock.advance(5)
+    age.track(b, 10)
+    assert list(age.last_change) == ["com.victronenergy.grid.b"]
+
+    clock.advance(6)
+    a["/Ac/Power"].publish(1.0)
+    b["/Ac/Power"].publish(1.0)
+    assert list(age.last_change) == ["com.victronenergy.grid.b"]
+    assert not age.is_stale()
+
+
+def test_services_are_kept_in_the_order_of_their_last_change():
+    clock = ManualClock(0)
+    meters = {name: meter(f"com.victronenergy.grid.{name}") for name in ("a", "b", "c")}
+    age = InputAge("grid", {f"{name}{path}": item for name, items in meters.items() for path, item in items.items()}, 10, clock)
+
+    for name in ("b", "a", "c"):
+        clock.advance(4)
+        meters[name]["/Ac/Power"].publish(clock())
+    assert list(age.last_change) == ["com.victronenergy.grid.b", "com.victronenergy.grid.a", "com.victronenergy.grid.c"]
+
+    # b changed 12 seconds ago, the others are fresh
+    clock.advance(4)
+    assert age.is_stale()
+    meters["b"]["/Ac/L1/Power"].publish(1.0)
+    assert list(age.last_change)[0] == "com.victronenergy.grid.a"
+    assert not age.is_stale()
+
+    # tracking again keeps the order of the services which stay
+    age.track({f"{name}{path}": item for name in ("c", "a") for path, item in meters[name].items()}, 10)
+    assert list(age.last_change) == ["com.victronenergy.grid.a", "com.victronenergy.grid.c"]
@@ -0,0 +1,68 @@
+import gzip
+import struct
+
+import inputtrace
+from inputtrace import TraceRecorder, read_trace
+from memorybus import MemoryItemImport
+
+
+def test_recorded_items_and_values_are_replayed(tmp_path):
+    filename = str(tmp_path / "trace.bin.gz")
+    recorder = TraceRecorder(filename)
+    power = MemoryItemImport("com.victronenergy.system", "/Dc/Battery/Power", 100.0)
+    recorder.add_items("system", {"/Dc/Battery/Power": power, "/Dc/Battery/Temperature": None})
+    for value in (-12, True, "text", None):
+        power.publish(value)
+    recorder.close()
+
+    start, records = read_trace(filename)
+    records = list(records)
+
+    assert records[0] == ("item", "system", "com.victronenergy.system", "/Dc/Battery/Power", True)
+    assert records[2] == ("item", "system", "", "/Dc/Battery/Temperature", False)
+    assert [record[4] for record in records if record[0] == "value"] == [100.0, -12, True, "text", None]
+    assert recorder.records == 5
+
+
+def test_time_beyond_49_days_does_not_overflow(tmp_path, monkeypatch):
+    filename = str(tmp_path / "trace.bin.gz")
+    clock = [1000.0]
+    monkeypatch.setattr(inputtrace, "monotonic", lambda: clock[0])
+    recorder = TraceRecorder(filename)
+
+    # 60 days, uint32 milliseconds overflow after 49.7 days
+    clock[0] += 60 * 86400
+    recorder.record("com.victronenergy.grid.test", "/Ac/Power", {"Value": 1.5})
+    recorder.close()
+
+    _, records = read_trace(filename)
+    assert list(records)[-1] == ("value", 60 * 86400, "com.victronenergy.grid.test", "/Ac/Power", 1.5)
+
+
+def test_traces_of_version_1_are_read(tmp_path):
+    filename = str(tmp_path / "trace.bin.gz")
+    with gzip.open(filename, "wb") as file:
+        file.write(struct.pack("<4sBd", b"DMET", 1, 1700000000.0))
+        for string_id, string in enumerate(("com.victronenergy.grid.test", "/Ac/Power")):
+            file.write(bytes((0x01,)) + struct.pack("<HH", string_id, len(string)) + string.encode())
+        file.write(bytes((0x03,)) + struct.pack("<IHHB", 2500, 0, 1, 1) + struct.pack("<d", 7.0))
+
+    start, records = read_trace(filename)
+    assert start == 1700000000.0
+    assert list(records) == [("value", 2.5, "com.victronenergy.grid.test", "/Ac/Power", 7.0)]
+
+
+def test_truncated_trace_is_read_up_to_the_last_complete_record(tmp_path):
+    filename = str(tmp_path / "trace.bin.gz")
+    recorder = TraceRecorder(filename)
+    recorder.record("com.victronenergy.grid.test", "/Ac/Power", {"Value": 1.0})
+    recorder.record("com.victronenergy.grid.test", "/Ac/Power", {"Value": 2.0})
+    recorder.close()
+
+    with gzip.open(filename, "rb") as file:
+        data = file.read()
+    with gzip.open(filename, "wb") as file:
+        file.write(data[:-3])
+
+    _, records = read_trace(filename)
+    assert [record[4] for record in records] == [1.0]
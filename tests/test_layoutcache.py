@@ -0,0 +1,56 @@
+import json
+
+from layoutcache import layout_signature, load_layout, save_layout
+from memorybus import MemoryItemImport
+
+
+def device_config(**overrides) -> dict:
+    config = {"servicename": "com.victronenergy.vebus.ttyS3", "dbus_service_name_grid": "", "dbus_service_name_ac_load": ""}
+    config.update(overrides)
+    return config
+
+
+def items(servicename: str, **values) -> dict:
+    return {path.replace("_", "/"): MemoryItemImport(servicename, path.replace("_", "/"), value) if value is not None else None for path, value in values.items()}
+
+
+def test_saved_layout_is_loaded_as_memory_items(tmp_path):
+    filename = str(tmp_path / "layout.json")
+    system = items("com.victronenergy.system", _Dc_Battery_Power=120.5, _Dc_Battery_Soc=None)
+    grid = items("com.victronenergy.grid.test", _Ac_Power=-50.0)
+    save_layout(filename, [(device_config(), system, grid, {})])
+
+    devices = load_layout(filename, [device_config()])
+
+    assert len(devices) == 1
+    _, cached_system, cached_grid, cached_ac_load = devices[0]
+    assert layout_signature(cached_system) == layout_signature(system)
+    assert layout_signature(cached_grid) == {"/Ac/Power": "com.victronenergy.grid.test"}
+    assert cached_system["/Dc/Battery/Power"].get_value() == 120.5
+    assert cached_ac_load == {}
+
+
+def test_layout_of_other_meters_is_not_used(tmp_path):
+    filename = str(tmp_path / "layout.json")
+    save_layout(filename, [(device_config(), items("com.victronenergy.system", _Soc=1.0), {}, {})])
+
+    assert load_layout(filename, [device_config(dbus_service_name_grid="com.victronenergy.grid.*")]) is None
+    assert load_layout(filename, [device_config(servicename="com.victronenergy.vebus.other")]) is None
+    assert load_layout(str(tmp_path / "missing.json"), [device_config()]) is None
+
+
+def test_malformed_layout_is_a_miss(tmp_path):
+    filename = tmp_path / "layout.json"
+    system = {"/Soc": ["com.victronenergy.system", 1.0]}
+    device = {"dbus_service_name_grid": "", "dbus_service_name_ac_load": "", "system": system, "grid": {}, "acload": {}}
+    malformed = [
+        {"version": 1},
+        {"version": 1, "devices": []},
+        {"version": 1, "devices": {"com.victronenergy.vebus.ttyS3": {"system": system}}},
+        {"version": 1, "devices": {"com.victronenergy.vebus.ttyS3": dict(device, grid=[])}},
+        {"version": 1, "devices": {"com.victronenergy.vebus.ttyS3": dict(device, system={"/Soc": ["com.victronenergy.system"]})}},
+        {"version": 1, "devices": {"com.victronenergy.vebus.ttyS3": dict(device, system={"/Soc": 1.0})}},
+    ]
+    for layout in malformed:
+        filename.write_text(json.dumps(layout))
+        assert load_layout(str(filename), [device_config()]) is None
@@ -0,0 +1,12 @@
+import logging
+
+from driverload import load_driver
+
+
+def test_configured_logging_level_is_applied_after_earlier_logging(monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "level", logging.WARNING)
+    # a stage logging before the config is read installs the default handler
+    logging.warning("logged before the config is read")
+    load_driver(logging="DEBUG")
+    assert root.level == logging.DEBUG
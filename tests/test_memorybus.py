@@ -0,0 +1,60 @@
+from memorybus import ManualClock, MemoryItemImport, MemoryService
+
+
+def test_item_publish_calls_the_callback_only_on_changes():
+    changes = []
+    item = MemoryItemImport("com.victronenergy.grid.test", "/Ac/Power", 10.0, eventCallback=lambda *args: changes.append(args))
+
+    item.publish(10.0)
+    item.publish(12.5)
+
+    assert item.get_value() == 12.5
+    assert changes == [("com.victronenergy.grid.test", "/Ac/Power", {"Value": 12.5, "Text": "12.5"})]
+
+
+def test_service_counts_signals_like_vedbusservice():
+    service = MemoryService("com.victronenergy.vebus.test")
+    service.add_path("/A", 0)
+    service.add_path("/B", 0)
+
+    service["/A"] = 0
+    service["/A"] = 1
+    with service:
+        service["/A"] = 2
+        service["/B"] = 2
+    with service:
+        service["/A"] = 2
+
+    # one PropertiesChanged, one ItemsChanged and nothing for the unchanged batch
+    assert service.signals == 2
+    assert service.writes == 5
+    assert service["/A"] == 2
+    assert service.reads == 1
+
+
+def test_service_set_value_calls_the_onchange_callback():
+    service = MemoryService()
+    service.add_path("/Mode", 3, onchangecallback=lambda path, value: value in (1, 2, 3, 4))
+
+    assert service.set_value("/Mode", 9) == 2
+    assert service.set_value("/Mode", 4) == 0
+    assert service["/Mode"] == 4
+
+
+def test_service_del_tree_removes_the_paths_below_the_root():
+    service = MemoryService()
+    for path in ("/Devices/0/P", "/Devices/0/Ac/P", "/Devices/1/P", "/Devices/10/P"):
+        service.add_path(path, 1)
+
+    service.del_tree("/Devices/1")
+
+    assert "/Devices/1/P" not in service
+    assert "/Devices/10/P" in service
+    assert "/Devices/0/Ac/P" in service
+
+
+def test_manual_clock_only_advances_when_told():
+    clock = ManualClock(100.0)
+    assert clock() == 100.0
+    clock.advance(2.5)
+    assert clock() == 102.5
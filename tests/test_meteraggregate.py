@@ -0,0 +1,77 @@
+from memorybus import MemoryItemImport
+from meteraggregate import MeterAggregator
+
+
+def meter(servicename: str, **values) -> dict:
+    """
+    `values` are {"L1_Power": 100.0}, the other paths of L1 and the total exist without value.
+    """
+    items = {}
+    for phase in ("L1", "Total"):
+        for quantity in ("Power", "Current", "Voltage", "Frequency"):
+            path = f"/Ac/{phase}/{quantity}" if phase != "Total" else f"/Ac/{quantity}"
+            items[path] = MemoryItemImport(servicename, path, values.get(f"{phase}_{quantity}"))
+    return items
+
+
+def test_power_and_current_are_summed():
+    aggregator = MeterAggregator(
+        {
+            "com.victronenergy.grid.a": meter("com.victronenergy.grid.a", L1_Power=100.0, L1_Current=0.5),
+            "com.victronenergy.grid.b": meter("com.victronenergy.grid.b", L1_Power=-40.0, L1_Current=0.25),
+        }
+    )
+    assert aggregator.items["/Ac/L1/Power"].get_value() == 60.0
+    assert aggregator.items["/Ac/L1/Current"].get_value() == 0.75
+    assert aggregator.items["/Ac/Power"].get_value() is None
+    assert aggregator.items["/Ac/L1/Power"].serviceName == "com.victronenergy.grid.a,com.victronenergy.grid.b"
+
+
+def test_voltage_is_weighted_with_the_power_of_the_meter():
+    a = meter("com.victronenergy.grid.a", L1_Power=300.0, L1_Voltage=230.0)
+    b = meter("com.victronenergy.grid.b", L1_Power=-100.0, L1_Voltage=234.0)
+    aggregator = MeterAggregator({"com.victronenergy.grid.a": a, "com.victronenergy.grid.b": b})
+    assert aggregator.items["/Ac/L1/Voltage"].get_value() == 231.0
+
+    # without any power the plain mean is used
+    a["/Ac/L1/Power"].publish(0.0)
+    b["/Ac/L1/Power"].publish(0.0)
+    assert aggregator.items["/Ac/L1/Voltage"].get_value() == 232.0
+
+
+def test_changes_of_one_meter_update_the_aggregate_and_call_its_callback():
+    a = meter("com.victronenergy.grid.a", L1_Power=100.0)
+    b = meter("com.victronenergy.grid.b", L1_Power=200.0)
+    aggregator = MeterAggregator({"com.victronenergy.grid.a": a, "com.victronenergy.grid.b": b})
+    changes = []
+    aggregator.items["/Ac/L1/Power"].eventCallback = lambda serviceName, path, change: changes.append(change["Value"])
+
+    b["/Ac/L1/Power"].publish(250.0)
+    a["/Ac/L1/Power"].publish(None)
+    b["/Ac/L1/Power"].publish(None)
+
+    assert changes == [350.0, 250.0, None]
+
+
+def test_a_path_missing_on_all_meters_is_none():
+    a = meter("com.victronenergy.grid.a", L1_Power=1.0)
+    b = meter("com.victronenergy.grid.b", L1_Power=1.0)
+    a["/Ac/L1/Frequency"] = b["/Ac/L1/Frequency"] = None
+    aggregator = MeterAggregator({"com.victronenergy.grid.a": a, "com.victronenergy.grid.b": b})
+    assert aggregator.items["/Ac/L1/Frequency"] is None
+    assert "/Ac/L2/Power" not in aggregator.items
+
+
+def test_closed_aggregator_is_not_updated_and_unhooked():
+    a = meter("com.victronenergy.grid.a", L1_Power=100.0)
+    b = meter("com.victronenergy.grid.b", L1_Power=50.0)
+    aggregator = MeterAggregator({"com.victronenergy.grid.a": a, "com.victronenergy.grid.b": b})
+    # a later hook, e.g. of the aggregator of another device
+    other = MeterAggregator({"com.victronenergy.grid.a": a})
+
+    aggregator.close()
+    a["/Ac/L1/Power"].publish(200.0)
+    b["/Ac/L1/Power"].publish(20.0)
+    assert aggregator.items["/Ac/L1/Power"].get_value() == 150.0
+    assert other.items["/Ac/L1/Power"].get_value() == 200.0
+    assert b["/Ac/L1/Power"].eventCallback is None
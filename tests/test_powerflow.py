@@ -0,0 +1,118 @@
+import pytest
+
+from efficiency import EfficiencyCurve
+from memorybus import MemoryItemImport, MemoryService
+from powerflow import PHASES, SENSOR_SLOTS, PowerFlow
+
+
+def system_items(**powers) -> dict:
+    items = {}
+    for phase in PHASES:
+        for path in (f"/Ac/ActiveIn/{phase}/Power", f"/Ac/PvOnGrid/{phase}/Power"):
+            items[path] = None
+    for phase, power in powers.items():
+        items[f"/Ac/ActiveIn/{phase}/Power"] = MemoryItemImport("com.victronenergy.system", f"/Ac/ActiveIn/{phase}/Power", power)
+    return items
+
+
+def meter_items(servicename: str, **phases) -> dict:
+    """
+    `phases` are {"L1": (power, frequency, voltage, current)}, a value of None is a missing path.
+    """
+    items = {}
+    for phase in PHASES:
+        values = phases.get(phase, (None, None, None, None))
+        for quantity, value in zip(("Power", "Frequency", "Voltage", "Current"), values):
+            path = f"/Ac/{phase}/{quantity}"
+            items[path] = MemoryItemImport(servicename, path, value) if value is not None else None
+    return items
+
+
+def service_for(powerflow: PowerFlow) -> MemoryService:
+    service = MemoryService()
+    for paths in powerflow._paths:
+        for path in paths:
+            service.add_path(path, None)
+    service.add_path("/AcSensor/Count", None)
+    for sensor in range(SENSOR_SLOTS):
+        for quantity in ("Location", "Phase", "Power", "Voltage", "Current", "Energy"):
+            if f"/AcSensor/{sensor}/{quantity}" not in service:
+                service.add_path(f"/AcSensor/{sensor}/{quantity}", None)
+    return service
+
+
+def test_ratio_splits_the_dc_power_by_the_ac_power_of_the_phases():
+    powerflow = PowerFlow(("L1", "L2"), 50, 230, EfficiencyCurve((), 4000))
+    powerflow.solve(400, system_items(L1=300.0, L2=100.0), {}, {})
+
+    assert powerflow.in_p == [300, 100]
+    assert powerflow.in_v == [230, 230]
+    assert powerflow.in_f == [50, 50]
+    assert powerflow.in_i == [round(300 / 230, 2), round(100 / 230, 2)]
+    # the inverter converts all of it, the AC output has no loads
+    assert powerflow.inverter_p == [-300, -100]
+    assert powerflow.out_p == [0, 0]
+    assert powerflow.totals == [400, 0]
+
+
+def test_ratio_takes_voltage_frequency_and_current_from_the_grid_meter():
+    powerflow = PowerFlow(("L1",), 50, 230, EfficiencyCurve((), 4000))
+    powerflow.solve(-460, system_items(L1=100.0), meter_items("com.victronenergy.grid.test", L1=(0.0, 49.9, 240.0, 1.5)), {})
+
+    assert powerflow.in_p == [-460]
+    assert powerflow.in_f == [49.9]
+    assert powerflow.in_v == [240.0]
+    assert powerflow.in_i == [1.5]
+
+
+def test_ratio_includes_the_conversion_losses():
+    powerflow = PowerFlow(("L1",), 50, 230, EfficiencyCurve(((0.0, 0.9),), 4000))
+    powerflow.solve(-1000, system_items(L1=100.0), {}, {})
+    assert powerflow.in_p == [-900]
+
+
+def test_ac_load_meter_keeps_the_last_values_of_a_phase_without_power():
+    powerflow = PowerFlow(("L1", "L2"), 50, 230, EfficiencyCurve((), 4000))
+    ac_load = meter_items("com.victronenergy.acload.test", L1=(-500.0, 50.1, None, None), L2=(-200.0, None, 231.0, 0.9))
+    powerflow.solve(0, system_items(), {}, ac_load)
+
+    assert powerflow.in_p == [-500.0, -200.0]
+    assert powerflow.in_f == [50.1, 50]
+    assert powerflow.in_v == [230, 231.0]
+    assert powerflow.in_i == [round(-500 / 230, 2), 0.9]
+
+    ac_load["/Ac/L2/Power"] = None
+    ac_load["/Ac/L1/Power"].publish(-400.0)
+    powerflow.solve(0, system_items(), {}, ac_load)
+    assert powerflow.in_p == [-400.0, -200.0]
+
+
+def test_publish_writes_all_paths_of_a_value_and_only_changes():
+    powerflow = PowerFlow(("L1",), 50, 230, EfficiencyCurve((), 4000))
+    service = service_for(powerflow)
+
+    powerflow.solve(300, system_items(L1=1.0), {}, {})
+    powerflow.publish(service)
+    assert service["/Ac/ActiveIn/L1/P"] == service["/Ac/ActiveIn/L1/S"] == service["/AcSensor/0/Power"] == 300
+    assert service["/Ac/ActiveIn/P"] == 300
+    assert service["/AcSensor/Count"] == 2
+    assert (service["/AcSensor/1/Location"], service["/AcSensor/1/Phase"]) == (2, 0)
+    assert service["/AcSensor/2/Location"] is None
+
+    writes = service.writes
+    powerflow.solve(300, system_items(L1=1.0), {}, {})
+    powerflow.publish(service)
+    assert service.writes == writes
+
+
+@pytest.mark.parametrize("phases", [("L1",), ("L1", "L2", "L3"), ("L2",)])
+def test_sensor_layout_follows_the_used_phases(phases):
+    powerflow = PowerFlow(phases, 50, 230, EfficiencyCurve((), 4000))
+    service = service_for(powerflow)
+    powerflow.solve(0, system_items(), {}, {})
+    powerflow.publish(service)
+
+    assert service["/AcSensor/Count"] == 2 * len(phases)
+    for sensor, phase in enumerate(phases):
+        assert service[f"/AcSensor/{sensor}/Phase"] == PHASES.index(phase)
+        assert service[f"/AcSensor/{sensor + len(phases)}/Location"] == 2
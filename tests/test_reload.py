@@ -0,0 +1,70 @@
+from bench_update import create_emulator
+from driverload import load_driver
+from memorybus import MemoryItemImport
+
+
+def test_values_of_dropped_phases_are_cleared_on_reload():
+    driver, emulator, clock = create_emulator(phases=3)
+    service = emulator._dbusservice
+    emulator._update()
+    assert service["/Ac/ActiveIn/L3/P"] is not None
+    assert service["/Ac/Out/L3/V"] is not None
+
+    device_config = dict(emulator._device_config, phase_used=["L1", "L2"])
+    changes = emulator.apply_device_config(device_config)
+    assert "phase_used" in changes
+    dropped = {path: value for path, value in service.items() if path.startswith(("/Ac/ActiveIn/L3/", "/Ac/Out/L3/"))}
+    assert dropped != {} and set(dropped.values()) == {None}
+
+    # the power flow and the tick frame do not write the dropped phase anymore
+    clock.advance(1)
+    emulator._update()
+    assert {path: service[path] for path in dropped} == dropped
+    assert service["/Ac/NumberOfPhases"] == 2
+    assert service["/Ac/ActiveIn/L2/P"] is not None
+
+
+class Connection:
+    def __init__(self, names: list):
+        self.names = names
+
+    def list_names(self) -> list:
+        return list(self.names)
+
+
+class Import(MemoryItemImport):
+    """
+    MemoryItemImport with the constructor of VeDbusItemImport, __del__() removes the signal match.
+    """
+
+    def __init__(self, bus, serviceName: str, path: str):
+        super().__init__(serviceName, path, 100.0, exists=path != "/Ac/L3/Power")
+        self.matched = True
+
+    def __del__(self):
+        self.matched = False
+
+
+def test_replaced_meters_are_released_from_the_input_cache():
+    driver = load_driver()
+    connection = Connection(["com.victronenergy.system", "com.victronenergy.grid.a", "com.victronenergy.grid.b"])
+    input_cache = driver.DbusInputCache(connection, Import)
+    system_items, grid_items, _ = driver.setup_dbus_external_items(input_cache, "com.victronenergy.grid.a,com.victronenergy.grid.b")
+    other_grid_items = driver.setup_dbus_external_items(input_cache, "com.victronenergy.grid.b")[1]
+    grid_a = input_cache.get_items("com.victronenergy.grid.a", ("/Ac/L1/Power",))["/Ac/L1/Power"]
+    grid_b = other_grid_items["/Ac/L1/Power"]
+
+    input_cache.release(grid_items, [system_items, other_grid_items])
+    assert grid_items["/Ac/L1/Power"].aggregator.closed
+    # grid.b is still used by the other device
+    assert not grid_a.matched and grid_b.matched
+    assert system_items["/Dc/Battery/Power"].matched
+
+    # a meter which is looked up again is imported anew, the ones which are kept and the system items are reused
+    connection.names.append("com.victronenergy.grid.c")
+    input_cache.refresh()
+    _, new_grid_items = driver.setup_meter_items(input_cache, "com.victronenergy.grid.a,com.victronenergy.grid.c", "com.victronenergy.grid", "grid")
+    assert new_grid_items["/Ac/L1/Power"].sources[0] is not grid_a
+    assert new_grid_items["/Ac/L1/Power"].sources[1].serviceName == "com.victronenergy.grid.c"
+    assert input_cache.get_items("com.victronenergy.grid.b", ("/Ac/L1/Power",))["/Ac/L1/Power"] is grid_b
+    assert input_cache.get_items("com.victronenergy.system", ("/Dc/Battery/Power",))["/Dc/Battery/Power"] is system_items["/Dc/Battery/Power"]
@@ -0,0 +1,45 @@
+import json
+import logging
+
+from ringlog import LazyCall, LazyJson, TickRingBuffer
+
+
+def test_lazy_values_are_only_evaluated_when_the_record_is_emitted(caplog):
+    calls = []
+
+    def value():
+        calls.append(1)
+        return 42
+
+    with caplog.at_level(logging.WARNING):
+        logging.debug("%s %s", LazyCall(value), LazyJson({"a": 1}))
+        assert calls == []
+
+        logging.warning("%s %s", LazyCall(value), LazyJson({"a": 1}))
+    # once per handler
+    assert calls != []
+    assert caplog.messages[-1] == '42 {"a": 1}'
+
+
+def test_ring_buffer_keeps_the_last_records(tmp_path):
+    buffer = TickRingBuffer(("power", "soc"), size=3)
+    for power in range(5):
+        buffer.append(power, 50)
+
+    assert len(buffer) == 3
+    records = buffer.records()
+    assert [record["power"] for record in records] == [2, 3, 4]
+    assert set(records[0]) == {"time", "monotonic", "power", "soc"}
+
+    filename = str(tmp_path / "ticks.jsonl")
+    assert buffer.dump(filename) == 3
+    with open(filename) as file:
+        assert [json.loads(line)["power"] for line in file] == [2, 3, 4]
+
+
+def test_disabled_buffer_keeps_nothing():
+    buffer = TickRingBuffer(("power",), size=0)
+    buffer.append(1)
+    assert not buffer.enabled
+    assert len(buffer) == 0
+    assert buffer.records() == []
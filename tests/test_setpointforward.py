@@ -0,0 +1,110 @@
+import pytest
+
+from memorybus import ManualClock
+from setpointforward import FORWARDED_PATHS, SetpointForwarder, parse_forward_routes
+
+
+class Bus:
+    """
+    Records the SetValue calls and the scheduled timers, the replies are sent with reply() and fail().
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.timers = []
+
+    def send(self, service, path, value, reply_handler, error_handler):
+        self.calls.append((service, path, value, reply_handler, error_handler))
+
+    def schedule(self, milliseconds, callback):
+        self.timers.append((milliseconds, callback))
+
+    def sent(self) -> list:
+        return [(service, path, value) for service, path, value, _, _ in self.calls]
+
+    def reply(self, index: int, result=0):
+        self.calls[index][3](result)
+
+    def fail(self, index: int, error="timeout"):
+        self.calls[index][4](error)
+
+
+def create_forwarder(interval: float = 0.5):
+    bus = Bus()
+    clock = ManualClock(0)
+    routes = parse_forward_routes("com.victronenergy.inverter.test", "")
+    return SetpointForwarder(routes, interval, bus.send, bus.schedule, clock), bus, clock
+
+
+def test_routes_of_the_service_and_of_other_services():
+    routes = parse_forward_routes("com.victronenergy.inverter.test", "/Hub4/L1/AcPowerSetpoint=/Ac/L1/PowerSetpoint, /Hub4/DisableFeedIn=com.victronenergy.settings/Settings/Ess/DisableFeedIn")
+    assert len(routes) == len(FORWARDED_PATHS)
+    assert routes[0] == ("/Hub4/L1/AcPowerSetpoint", "com.victronenergy.inverter.test", "/Ac/L1/PowerSetpoint")
+    assert routes[-1] == ("/Hub4/DisableFeedIn", "com.victronenergy.settings", "/Settings/Ess/DisableFeedIn")
+
+    with pytest.raises(ValueError):
+        parse_forward_routes("", "/Hub4/L1/AcPowerSetpoint=/Ac/L1/PowerSetpoint")
+
+
+def test_writes_in_flight_are_coalesced_to_the_latest_value():
+    forwarder, bus, clock = create_forwarder()
+    forwarder.write("/Hub4/L1/AcPowerSetpoint", 100)
+    assert bus.sent() == [("com.victronenergy.inverter.test", "/Hub4/L1/AcPowerSetpoint", 100)]
+
+    for value in (200, 300, 400):
+        forwarder.write("/Hub4/L1/AcPowerSetpoint", value)
+    assert forwarder.coalesced == 2
+    assert len(bus.calls) == 1
+
+    # the reply comes after the interval, so the latest value is sent right away
+    clock.advance(1)
+    bus.reply(0)
+    assert bus.sent()[-1] == ("com.victronenergy.inverter.test", "/Hub4/L1/AcPowerSetpoint", 400)
+    assert forwarder.latency == 1
+    assert forwarder.sent == 2
+
+
+def test_writes_within_the_interval_wait_for_the_timer():
+    forwarder, bus, clock = create_forwarder(0.5)
+    forwarder.write("/Hub4/L1/AcPowerSetpoint", 100)
+    bus.reply(0)
+
+    clock.advance(0.2)
+    forwarder.write("/Hub4/L1/AcPowerSetpoint", 200)
+    assert len(bus.calls) == 1
+    assert [milliseconds for milliseconds, _ in bus.timers] == [300]
+
+    clock.advance(0.3)
+    bus.timers[0][1]()
+    assert bus.sent()[-1][2] == 200
+
+
+def test_failed_writes_are_counted_and_the_next_value_is_sent():
+    forwarder, bus, clock = create_forwarder(0)
+    forwarder.write("/Hub4/DisableFeedIn", 1)
+    forwarder.write("/Hub4/DisableFeedIn", 0)
+    bus.fail(0)
+    assert forwarder.errors == 1
+    assert bus.sent()[-1][2] == 0
+
+    bus.reply(1, result=1)
+    assert forwarder.errors == 2
+
+
+def test_exception_of_send_is_handled_like_a_failed_call():
+    forwarder, bus, clock = create_forwarder(0)
+    failing = [True]
+
+    def send(*args):
+        if failing[0]:
+            raise RuntimeError("connection closed")
+        bus.send(*args)
+
+    forwarder._send = send
+    forwarder.write("/Hub4/L1/AcPowerSetpoint", 100)
+    assert forwarder.errors == 1
+
+    # nothing is left in flight, so the next write is sent right away
+    failing[0] = False
+    forwarder.write("/Hub4/L1/AcPowerSetpoint", 200)
+    assert bus.sent() == [("com.victronenergy.inverter.test", "/Hub4/L1/AcPowerSetpoint", 200)]
@@ -0,0 +1,87 @@
+import json
+import pathlib
+
+from bench_update import create_emulator
+from memorybus import ManualClock
+from settingsstore import SettingsStore, is_persisted
+
+
+def test_is_persisted():
+    assert is_persisted("/Mode")
+    assert is_persisted("/Devices/0/Settings/PowerAssistEnabled")
+    assert not is_persisted("/Devices/0/Settings/ReadProgress")
+    assert not is_persisted("/Hub4/L1/AcPowerSetpoint")
+
+
+def test_save_is_debounced(tmp_path):
+    filename = str(tmp_path / "settings.json")
+    clock = ManualClock(0)
+    store = SettingsStore(filename, clock, delay=5, max_delay=60)
+
+    store.set("/Mode", 1)
+    clock.advance(3)
+    store.set("/Mode", 4)
+    clock.advance(4)
+    store.save_if_due()
+    assert not (tmp_path / "settings.json").exists()
+
+    clock.advance(1)
+    store.save_if_due()
+    assert json.loads((tmp_path / "settings.json").read_text()) == {"version": 1, "values": {"/Mode": 4}}
+    assert SettingsStore(filename, clock).values == {"/Mode": 4}
+
+
+def test_changing_values_are_saved_after_max_delay(tmp_path):
+    clock = ManualClock(0)
+    store = SettingsStore(str(tmp_path / "settings.json"), clock, delay=5, max_delay=10)
+
+    for value in range(12):
+        store.set("/Ac/In/1/CurrentLimit", float(value))
+        store.save_if_due()
+        clock.advance(1)
+
+    assert (tmp_path / "settings.json").exists()
+
+
+def test_unchanged_value_does_not_trigger_a_save(tmp_path):
+    clock = ManualClock(0)
+    store = SettingsStore(str(tmp_path / "settings.json"), clock, delay=0)
+    store.values["/Mode"] = 3
+    store.set("/Mode", 3)
+    store.save_if_due()
+    assert not (tmp_path / "settings.json").exists()
+
+
+def test_unknown_and_broken_files_are_ignored(tmp_path):
+    (tmp_path / "broken.json").write_text("{")
+    (tmp_path / "old.json").write_text(json.dumps({"version": 0, "values": {"/Mode": 1}}))
+    (tmp_path / "other.json").write_text(json.dumps({"version": 1, "values": {"/Mode": 1, "/Soc": 50}}))
+    (tmp_path / "list.json").write_text(json.dumps({"version": 1, "values": [["/Mode", 1]]}))
+    (tmp_path / "missing.json").write_text(json.dumps({"version": 1}))
+
+    assert SettingsStore(str(tmp_path / "broken.json"), ManualClock()).values == {}
+    assert SettingsStore(str(tmp_path / "old.json"), ManualClock()).values == {}
+    assert SettingsStore(str(tmp_path / "other.json"), ManualClock()).values == {"/Mode": 1}
+    assert SettingsStore(str(tmp_path / "list.json"), ManualClock()).values == {}
+    assert SettingsStore(str(tmp_path / "missing.json"), ManualClock()).values == {}
+
+
+def test_flush_writes_only_pending_values(tmp_path):
+    store = SettingsStore(str(tmp_path / "settings.json"), ManualClock(0), delay=5)
+    store.flush()
+    assert not (tmp_path / "settings.json").exists()
+
+    store.set("/Mode", 4)
+    store.flush()
+    assert json.loads((tmp_path / "settings.json").read_text())["values"] == {"/Mode": 4}
+
+
+def test_save_state_writes_the_settings_and_the_energy():
+    driver, emulator, clock = create_emulator(phases=1)
+    emulator._update()
+    emulator._handlechangedvalue("/Mode", 4)
+
+    emulator.save_state()
+    device_config = emulator._device_config
+    assert json.loads(pathlib.Path(device_config["settings_file"]).read_text())["values"] == {"/Mode": 4}
+    assert json.loads(pathlib.Path(device_config["data_watt_hours_storage_file"]).read_text()) == emulator._energy.to_json()
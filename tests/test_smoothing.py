@@ -0,0 +1,62 @@
+import pytest
+
+from memorybus import MemoryItemImport
+from smoothing import InputSmoothing, RollingWindow, parse_smoothing
+
+
+def test_parse_smoothing():
+    assert parse_smoothing("") == ()
+    assert parse_smoothing("mean:10, ema:0.5") == (("mean", 10), ("ema", 0.5))
+
+
+@pytest.mark.parametrize("value", ["mean", "mean:0", "mean:3601", "mean:1.5", "ema:0", "ema:1.5", "median:3"])
+def test_parse_smoothing_rejects_invalid_stages(value):
+    with pytest.raises(ValueError):
+        parse_smoothing(value)
+
+
+def test_rolling_mean_over_the_last_values():
+    window = RollingWindow(3, "mean")
+    assert [window.add(value) for value in (3.0, 6.0, 9.0, 12.0)] == [3.0, 4.5, 6.0, 9.0]
+    assert window.mean == 9.0
+
+
+@pytest.mark.parametrize("kind, expected", [("min", [5.0, 3.0, 3.0, 3.0, 4.0, 2.0]), ("max", [5.0, 5.0, 8.0, 8.0, 8.0, 4.0])])
+def test_rolling_extremes_drop_the_values_which_left_the_window(kind, expected):
+    window = RollingWindow(3, kind)
+    assert [window.add(value) for value in (5.0, 3.0, 8.0, 4.0, 4.0, 2.0)] == expected
+
+
+def test_rolling_sum_is_resynced_once_per_round():
+    window = RollingWindow(4, "mean")
+    for _ in range(1000):
+        for value in (0.1, 0.2, 0.3, 0.4):
+            window.add(value)
+    assert window.mean == pytest.approx(0.25, abs=1e-12)
+
+
+def test_input_smoothing_only_wraps_power_and_current():
+    power = MemoryItemImport("com.victronenergy.grid.test", "/Ac/Power", 100.0)
+    voltage = MemoryItemImport("com.victronenergy.grid.test", "/Ac/Voltage", 230.0)
+    smoothing = InputSmoothing({"/Ac/Power": power, "/Ac/Voltage": voltage, "/Ac/Current": None}, (("mean", 2),))
+
+    assert smoothing.items["/Ac/Voltage"] is voltage
+    assert smoothing.items["/Ac/Current"] is None
+    assert smoothing.items["/Ac/Power"].get_value() is None
+
+    smoothing.sample()
+    power.publish(200.0)
+    smoothing.sample()
+    assert smoothing.items["/Ac/Power"].get_value() == 150.0
+
+    # a missing value starts the window again
+    power.publish(None)
+    smoothing.sample()
+    power.publish(50.0)
+    smoothing.sample()
+    assert smoothing.items["/Ac/Power"].get_value() == 50.0
+
+
+def test_input_smoothing_without_stages_is_the_dictionary_itself():
+    items = {"/Ac/Power": MemoryItemImport("com.victronenergy.grid.test", "/Ac/Power", 1.0)}
+    assert InputSmoothing(items, ()).items is items
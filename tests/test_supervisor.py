@@ -0,0 +1,64 @@
+import random
+
+import pytest
+
+import supervisor
+from supervisor import StartupError, Supervisor
+
+
+class Timeouts:
+    def __init__(self):
+        self.pending = []
+
+    def __call__(self, interval: int, callback):
+        self.pending.append((interval, callback))
+        return len(self.pending)
+
+    def run(self):
+        _, callback = self.pending.pop(0)
+        return callback()
+
+
+def test_failing_stage_is_retried_with_backoff_and_the_stages_before_are_kept():
+    calls = []
+    failures = [StartupError("not yet."), StartupError("still not.")]
+
+    def flaky():
+        calls.append("flaky")
+        if failures:
+            raise failures.pop(0)
+
+    timeouts = Timeouts()
+    states = []
+    stages = [("first", lambda: calls.append("first")), ("flaky", flaky)]
+    runner = Supervisor(stages, on_change=lambda s: states.append(s.state), backoff_min=1.0, rng=random.Random(1), timeout_add=timeouts)
+
+    assert runner.start() is False
+    assert runner.degraded and runner.retries == 1 and runner.last_error == "not yet."
+    assert 500 <= timeouts.pending[0][0] <= 1000
+
+    timeouts.run()
+    assert runner.retries == 2
+    assert 1000 <= timeouts.pending[0][0] <= 2000
+
+    timeouts.run()
+    assert runner.running and not runner.degraded
+    assert calls == ["first", "flaky", "flaky", "flaky"]
+    assert states[-1] == "running"
+
+
+def test_unexpected_exception_ends_the_process(monkeypatch):
+    exits = []
+
+    def _exit(code):
+        exits.append(code)
+        raise SystemExit(code)
+
+    monkeypatch.setattr(supervisor.os, "_exit", _exit)
+    timeouts = Timeouts()
+    runner = Supervisor([("broken", lambda: 1 / 0)], timeout_add=timeouts)
+
+    with pytest.raises(SystemExit):
+        runner.start()
+    assert exits == [1]
+    assert timeouts.pending == []
@@ -0,0 +1,17 @@
+from memorybus import MemoryService
+from tickframe import TickFrame
+
+
+def test_only_changed_values_are_written():
+    service = MemoryService()
+    for path in ("/A", "/B"):
+        service.add_path(path, None)
+    frame = TickFrame(("/A", "/B"))
+
+    frame.publish(service, [1, None])
+    # None is written on the first tick, since the initial value of the path is unknown to the frame
+    assert service.writes == 2
+
+    frame.publish(service, [1, 2])
+    assert service.writes == 3
+    assert service["/B"] == 2
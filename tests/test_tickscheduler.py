@@ -0,0 +1,86 @@
+from memorybus import ManualClock
+from tickscheduler import TickScheduler
+
+
+class Timeouts:
+    """
+    Replacement of GLib.timeout_add() and GLib.timeout_add_seconds(), fire() advances the clock by the delay and runs the callback.
+    """
+
+    def __init__(self, clock: ManualClock):
+        self.clock = clock
+        self.armed = []
+
+    def timeout_add(self, milliseconds: int, callback):
+        self.armed.append((milliseconds / 1000, callback))
+
+    def timeout_add_seconds(self, seconds: int, callback):
+        self.armed.append((seconds, callback))
+
+    def fire(self, extra: float = 0.0):
+        delay, callback = self.armed.pop(0)
+        self.clock.advance(delay + extra)
+        return callback()
+
+
+def create_scheduler(start: float = 100.25, coalesced: bool = False):
+    clock = ManualClock(start)
+    timeouts = Timeouts(clock)
+    ticks = []
+    scheduler = TickScheduler(lambda: ticks.append(clock()), timeouts.timeout_add, timeouts.timeout_add_seconds, coalesced=coalesced, clock=clock)
+    return scheduler, timeouts, ticks
+
+
+def test_ticks_are_aligned_to_the_seconds_of_the_clock():
+    scheduler, timeouts, ticks = create_scheduler(100.25)
+    scheduler.start()
+    assert timeouts.armed[0][0] == 0.75
+
+    for _ in range(3):
+        timeouts.fire()
+    assert [round(tick, 3) for tick in ticks] == [101.0, 102.0, 103.0]
+    assert scheduler.ticks == 3 and scheduler.missed == 0
+
+
+def test_a_slow_tick_does_not_delay_the_following_ones():
+    scheduler, timeouts, ticks = create_scheduler(100.0)
+    scheduler.start()
+    timeouts.fire(0.2)
+    assert round(scheduler.jitter, 3) == 0.2
+    # armed for the next second, not for one second after the late tick
+    assert round(timeouts.armed[0][0], 3) == 0.8
+
+
+def test_missed_ticks_are_counted_and_skipped():
+    scheduler, timeouts, ticks = create_scheduler(100.0)
+    scheduler.start()
+    # the main loop was blocked for 2.5 seconds
+    timeouts.fire(2.5)
+    assert len(ticks) == 1
+    assert scheduler.missed == 2
+    assert round(timeouts.armed[0][0], 3) == 0.5
+
+    timeouts.fire()
+    assert round(ticks[-1], 3) == 104.0
+    assert scheduler.missed == 2
+
+
+def test_early_timeout_is_armed_again():
+    scheduler, timeouts, ticks = create_scheduler(100.0)
+    scheduler.start()
+    timeouts.fire(-0.25)
+    assert ticks == []
+    assert scheduler.ticks == 0
+
+    timeouts.fire()
+    assert round(ticks[0], 3) == 101.0
+
+
+def test_coalesced_ticks_can_be_half_an_interval_off():
+    scheduler, timeouts, ticks = create_scheduler(100.0, coalesced=True)
+    scheduler.start()
+    assert timeouts.armed[0][0] == 1
+
+    timeouts.fire(-0.4)
+    assert len(ticks) == 1
+    assert round(scheduler.jitter, 3) == 0.4